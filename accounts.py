@@ -0,0 +1,444 @@
+# accounts.py
+"""
+Local player accounts, game history and leaderboards.
+
+Accounts sign up with an email and password (PBKDF2) and get a session cookie. A game
+started while signed in is linked to the account; when a game ends its final result goes
+into the history table whether or not anyone owns it.
+
+Leaderboards are maintained incrementally. Each finished game upserts one row per board it
+counts toward, and an index on (board, score) serves top-k reads by walking k index
+entries, never by scanning games:
+
+    all          best single-game offers, all time
+    week:YYYY-Www  best single-game offers that ISO week
+    kind:LC|SD|BH  correct answers of that kind, summed over all games
+
+Game links and results are written by one background thread per process. It commits
+whatever has queued up within ACCOUNTS_FLUSH_MS (at most ACCOUNTS_BATCH items) as one
+transaction, so many concurrent games finishing at once cost one fsync rather than one
+each. Recording a game is idempotent (keyed by game id), so every worker may report the
+same finish. Reads see a result once its batch commits, normally within ACCOUNTS_FLUSH_MS.
+"""
+import hashlib
+import hmac
+import json
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+from fastapi import APIRouter, Body, Request, Response, HTTPException
+
+from settings import get_settings
+from skill import KINDS, DIFFS
+
+ACCOUNTS_DB = get_settings().accounts_db  # empty string keeps accounts in memory
+ACCOUNTS_BATCH = get_settings().accounts_batch
+ACCOUNTS_FLUSH_MS = get_settings().accounts_flush_ms
+
+SESSION_COOKIE = "session"
+PBKDF2_ITERATIONS = 200_000
+MIN_PASSWORD = 8
+MAX_TOP = 100
+WRITE_RETRIES = 3  # attempts per batch before it is dropped
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    account_id   TEXT PRIMARY KEY,
+    email        TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    name         TEXT NOT NULL,
+    salt         BLOB NOT NULL,
+    pw_hash      BLOB NOT NULL,
+    created_at   REAL NOT NULL,
+    games        INTEGER NOT NULL DEFAULT 0,
+    total_offers INTEGER NOT NULL DEFAULT 0,
+    best         INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    token_hash BLOB PRIMARY KEY,
+    account_id TEXT NOT NULL,
+    created_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS game_owner (
+    gid        TEXT PRIMARY KEY,
+    account_id TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS game_owner_account ON game_owner (account_id);
+CREATE TABLE IF NOT EXISTS history (
+    gid         TEXT PRIMARY KEY,
+    account_id  TEXT,
+    finished_at REAL NOT NULL,
+    week        TEXT NOT NULL,
+    offers      INTEGER NOT NULL,
+    owned       INTEGER NOT NULL,
+    houses      INTEGER NOT NULL,
+    rolls       INTEGER NOT NULL,
+    seed        INTEGER NOT NULL,
+    kinds       TEXT NOT NULL
+) WITHOUT ROWID;
+DROP INDEX IF EXISTS history_by_account;
+CREATE INDEX IF NOT EXISTS history_page ON history (account_id, finished_at DESC, gid DESC);
+CREATE TABLE IF NOT EXISTS boards (
+    board      TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    score      INTEGER NOT NULL,
+    at         REAL NOT NULL,
+    PRIMARY KEY (board, account_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS boards_top ON boards (board, score DESC, at);
+"""
+
+# Best-of boards keep the higher score (and when it was reached); kind boards add up
+_UPSERT_BEST = ("INSERT INTO boards (board, account_id, score, at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (board, account_id) DO UPDATE SET score = max(score, excluded.score), "
+                "at = CASE WHEN excluded.score > score THEN excluded.at ELSE at END")
+_UPSERT_SUM = ("INSERT INTO boards (board, account_id, score, at) VALUES (?, ?, ?, ?) "
+               "ON CONFLICT (board, account_id) DO UPDATE SET score = score + excluded.score, at = excluded.at")
+
+
+def _debug(msg: str):
+    print(f"[accounts] {msg}")
+
+
+def week_of(ts: float) -> str:
+    return time.strftime("%G-W%V", time.gmtime(ts))
+
+
+def _hash_password(password: str, salt: bytes) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, PBKDF2_ITERATIONS)
+
+
+def _token_hash(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+def game_record(gid: str, g) -> Dict[str, Any]:
+    """The history row of a finished GameState."""
+    sk = g.skill or {}
+    kinds = {k: [sum(sk.get(f"{k}:{d}", [0, 0])[0] for d in DIFFS),
+                 sum(sk.get(f"{k}:{d}", [0, 0])[1] for d in DIFFS)] for k in KINDS}
+    now = time.time()
+    return {"gid": gid, "finished_at": now, "week": week_of(now), "offers": g.offers,
+            "owned": len(g.owned_positions()), "houses": sum(g.houses), "rolls": g.rolls, "seed": g.seed,
+            "kinds": kinds}
+
+
+class AccountStore:
+    def __init__(self, path: str = ACCOUNTS_DB, batch: int = ACCOUNTS_BATCH, flush_ms: int = ACCOUNTS_FLUSH_MS):
+        self.path = path or ":memory:"
+        self.batch = max(1, batch)
+        self.flush_s = max(0, flush_ms) / 1000.0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        if self.path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._q: "queue.Queue" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._reported: "OrderedDict[str, None]" = OrderedDict()  # finishes this worker has committed
+        self.batches = 0
+        self.items = 0
+
+    # ---------- Accounts and sessions ----------
+
+    def create(self, email: str, password: str, name: str = "") -> Dict[str, Any]:
+        """New account; ValueError when the email is taken or the input is unusable."""
+        email = (email or "").strip()
+        if "@" not in email or len(email) > 254:
+            raise ValueError("A valid email is required")
+        if len(password or "") < MIN_PASSWORD:
+            raise ValueError(f"Password must be at least {MIN_PASSWORD} characters")
+        name = (name or email.split("@", 1)[0]).strip()[:24] or "Player"
+        salt = secrets.token_bytes(16)
+        pw_hash = _hash_password(password, salt)
+        aid = uuid.uuid4().hex[:16]
+        try:
+            with self.lock:
+                self.conn.execute("INSERT INTO accounts (account_id, email, name, salt, pw_hash, created_at) "
+                                  "VALUES (?, ?, ?, ?, ?, ?)", (aid, email, name, salt, pw_hash, time.time()))
+        except sqlite3.IntegrityError:
+            raise ValueError("An account with this email already exists")
+        _debug(f"account {aid} created")
+        return {"account_id": aid, "email": email, "name": name}
+
+    def verify(self, email: str, password: str) -> Optional[str]:
+        """Account id for a correct email/password pair."""
+        with self.lock:
+            row = self.conn.execute("SELECT account_id, salt, pw_hash FROM accounts WHERE email = ?",
+                                    ((email or "").strip(),)).fetchone()
+        if row is None:
+            _hash_password(password or "", b"\0" * 16)  # same cost either way
+            return None
+        return row[0] if hmac.compare_digest(_hash_password(password or "", row[1]), row[2]) else None
+
+    def new_session(self, account_id: str) -> str:
+        token = secrets.token_urlsafe(24)
+        with self.lock:
+            self.conn.execute("INSERT INTO sessions (token_hash, account_id, created_at) VALUES (?, ?, ?)",
+                              (_token_hash(token), account_id, time.time()))
+        return token
+
+    def session(self, token: Optional[str]) -> Optional[str]:
+        """Account id of a session token."""
+        if not token:
+            return None
+        with self.lock:
+            row = self.conn.execute("SELECT account_id FROM sessions WHERE token_hash = ?",
+                                    (_token_hash(token),)).fetchone()
+        return row[0] if row else None
+
+    def end_session(self, token: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM sessions WHERE token_hash = ?", (_token_hash(token),))
+
+    # ---------- Batched writes ----------
+
+    def _put(self, item):
+        if self._writer is None:
+            with self.lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="accounts-writer", daemon=True)
+                    self._writer.start()
+        self._q.put(item)
+
+    def link(self, gid: str, account_id: str):
+        """The account owns game gid, unless another account already does."""
+        self._put(("link", gid, account_id))
+
+    def finish(self, gid: str, g):
+        """Report a finished game; repeats are dropped here once committed and ignored by the database."""
+        with self.lock:
+            if gid in self._reported:
+                return
+        self._put(("finish", game_record(gid, g)))
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until everything queued so far is committed."""
+        done = threading.Event()
+        self._put(("flush", done))
+        return done.wait(timeout)
+
+    def _write_loop(self):
+        while True:
+            batch = [self._q.get()]
+            deadline = time.monotonic() + self.flush_s
+            while len(batch) < self.batch and batch[-1][0] != "flush":
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                for attempt in range(WRITE_RETRIES):
+                    try:
+                        self._commit(batch)
+                        break
+                    except Exception as e:
+                        if attempt == WRITE_RETRIES - 1:
+                            # Nothing was marked reported, so the next report of these games resends them
+                            _debug(f"dropped a batch of {len(batch)}: {type(e).__name__}: {e}")
+                        else:
+                            time.sleep(0.05 * 2 ** attempt)
+            finally:
+                for item in batch:
+                    if item[0] == "flush":
+                        item[1].set()
+
+    def _commit(self, batch: List[tuple]):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for item in batch:
+                    if item[0] == "link":
+                        self.conn.execute("INSERT OR IGNORE INTO game_owner (gid, account_id) "
+                                          "SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM history WHERE gid = ?)",
+                                          (item[1], item[2], item[1]))
+                    elif item[0] == "finish":
+                        self._record(item[1])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.batches += 1
+            self.items += len(batch)
+            for item in batch:
+                if item[0] == "finish":
+                    self._reported[item[1]["gid"]] = None
+            while len(self._reported) > 4096:
+                self._reported.popitem(last=False)
+
+    def _record(self, r: Dict[str, Any]):
+        row = self.conn.execute("SELECT account_id FROM game_owner WHERE gid = ?", (r["gid"],)).fetchone()
+        aid = row[0] if row else None
+        cur = self.conn.execute(
+            "INSERT OR IGNORE INTO history (gid, account_id, finished_at, week, offers, owned, houses, rolls, seed, kinds) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (r["gid"], aid, r["finished_at"], r["week"], r["offers"], r["owned"], r["houses"], r["rolls"],
+             r["seed"], json.dumps(r["kinds"], separators=(",", ":"))))
+        if not cur.rowcount or aid is None:
+            return  # already recorded, or a guest game
+        at = r["finished_at"]
+        self.conn.execute("UPDATE accounts SET games = games + 1, total_offers = total_offers + ?, "
+                          "best = max(best, ?) WHERE account_id = ?", (r["offers"], r["offers"], aid))
+        self.conn.executemany(_UPSERT_BEST, [("all", aid, r["offers"], at), (f"week:{r['week']}", aid, r["offers"], at)])
+        self.conn.executemany(_UPSERT_SUM, [(f"kind:{k}", aid, passes, at)
+                                            for k, (passes, _) in r["kinds"].items() if passes])
+
+    # ---------- Reads ----------
+
+    def top(self, board: str, k: int = 10) -> List[Dict[str, Any]]:
+        """The board's k best, from the (board, score) index."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT b.account_id, a.name, b.score, b.at FROM boards b JOIN accounts a USING (account_id) "
+                "WHERE b.board = ? ORDER BY b.score DESC, b.at LIMIT ?", (board, max(1, min(MAX_TOP, k)))).fetchall()
+        return [{"rank": i + 1, "account_id": aid, "name": name, "score": score, "at": at}
+                for i, (aid, name, score, at) in enumerate(rows)]
+
+    def profile(self, account_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute("SELECT email, name, created_at, games, total_offers, best FROM accounts "
+                                    "WHERE account_id = ?", (account_id,)).fetchone()
+            if row is None:
+                return None
+            kinds = dict(self.conn.execute(
+                "SELECT substr(board, 6), score FROM boards WHERE board IN ('kind:LC', 'kind:SD', 'kind:BH') "
+                "AND account_id = ?", (account_id,)).fetchall())
+            ahead = self.conn.execute("SELECT count(*) FROM boards WHERE board = 'all' AND score > ?",
+                                      (row[5],)).fetchone()[0]
+        email, name, created_at, games, total, best = row
+        return {"account_id": account_id, "email": email, "name": name, "created_at": created_at,
+                "games": games, "total_offers": total, "best": best,
+                "rank": ahead + 1 if games else None, "correct": {k: kinds.get(k, 0) for k in KINDS}}
+
+    def owner(self, gid: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT account_id FROM game_owner WHERE gid = ?", (gid,)).fetchone()
+        return row[0] if row else None
+
+    def owned(self, account_id: str) -> List[str]:
+        """Ids of the account's games, finished or not."""
+        with self.lock:
+            rows = self.conn.execute("SELECT gid FROM game_owner WHERE account_id = ?", (account_id,)).fetchall()
+        return [gid for (gid,) in rows]
+
+    def games(self, account_id: str, limit: int = 20, before: Optional[float] = None,
+              before_gid: str = "") -> List[Dict[str, Any]]:
+        """
+        Finished games, newest first. For the next page pass the last game's finished_at and
+        game_id as before and before_gid; games finishing at the same instant are ordered by id.
+        """
+        if before is None:
+            before = float("inf")
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT gid, finished_at, week, offers, owned, houses, rolls, seed, kinds FROM history "
+                "WHERE account_id = ? AND (finished_at < ? OR (finished_at = ? AND gid < ?)) "
+                "ORDER BY finished_at DESC, gid DESC LIMIT ?",
+                (account_id, before, before, before_gid, max(1, min(MAX_TOP, limit)))).fetchall()
+        return [{"game_id": gid, "finished_at": at, "week": week, "offers": offers, "owned": owned,
+                 "houses": houses, "rolls": rolls, "seed": seed, "kinds": json.loads(kinds)}
+                for gid, at, week, offers, owned, houses, rolls, seed, kinds in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": self._q.qsize(), "batches": self.batches, "items": self.items,
+                "batch": self.batch, "flush_ms": round(self.flush_s * 1000)}
+
+
+ACCOUNTS = AccountStore()
+
+
+# ---------- Request helpers ----------
+
+def account_of(request: Request) -> Optional[str]:
+    return ACCOUNTS.session(request.cookies.get(SESSION_COOKIE))
+
+
+def _require(request: Request) -> str:
+    aid = account_of(request)
+    if aid is None:
+        raise HTTPException(status_code=401, detail="Not signed in")
+    return aid
+
+
+def _sign_in(request: Request, response: Response, aid: str):
+    response.set_cookie(SESSION_COOKIE, ACCOUNTS.new_session(aid), httponly=True, samesite="lax",
+                        max_age=30 * 24 * 3600)
+    from server import GID_COOKIE, BACKEND
+    gid = request.cookies.get(GID_COOKIE)
+    if gid and BACKEND.exists(gid):
+        ACCOUNTS.link(gid, aid)  # the game in progress counts for this account, if nobody owns it yet
+
+
+# ---------- Routes ----------
+
+router = APIRouter()
+
+
+@router.post("/accounts")
+def post_account(request: Request, response: Response, email: str = Body(..., embed=True),
+                 password: str = Body(..., embed=True), name: str = Body("", embed=True)):
+    try:
+        acct = ACCOUNTS.create(email, password, name)
+    except ValueError as e:
+        status = 409 if "exists" in str(e) else 400
+        raise HTTPException(status_code=status, detail=str(e))
+    _sign_in(request, response, acct["account_id"])
+    return {"ok": True, **acct}
+
+
+@router.post("/accounts/login")
+def post_login(request: Request, response: Response, email: str = Body(..., embed=True),
+               password: str = Body(..., embed=True)):
+    aid = ACCOUNTS.verify(email, password)
+    if aid is None:
+        raise HTTPException(status_code=401, detail="Wrong email or password")
+    _sign_in(request, response, aid)
+    return {"ok": True, "account_id": aid}
+
+
+@router.post("/accounts/logout")
+def post_logout(request: Request, response: Response):
+    token = request.cookies.get(SESSION_COOKIE)
+    if token:
+        ACCOUNTS.end_session(token)
+    response.delete_cookie(SESSION_COOKIE)
+    return {"ok": True}
+
+
+@router.get("/accounts/me")
+def get_me(request: Request):
+    aid = _require(request)
+    prof = ACCOUNTS.profile(aid)
+    if prof is None:
+        raise HTTPException(status_code=401, detail="Not signed in")
+    return {**prof, "recent": ACCOUNTS.games(aid, limit=5)}
+
+
+@router.get("/accounts/me/games")
+def get_my_games(request: Request, limit: int = 20, before: Optional[float] = None, before_gid: str = ""):
+    games = ACCOUNTS.games(_require(request), limit, before, before_gid)
+    more = len(games) == limit
+    return {"games": games, "next": games[-1]["finished_at"] if more else None,
+            "next_gid": games[-1]["game_id"] if more else None}
+
+
+@router.get("/leaderboard")
+def get_leaderboard(board: str = "all", week: Optional[str] = None, k: int = 10):
+    """board: all | week (this ISO week, or ?week=YYYY-Www) | LC | SD | BH."""
+    key = board.upper()
+    if board == "all":
+        key = "all"
+    elif board == "week":
+        key = f"week:{week or week_of(time.time())}"
+    elif key in KINDS:
+        key = f"kind:{key}"
+    else:
+        raise HTTPException(status_code=400, detail="board must be all, week, LC, SD or BH")
+    return {"board": key, "top": ACCOUNTS.top(key, k)}
@@ -0,0 +1,119 @@
+# admission.py
+"""
+Admission control for model-bound work.
+
+At most MODEL_CONCURRENCY model-bound sections run at once, and at most MODEL_PER_CLIENT of
+them per game or room player. Others wait in a bounded priority queue (MODEL_QUEUE):
+grading first, then /resolve, then speculative /prefetch, FIFO within a priority. A
+caller that cannot get in within its priority's wait budget is refused. The route then
+answers with a fast 503 and Retry-After, or carries on with local content instead of the
+model. Waiting happens on the caller's thread, so server.py sizes the request threadpool
+to leave room for cheap routes (/state, static files) on top of the concurrency plus queue.
+"""
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Tuple
+
+from settings import get_settings
+
+MODEL_CONCURRENCY = get_settings().model_concurrency
+MODEL_QUEUE = get_settings().model_queue
+MODEL_PER_CLIENT = get_settings().model_per_client
+
+PRIORITY = {"grade": 0, "resolve": 1, "prefetch": 2}
+WAIT_S = {"grade": 10.0, "resolve": 3.0, "prefetch": 0.0}  # prefetch only runs on an idle slot
+
+
+def _debug(msg: str):
+    print(f"[admission] {msg}")
+
+
+class Gate:
+    def __init__(self, limit: int = MODEL_CONCURRENCY, queue: int = MODEL_QUEUE, per_client: int = MODEL_PER_CLIENT):
+        self.limit = limit
+        self.queue = queue
+        self.per_client = per_client
+        self.cv = threading.Condition()
+        self.active = 0
+        self.clients: Counter = Counter()  # admitted + waiting per client
+        self._waiting: List[Tuple[int, int]] = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self.hold_s = 1.0  # smoothed time a slot is held, for Retry-After
+        self.refused: Counter = Counter()
+
+    def acquire(self, client: str, kind: str) -> bool:
+        """Take a slot for client, waiting up to WAIT_S[kind]; False when refused."""
+        with self.cv:
+            if self.clients[client] >= self.per_client:
+                self.refused[f"{kind}:client"] += 1
+                return False
+            if self.active < self.limit and not self._waiting:
+                self.active += 1
+                self.clients[client] += 1
+                return True
+            wait = WAIT_S.get(kind, 0.0)
+            if wait <= 0 or len(self._waiting) >= self.queue:
+                self.refused[f"{kind}:busy"] += 1
+                return False
+            entry = (PRIORITY.get(kind, len(PRIORITY)), next(self._seq))
+            heapq.heappush(self._waiting, entry)
+            self.clients[client] += 1
+            deadline = time.monotonic() + wait
+            while not (self.active < self.limit and self._waiting[0] == entry):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._drop(client)
+                    self.cv.notify_all()  # the head may have changed
+                    self.refused[f"{kind}:timeout"] += 1
+                    return False
+                self.cv.wait(remaining)
+            heapq.heappop(self._waiting)
+            self.active += 1
+            self.cv.notify_all()  # let the next waiter check whether another slot is free
+            return True
+
+    def _drop(self, client: str):
+        self.clients[client] -= 1
+        if self.clients[client] <= 0:
+            del self.clients[client]
+
+    def release(self, client: str, held_s: float):
+        with self.cv:
+            self.active -= 1
+            self._drop(client)
+            self.hold_s += 0.1 * (held_s - self.hold_s)
+            self.cv.notify_all()
+
+    def retry_after(self) -> int:
+        """Seconds until a refused caller has a fair chance, from queue depth and slot hold time."""
+        with self.cv:
+            depth = len(self._waiting) + 1
+        return max(1, min(30, math.ceil(self.hold_s * depth / max(1, self.limit))))
+
+    def stats(self) -> Dict[str, Any]:
+        with self.cv:
+            return {"active": self.active, "limit": self.limit, "waiting": len(self._waiting),
+                    "queue": self.queue, "per_client": self.per_client, "hold_s": round(self.hold_s, 3),
+                    "refused": dict(self.refused)}
+
+
+GATE = Gate()
+
+
+@contextmanager
+def admit(client: str, kind: str) -> Iterator[bool]:
+    """with admit(gid, "resolve") as ok: ... -- ok is False when refused; the slot is released on exit."""
+    ok = GATE.acquire(client, kind)
+    t0 = time.monotonic()
+    try:
+        yield ok
+    finally:
+        if ok:
+            GATE.release(client, time.monotonic() - t0)
@@ -0,0 +1,360 @@
+# analytics.py
+"""
+Columnar analytics of turns, questions and verdicts.
+
+Every committed game update hands its journal events to SINK.emit(), which turns the ones
+worth analyzing into flat rows and appends them to an in-memory buffer: a lock and a list
+append, nothing else on the request path. A writer thread flushes the buffer every
+ANALYTICS_FLUSH_S seconds or ANALYTICS_BATCH rows into one compressed columnar file under a
+rolling hourly partition:
+
+    analytics/date=2026-10-19/hour=14/part-<pid>-<ms>.parquet
+
+Parquet with zstd via pyarrow (in requirements.txt). Only when pyarrow cannot be imported
+do the same columns go to gzip'd JSON (`.cols.json.gz`) instead, with a warning: it is a
+fallback, several times larger and slower to scan, not a supported format. Files are written to a temporary name and
+renamed, so readers never see half a file, and every worker writes its own. Partitions older
+than ANALYTICS_KEEP_DAYS are deleted. When the writer falls behind, the oldest buffered rows
+are dropped (and counted) rather than slowing a request down.
+
+    python -m analytics pass-rates --by tile            # pass rate per tile, kind, difficulty...
+    python -m analytics latency --by judge_source,qkind # grading latency p50/p95/p99
+    python -m analytics rewards --by date               # reward per verdict over time
+    python -m analytics events --since 2026-10-01 --json
+"""
+import argparse
+import atexit
+import gzip
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from board import BOARD
+from settings import get_settings
+import skill
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # in requirements.txt; without it files fall back to gzip'd JSON, see _write
+    pyarrow = None
+
+ANALYTICS_DIR = get_settings().analytics_dir
+ANALYTICS_BATCH = get_settings().analytics_batch
+ANALYTICS_FLUSH_S = get_settings().analytics_flush_s
+ANALYTICS_BUFFER = get_settings().analytics_buffer
+ANALYTICS_KEEP_DAYS = get_settings().analytics_keep_days
+
+# Journal events that become rows; "submitted" (the answer text) and bookkeeping events stay out
+EVENTS = frozenset(("roll", "skip", "landing", "question", "card", "jail", "verdict", "reward"))
+
+# (name, pyarrow type name), in row order
+COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ("ts", "float64"), ("game_id", "string"), ("event", "string"),
+    ("pos", "int16"), ("tile", "string"), ("qtype", "string"), ("qkind", "string"), ("difficulty", "string"),
+    ("passed", "bool_"), ("judge_source", "string"), ("grade_ms", "float64"),
+    ("reward", "int32"), ("house_built", "bool_"), ("prefetched", "bool_"),
+    ("d1", "int8"), ("d2", "int8"), ("offers", "int32"), ("turns", "int16"),
+)
+NAMES = tuple(c for c, _ in COLUMNS)
+JSON_EXT = ".cols.json.gz"
+
+
+def _debug(msg: str):
+    print(f"[analytics] {msg}")
+
+
+# ---------- Rows ----------
+
+def _row(ts: float, gid: str, e: Dict[str, Any], g) -> tuple:
+    kind, d = e["kind"], e.get("data") or {}
+    pos = d.get("pos", g.pos)
+    qtype = d.get("type") or (d.get("kind") if kind == "verdict" else None)
+    return (
+        ts, gid, kind,
+        pos, d.get("tile") or BOARD[pos].name, qtype, skill.kind_of(qtype) if qtype else None, d.get("difficulty"),
+        d.get("passed"), d.get("judge_source"), d.get("grade_ms"),
+        d.get("reward"), d.get("house_built"), d.get("prefetched"),
+        d.get("d1"), d.get("d2"), g.offers, g.turns,
+    )
+
+
+def partition(ts: float) -> str:
+    t = datetime.fromtimestamp(ts, timezone.utc)
+    return os.path.join(f"date={t:%Y-%m-%d}", f"hour={t:%H}")
+
+
+# ---------- Sink ----------
+
+class Sink:
+    def __init__(self, root: str = ANALYTICS_DIR, batch: int = ANALYTICS_BATCH, flush_s: float = ANALYTICS_FLUSH_S,
+                 buffer: int = ANALYTICS_BUFFER, keep_days: int = ANALYTICS_KEEP_DAYS):
+        self.root = root  # empty disables analytics
+        self.batch = max(1, batch)
+        self.flush_s = max(0.1, flush_s)
+        self.buffer = max(self.batch, buffer)
+        self.keep_days = keep_days
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self._rows: List[tuple] = []
+        self._writer: Optional[threading.Thread] = None
+        self._seq = 0
+        self._warned = False
+        self.rows = self.files = self.bytes = self.dropped = 0
+        self.last_flush_ms = 0.0
+
+    def emit(self, gid: str, events: Iterable[Dict[str, Any]], g):
+        """Buffer the analyzable events of one committed update; never blocks on I/O."""
+        if not self.root:
+            return
+        ts = time.time()
+        rows = [_row(ts, gid, e, g) for e in events if e["kind"] in EVENTS]
+        if not rows:
+            return
+        with self.lock:
+            self._rows.extend(rows)
+            over = len(self._rows) - self.buffer
+            if over > 0:
+                del self._rows[:over]
+                self.dropped += over
+            full = len(self._rows) >= self.batch
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="analytics-writer", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+        if full:
+            self.wake.set()
+
+    def _write_loop(self):
+        while True:
+            self.wake.wait(self.flush_s)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                _debug(f"flush failed: {type(e).__name__}: {e}")
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns the number of rows written."""
+        with self.lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+        t0 = time.perf_counter()
+        # One file per partition the rows fall in (a flush rarely spans an hour boundary)
+        hours: Dict[int, List[tuple]] = {}
+        for r in rows:
+            hours.setdefault(int(r[0] // 3600), []).append(r)
+        for hour, prow in hours.items():
+            self._write(partition(hour * 3600), prow)
+        self._expire()
+        with self.lock:
+            self.rows += len(rows)
+            self.last_flush_ms = (time.perf_counter() - t0) * 1000.0
+        return len(rows)
+
+    def _write(self, part: str, rows: List[tuple]):
+        cols = {name: [r[i] for r in rows] for i, name in enumerate(NAMES)}
+        d = os.path.join(self.root, part)
+        os.makedirs(d, exist_ok=True)
+        with self.lock:
+            self._seq += 1
+            seq = self._seq
+        base = os.path.join(d, f"part-{os.getpid()}-{int(time.time() * 1000)}-{seq}")
+        if pyarrow is not None:
+            path = base + ".parquet"
+            schema = pyarrow.schema([(name, getattr(pyarrow, typ)()) for name, typ in COLUMNS])
+            table = pyarrow.Table.from_pydict(cols, schema=schema)
+            pyarrow.parquet.write_table(table, path + ".tmp", compression="zstd")
+        else:
+            if not self._warned:
+                self._warned = True
+                _debug("WARNING: pyarrow is not installed, writing gzip'd JSON instead of Parquet "
+                       "(pip install -r requirements.txt)")
+            path = base + JSON_EXT
+            with gzip.open(path + ".tmp", "wt", encoding="utf-8", compresslevel=6) as f:
+                json.dump({"rows": len(rows), "columns": cols}, f, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+        with self.lock:
+            self.files += 1
+            self.bytes += os.path.getsize(path)
+
+    def _expire(self):
+        if self.keep_days <= 0 or not os.path.isdir(self.root):
+            return
+        cutoff = f"date={datetime.now(timezone.utc) - timedelta(days=self.keep_days):%Y-%m-%d}"
+        for name in os.listdir(self.root):
+            if name.startswith("date=") and name < cutoff:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                _debug(f"expired {name}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"dir": self.root, "format": "parquet" if pyarrow is not None else "json.gz",
+                    "buffered": len(self._rows), "rows": self.rows, "files": self.files, "bytes": self.bytes,
+                    "dropped": self.dropped, "last_flush_ms": round(self.last_flush_ms, 3)}
+
+
+SINK = Sink()
+
+
+# ---------- Reading ----------
+
+def files(root: str, since: Optional[str] = None, until: Optional[str] = None) -> List[str]:
+    """Data files under root, pruned by date partition (since/until are YYYY-MM-DD, inclusive)."""
+    out = []
+    if not os.path.isdir(root):
+        return out
+    for dname in sorted(os.listdir(root)):
+        if not dname.startswith("date="):
+            continue
+        day = dname[5:]
+        if (since and day < since) or (until and day > until):
+            continue
+        for dirpath, _, names in os.walk(os.path.join(root, dname)):
+            out += [os.path.join(dirpath, n) for n in sorted(names) if n.endswith((".parquet", JSON_EXT))]
+    return out
+
+
+def load(paths: List[str], columns: List[str]) -> Dict[str, List[Any]]:
+    """The given columns of all files, concatenated."""
+    out: Dict[str, List[Any]] = {c: [] for c in columns}
+    warned = False
+    for p in paths:
+        if p.endswith(".parquet"):
+            if pyarrow is None:
+                raise SystemExit(f"{p} needs pyarrow: pip install pyarrow")
+            cols = pyarrow.parquet.read_table(p, columns=columns).to_pydict()
+        else:
+            if not warned:
+                warned = True
+                print(f"warning: reading gzip'd JSON fallback files ({p}); install pyarrow for Parquet",
+                      file=sys.stderr)
+            with gzip.open(p, "rt", encoding="utf-8") as f:
+                cols = json.load(f)["columns"]
+        for c in columns:
+            out[c] += cols[c]
+    return out
+
+
+# ---------- Aggregates ----------
+
+def _pct(sorted_vals: List[float], p: float) -> Optional[float]:
+    if not sorted_vals:
+        return None
+    return sorted_vals[min(len(sorted_vals) - 1, int(p / 100.0 * len(sorted_vals)))]
+
+
+def _virtual(cols: Dict[str, List[Any]], name: str) -> List[Any]:
+    """A stored column, or date/hour derived from ts."""
+    if name == "date":
+        return [datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%d") for t in cols["ts"]]
+    if name == "hour":
+        return [datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%d %H:00") for t in cols["ts"]]
+    return cols[name]
+
+
+def _groups(cols: Dict[str, List[Any]], by: List[str], keep: List[int]) -> Dict[tuple, List[int]]:
+    keys = [_virtual(cols, b) for b in by]
+    out: Dict[tuple, List[int]] = {}
+    for i in keep:
+        out.setdefault(tuple(k[i] for k in keys), []).append(i)
+    return out
+
+
+def _rows_where(cols: Dict[str, List[Any]], event: Optional[str]) -> List[int]:
+    return [i for i, e in enumerate(cols["event"]) if event is None or e == event]
+
+
+def pass_rates(cols: Dict[str, List[Any]], by: List[str]) -> List[Dict[str, Any]]:
+    out = []
+    for key, idx in _groups(cols, by, _rows_where(cols, "verdict")).items():
+        passed = sum(1 for i in idx if cols["passed"][i])
+        out.append({**dict(zip(by, key)), "answers": len(idx), "passed": passed, "pass_rate": round(passed / len(idx), 4)})
+    return out
+
+
+def latency(cols: Dict[str, List[Any]], by: List[str]) -> List[Dict[str, Any]]:
+    out = []
+    for key, idx in _groups(cols, by, _rows_where(cols, "verdict")).items():
+        ms = sorted(cols["grade_ms"][i] for i in idx if cols["grade_ms"][i] is not None)
+        out.append({**dict(zip(by, key)), "answers": len(idx), "timed": len(ms),
+                    "p50_ms": _pct(ms, 50), "p95_ms": _pct(ms, 95), "p99_ms": _pct(ms, 99),
+                    "mean_ms": round(sum(ms) / len(ms), 3) if ms else None})
+    return out
+
+
+def rewards(cols: Dict[str, List[Any]], by: List[str]) -> List[Dict[str, Any]]:
+    """Offers handed out per answer and per game: inflation shows as these rising over time."""
+    out = []
+    verdicts = _groups(cols, by, _rows_where(cols, "verdict"))
+    for key, idx in _groups(cols, by, _rows_where(cols, "reward")).items():
+        total = sum(cols["reward"][i] or 0 for i in idx)
+        answers = len(verdicts.get(key, ()))
+        games = len({cols["game_id"][i] for i in idx})
+        out.append({**dict(zip(by, key)), "answers": answers, "rewards": len(idx), "offers": total,
+                    "houses_built": sum(1 for i in idx if cols["house_built"][i]),
+                    "offers_per_answer": round(total / answers, 4) if answers else None,
+                    "offers_per_game": round(total / games, 3) if games else None})
+    return out
+
+
+def events(cols: Dict[str, List[Any]], by: List[str]) -> List[Dict[str, Any]]:
+    return [{**dict(zip(by, key)), "rows": len(idx), "games": len({cols["game_id"][i] for i in idx})}
+            for key, idx in _groups(cols, by, _rows_where(cols, None)).items()]
+
+
+QUERIES = {
+    "pass-rates": (pass_rates, "qkind,difficulty"),
+    "latency": (latency, "judge_source"),
+    "rewards": (rewards, "date"),
+    "events": (events, "date,event"),
+}
+_NEEDS = {"pass-rates": ["passed"], "latency": ["grade_ms"], "rewards": ["reward", "house_built", "game_id"],
+          "events": ["game_id"]}
+
+
+def _table(rows: List[Dict[str, Any]]) -> str:
+    if not rows:
+        return "(no rows)"
+    heads = list(rows[0])
+    cells = [["" if r[h] is None else str(r[h]) for h in heads] for r in rows]
+    widths = [max(len(h), *(len(c[i]) for c in cells)) for i, h in enumerate(heads)]
+    lines = ["  ".join(h.ljust(w) for h, w in zip(heads, widths))]
+    lines += ["  ".join(c.ljust(w) for c, w in zip(row, widths)) for row in cells]
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("query", choices=sorted(QUERIES))
+    ap.add_argument("--by", help="comma-separated group columns (any column, or date/hour)")
+    ap.add_argument("--dir", default=ANALYTICS_DIR or "analytics", help="analytics root (default: ANALYTICS_DIR)")
+    ap.add_argument("--since", help="first day, YYYY-MM-DD")
+    ap.add_argument("--until", help="last day, YYYY-MM-DD")
+    ap.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    args = ap.parse_args(argv)
+
+    fn, default_by = QUERIES[args.query]
+    by = [b.strip() for b in (args.by or default_by).split(",") if b.strip()]
+    unknown = [b for b in by if b not in NAMES and b not in ("date", "hour")]
+    if unknown:
+        ap.error(f"unknown column(s) {', '.join(unknown)}; columns: {', '.join(NAMES)}, date, hour")
+    paths = files(args.dir, args.since, args.until)
+    needed = sorted({"ts", "event", *_NEEDS[args.query], *(b for b in by if b in NAMES)})
+    t0 = time.perf_counter()
+    cols = load(paths, needed)
+    rows = sorted(fn(cols, by), key=lambda r: tuple("" if r[b] is None else str(r[b]) for b in by))
+    elapsed = time.perf_counter() - t0
+    print(json.dumps(rows, indent=1) if args.json else _table(rows))
+    print(f"{len(cols['ts'])} rows from {len(paths)} files in {elapsed * 1000.0:.1f} ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
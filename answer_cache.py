@@ -0,0 +1,218 @@
+# answer_cache.py
+"""
+Model verdicts reused for paraphrased answers.
+
+Players answering the same question tend to write the same few answers in different words
+("hashmap of prefix sums", "prefix sum counts in a dict"). Every answer the model grades is
+embedded and kept with its verdict under its question; a later answer to that question whose
+embedding is close enough (cosine >= THRESHOLD) gets the stored verdict without a model call.
+
+The embedding is feature hashing into DIM signed buckets, L2-normalized and kept sparse, of
+the judge's concepts for the kind (so "hash map", "dict" and "counter" are one feature) and
+its TF-IDF weighted stems, with bigrams at half weight. An answer only matches stored answers
+of the same negation polarity, so "use a hash map" never reuses "don't use a hash map".
+Nothing is learned and nothing leaves the process: each worker fills its own index.
+
+Reuse can be wrong, so AUDIT of the hits are graded by the model anyway: a disagreement
+counts as a false reuse and evicts the entry. stats() reports the hit rate, the false-reuse
+rate among audited hits, and lookup latency.
+"""
+import hashlib
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional
+
+from dedup import question_text
+from judge import IDF, LC_LEX, SD_LEX, BH_LEX, STOPWORDS, _stem, tokens
+from settings import get_settings
+
+DIM = 1 << 12
+ENABLED = get_settings().answer_cache
+THRESHOLD = get_settings().answer_cache_threshold
+AUDIT = get_settings().answer_cache_audit
+PER_QUESTION = get_settings().answer_cache_per_question
+QUESTIONS = get_settings().answer_cache_questions
+
+_LEXICONS = {"LC": LC_LEX, "SD": SD_LEX, "BH": BH_LEX}
+CONCEPT_WEIGHT = 2.0  # one concept ~ two rare terms
+BIGRAM_WEIGHT = 0.5
+_NEGATIONS = frozenset("not no never without cannot don doesn didn isn aren wasn shouldn won".split())
+_LATENCY_WINDOW = 2048
+
+
+def _debug(msg: str):
+    print(f"[answer_cache] {msg}")
+
+
+# ---------- Embedding ----------
+
+def _bucket(term: str) -> int:
+    """Signed bucket: the low bit of the hash picks the sign, so collisions cancel on average."""
+    h = int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=4).digest(), "little")
+    return (h >> 1) % DIM * (1 if h & 1 else -1)
+
+
+_BUCKETS: Dict[str, int] = {}
+
+
+def embed(kind: str, text: str) -> Dict[int, float]:
+    """Sparse unit vector {bucket: weight} of an answer."""
+    toks = tokens(text)
+    uni = [_stem(t) for t in toks if t not in STOPWORDS]
+    weighted = [(t, w) for t, w in IDF.vector(uni).items()]
+    weighted += [(t, w * BIGRAM_WEIGHT) for t, w in IDF.vector([f"{a} {b}" for a, b in zip(uni, uni[1:])]).items()]
+    lex = _LEXICONS.get(kind)
+    if lex is not None:
+        weighted += [("#" + c, CONCEPT_WEIGHT) for c in lex.concepts(toks)]
+    vec: Dict[int, float] = {}
+    for t, w in weighted:
+        b = _BUCKETS.get(t)
+        if b is None:
+            b = _bucket(t)
+            if len(_BUCKETS) < 200_000:
+                _BUCKETS[t] = b
+        i = abs(b)
+        vec[i] = vec.get(i, 0.0) + (w if b > 0 else -w)
+    norm = sum(v * v for v in vec.values()) ** 0.5 or 1.0
+    return {i: v / norm for i, v in vec.items() if v}
+
+
+def negated(text: str) -> bool:
+    """Odd number of negations: the answer says the opposite of its words."""
+    return sum(1 for t in tokens(text) if t in _NEGATIONS) % 2 == 1
+
+
+def dot(a: Dict[int, float], b: Dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(i, 0.0) for i, v in a.items())
+
+
+def question_key(kind: str, question: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Stable id of a question across requests and workers; None when there is nothing to key on."""
+    q = question or {}
+    ident = question_text(q).strip() or " ".join(q.get("rubric") or [])
+    if not ident:
+        return None
+    return kind + ":" + hashlib.blake2b(ident.encode("utf-8"), digest_size=12).hexdigest()
+
+
+# ---------- Index ----------
+
+class Entry:
+    __slots__ = ("vec", "neg", "correct", "feedback", "hits")
+
+    def __init__(self, vec: Dict[int, float], neg: bool, correct: bool, feedback: str):
+        self.vec = vec
+        self.neg = neg
+        self.correct = correct
+        self.feedback = feedback
+        self.hits = 0
+
+
+class Lookup:
+    """One answer's probe of the cache. `reused` is the verdict to return, None to ask the model."""
+
+    __slots__ = ("key", "vec", "neg", "entry", "similarity", "audit", "reused")
+
+    def __init__(self, key: Optional[str], vec: Dict[int, float], neg: bool = False):
+        self.key = key
+        self.vec = vec
+        self.neg = neg
+        self.entry: Optional[Entry] = None
+        self.similarity = 0.0
+        self.audit = False
+        self.reused: Optional[Dict[str, Any]] = None
+
+
+class AnswerCache:
+    def __init__(self, threshold: float = THRESHOLD, audit: float = AUDIT, per_question: int = PER_QUESTION,
+                 questions: int = QUESTIONS, enabled: bool = ENABLED):
+        self.threshold = threshold
+        self.audit = audit
+        self.per_question = per_question
+        self.questions = questions
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.rng = random.Random()
+        self._by_q: "OrderedDict[str, List[Entry]]" = OrderedDict()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self._by_q.clear()
+            self.lookups = self.hits = self.stored = 0
+            self.audits = self.false_reuse = 0
+            self._us: deque = deque(maxlen=_LATENCY_WINDOW)
+
+    def lookup(self, kind: str, question: Optional[Dict[str, Any]], text: str) -> Lookup:
+        key = question_key(kind, question) if self.enabled else None
+        if key is None:
+            return Lookup(None, {})
+        t0 = time.perf_counter()
+        look = Lookup(key, embed(kind, text), negated(text))
+        with self.lock:
+            best, best_sim = None, 0.0
+            for e in self._by_q.get(key, ()):
+                if e.neg != look.neg:
+                    continue
+                sim = dot(look.vec, e.vec)
+                if sim > best_sim:
+                    best, best_sim = e, sim
+            self.lookups += 1
+            if best is not None and best_sim >= self.threshold:
+                self._by_q.move_to_end(key)
+                best.hits += 1
+                self.hits += 1
+                look.entry, look.similarity = best, best_sim
+                look.audit = self.rng.random() < self.audit
+                if not look.audit:
+                    look.reused = {"correct": best.correct, "feedback": best.feedback, "judge_source": "cache"}
+            self._us.append((time.perf_counter() - t0) * 1e6)
+        return look
+
+    def record(self, look: Lookup, verdict: Dict[str, Any]):
+        """Keep the model's verdict for look's answer; settles an audit when look was one."""
+        if look.key is None:
+            return
+        correct, feedback = bool(verdict.get("correct")), verdict.get("feedback", "")
+        with self.lock:
+            entries = self._by_q.get(look.key)
+            if look.audit and look.entry is not None:
+                self.audits += 1
+                if look.entry.correct != correct:
+                    self.false_reuse += 1
+                    _debug(f"false reuse on {look.key} at similarity {look.similarity:.3f}, evicting")
+                    if entries and look.entry in entries:
+                        entries.remove(look.entry)
+                else:
+                    return  # the stored answer already stands for this one
+            if entries is None:
+                entries = self._by_q[look.key] = []
+                while len(self._by_q) > self.questions:
+                    self._by_q.popitem(last=False)
+            self._by_q.move_to_end(look.key)
+            if len(entries) >= self.per_question:
+                # Drop the entry that has saved the fewest calls
+                entries.remove(min(entries, key=lambda e: e.hits))
+            entries.append(Entry(look.vec, look.neg, correct, feedback))
+            self.stored += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            us = sorted(self._us)
+            return {
+                "enabled": self.enabled, "threshold": self.threshold, "audit": self.audit,
+                "questions": len(self._by_q), "entries": sum(len(v) for v in self._by_q.values()),
+                "lookups": self.lookups, "hits": self.hits, "stored": self.stored,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else None,
+                "audits": self.audits, "false_reuse": self.false_reuse,
+                "false_reuse_rate": round(self.false_reuse / self.audits, 4) if self.audits else None,
+                "lookup_p50_us": round(us[len(us) // 2], 1) if us else None,
+                "lookup_p99_us": round(us[min(len(us) - 1, int(len(us) * 0.99))], 1) if us else None,
+            }
+
+
+ANSWERS = AnswerCache()
@@ -0,0 +1,2 @@
+# bench/__init__.py
+# Benchmark harnesses. Run from the repo root, e.g. `python -m bench.load_test`.
@@ -0,0 +1,370 @@
+# bench/judge_eval.py
+"""
+Grading quality and speed, measured together on a labeled corpus.
+
+bench/judge_corpus.jsonl holds (question, answer, expected verdict) items for LC, SD and
+BH, including the hard cases: terse but right, fluent but wrong, keyword stuffing. Every
+item goes through each backend:
+
+    local   judge.py alone (the first pass)
+    hybrid  what the game runs: the local judge settles confident answers, the model the rest
+    model   every answer goes to the model
+
+For each backend and kind we report precision and recall of "pass" verdicts, agreement
+with the labels (and Cohen's kappa), p50/p99 latency per verdict, the share of answers the
+model saw, and model tokens per verdict. By default the model is a stub that answers with
+the label at --stub-accuracy after --stub-latency-ms, so a cheaper or faster model can be
+priced in before trying it; --real uses the configured model.
+
+    python -m bench.judge_eval
+    python -m bench.judge_eval --backends local,hybrid,model --stub-accuracy 0.9 --stub-latency-ms 400
+    python -m bench.judge_eval --real --backends hybrid,model --model gpt-4o-mini --out judge.json
+    python -m bench.judge_eval --calibrate          # JUDGE_FAIL_AT / JUDGE_PASS_AT per kind from the corpus
+    python -m bench.judge_eval --baseline judge.json
+
+With --baseline the run exits 1 if any backend's agreement dropped by more than
+--max-agreement-drop or its p99 grew by more than --tolerance.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "judge_corpus.jsonl")
+BACKENDS = ("local", "hybrid", "model")
+KINDS = ("LC", "SD", "BH")
+
+
+# ---------- Corpus ----------
+
+def load_corpus(path: str = CORPUS) -> List[Dict[str, Any]]:
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                items.append(json.loads(line))
+    return items
+
+
+# ---------- Stub model ----------
+
+class _Usage:
+    def __init__(self, prompt_tokens: int, completion_tokens: int):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+
+class _Message:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _Choice:
+    def __init__(self, content: str):
+        self.message = _Message(content)
+
+
+class _Response:
+    def __init__(self, content: str, usage: _Usage):
+        self.choices = [_Choice(content)]
+        self.usage = usage
+
+
+class LabelStub:
+    """A chat-completions stand-in that knows the labels and is right `accuracy` of the time."""
+
+    def __init__(self, labels: Dict[str, bool], accuracy: float, latency_ms: float, jitter_ms: float, seed: int):
+        self.labels = labels
+        self.accuracy = accuracy
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rng = random.Random(seed)
+        self.chat = self
+        self.completions = self
+
+    def create(self, model: str, messages: List[Dict[str, str]], **kwargs) -> _Response:
+        prompt = "".join(m["content"] for m in messages)
+        label = next((ok for answer, ok in self.labels.items() if answer in prompt), False)
+        correct = label if self.rng.random() < self.accuracy else not label
+        time.sleep(max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0)
+        content = json.dumps({"correct": correct, "feedback": "Stubbed verdict."})
+        return _Response(content, _Usage(len(prompt) // 4, len(content) // 4))
+
+
+class TokenMeter:
+    """Counts model calls and tokens by wrapping model_router._call."""
+
+    def __init__(self):
+        import model_router
+
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        inner = model_router._call
+
+        def counted(client, model, system, user):
+            text, usage = inner(client, model, system, user)
+            with self.lock:
+                self.calls += 1
+                if usage:
+                    self.tokens_in += usage[0] or 0
+                    self.tokens_out += usage[1] or 0
+            return text, usage
+
+        model_router._call = counted
+
+    def take(self) -> Tuple[int, int, int]:
+        with self.lock:
+            out = (self.calls, self.tokens_in, self.tokens_out)
+            self.calls = self.tokens_in = self.tokens_out = 0
+        return out
+
+
+# ---------- Judging ----------
+
+def judge_local(item: Dict[str, Any]) -> Tuple[bool, Dict[str, Any]]:
+    from judge import judge_lc, judge_sd, judge_beh, lc_artifacts, sd_artifacts
+
+    q, text = item["question"], item["answer"]
+    if item["kind"] == "LC":
+        res = judge_lc({**q, "grading": q.get("grading") or lc_artifacts(q)}, text)
+    elif item["kind"] == "SD":
+        res = judge_sd(q.get("rubric", []), text, q.get("grading") or sd_artifacts(q.get("rubric", [])))
+    else:
+        res = judge_beh(text)
+    return bool(res["correct"]), res
+
+
+def judge_logic(item: Dict[str, Any]) -> Tuple[bool, Dict[str, Any]]:
+    """The game's scoring path (logic.score_*), first pass on or off per logic.JUDGE_FIRST_PASS."""
+    import logic
+    from judge import sd_artifacts
+
+    q, text = item["question"], item["answer"]
+    if item["kind"] == "LC":
+        res = logic.score_lc_answer(q, text)
+    elif item["kind"] == "SD":
+        res = logic.score_sd_answer(q.get("rubric", []), text, q.get("grading") or sd_artifacts(q.get("rubric", [])))
+    else:
+        res = logic.score_beh_answer(text)
+    return bool(res.get("correct")), res
+
+
+def run_backend(name: str, items: List[Dict[str, Any]], meter: Optional[TokenMeter]) -> List[Dict[str, Any]]:
+    import logic
+    from answer_cache import ANSWERS
+
+    logic.JUDGE_FIRST_PASS = name != "model"
+    # Grade every item on its own: corpus answers to one question would otherwise reuse each other's verdicts
+    ANSWERS.enabled = False
+    rows = []
+    for item in items:
+        t0 = time.perf_counter()
+        verdict, res = judge_local(item) if name == "local" else judge_logic(item)
+        ms = (time.perf_counter() - t0) * 1000.0
+        calls, t_in, t_out = meter.take() if meter else (0, 0, 0)
+        rows.append({"id": item["id"], "kind": item["kind"], "label": bool(item["label"]), "verdict": verdict,
+                     "ms": ms, "model_calls": calls, "tokens_in": t_in, "tokens_out": t_out,
+                     "confident": res.get("confident", True),  # only the bare local judge abstains
+                     "source": res.get("judge_source", "local")})
+    return rows
+
+
+# ---------- Metrics ----------
+
+def _pct(sorted_vals: List[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    # nearest-rank, same as bench.load_test
+    k = max(0, min(len(sorted_vals) - 1, math.ceil(p / 100.0 * len(sorted_vals)) - 1))
+    return sorted_vals[k]
+
+
+def _ratio(a: float, b: float) -> Optional[float]:
+    return round(a / b, 4) if b else None
+
+
+def metrics(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    n = len(rows)
+    tp = sum(1 for r in rows if r["label"] and r["verdict"])
+    fp = sum(1 for r in rows if not r["label"] and r["verdict"])
+    fn = sum(1 for r in rows if r["label"] and not r["verdict"])
+    tn = n - tp - fp - fn
+    agree = (tp + tn) / n if n else 0.0
+    # Agreement expected by chance from the two pass rates, for kappa
+    chance = ((tp + fp) * (tp + fn) + (tn + fn) * (tn + fp)) / (n * n) if n else 0.0
+    confident = [r for r in rows if r["confident"]]
+    ms = sorted(r["ms"] for r in rows)
+    return {
+        "n": n, "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+        "precision": _ratio(tp, tp + fp),
+        "recall": _ratio(tp, tp + fn),
+        "agreement": round(agree, 4),
+        "kappa": round((agree - chance) / (1 - chance), 4) if chance < 1 else None,
+        "confident_share": _ratio(len(confident), n),
+        "confident_agreement": _ratio(sum(1 for r in confident if r["label"] == r["verdict"]), len(confident)),
+        "model_share": _ratio(sum(1 for r in rows if r["model_calls"]), n),
+        "p50_ms": round(_pct(ms, 50), 3),
+        "p99_ms": round(_pct(ms, 99), 3),
+        "mean_ms": round(sum(ms) / n, 3) if n else 0.0,
+        "tokens_in_per_verdict": round(sum(r["tokens_in"] for r in rows) / n, 1) if n else 0.0,
+        "tokens_out_per_verdict": round(sum(r["tokens_out"] for r in rows) / n, 1) if n else 0.0,
+    }
+
+
+def summarize(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    out = {"all": metrics(rows)}
+    for k in KINDS:
+        sub = [r for r in rows if r["kind"] == k]
+        if sub:
+            out[k] = metrics(sub)
+    out["misses"] = [r["id"] for r in rows if r["label"] != r["verdict"]]
+    return out
+
+
+def suggest_thresholds(items: List[Dict[str, Any]], target_precision: float) -> Dict[str, Any]:
+    """judge.calibrate per kind on the corpus's local scores."""
+    from judge import calibrate
+
+    out = {}
+    for k in KINDS:
+        samples = [(judge_local(it)[1]["score"], bool(it["label"])) for it in items if it["kind"] == k]
+        if not samples:
+            continue
+        fail_at, pass_at = calibrate(samples, target_precision)
+        settled = sum(1 for s, _ in samples if s >= pass_at or s <= fail_at)
+        out[k] = {"JUDGE_FAIL_AT": fail_at, "JUDGE_PASS_AT": pass_at, "confident_share": round(settled / len(samples), 4)}
+    return out
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, max_drop: float) -> List[str]:
+    out = []
+    for name, cur in current.get("backends", {}).items():
+        base = (baseline.get("backends") or {}).get(name)
+        if not base:
+            continue
+        c, b = cur["all"], base["all"]
+        if c["agreement"] < b["agreement"] - max_drop:
+            out.append(f"{name} agreement {b['agreement']:.3f} -> {c['agreement']:.3f}")
+        if b["p99_ms"] > 0 and c["p99_ms"] > b["p99_ms"] * (1 + tolerance):
+            out.append(f"{name} p99 {b['p99_ms']:.2f}ms -> {c['p99_ms']:.2f}ms")
+    return out
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip()
+    except Exception:
+        return ""
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", default=CORPUS)
+    ap.add_argument("--backends", default="local,hybrid,model", help="comma list of local, hybrid, model")
+    ap.add_argument("--kinds", default="LC,SD,BH")
+    ap.add_argument("--real", action="store_true", help="use the configured model instead of the stub")
+    ap.add_argument("--model", help="route every scoring call to this model")
+    ap.add_argument("--stub-accuracy", type=float, default=0.9, help="share of stub verdicts that match the label")
+    ap.add_argument("--stub-latency-ms", type=float, default=300.0)
+    ap.add_argument("--stub-jitter-ms", type=float, default=50.0)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--calibrate", action="store_true", help="also suggest thresholds per kind")
+    ap.add_argument("--target-precision", type=float, default=0.95)
+    ap.add_argument("--verbose", action="store_true", help="keep logic debug prints")
+    ap.add_argument("--out", help="write JSON results here (default: stdout)")
+    ap.add_argument("--baseline", help="previous JSON result to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p99 growth vs. baseline")
+    ap.add_argument("--max-agreement-drop", type=float, default=0.02)
+    args = ap.parse_args(argv)
+
+    import judge
+    import logic
+    import model_router
+
+    kinds = {k.strip().upper() for k in args.kinds.split(",")}
+    items = [it for it in load_corpus(args.corpus) if it["kind"] in kinds]
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    for b in backends:
+        if b not in BACKENDS:
+            ap.error(f"unknown backend {b!r}; choose from {', '.join(BACKENDS)}")
+    if not args.verbose:
+        logic._debug = lambda msg: None
+        model_router._debug = lambda msg: None
+
+    needs_model = any(b != "local" for b in backends)
+    meter = TokenMeter() if needs_model else None
+    if needs_model and not args.real:
+        stub = LabelStub({it["answer"]: bool(it["label"]) for it in items}, args.stub_accuracy,
+                         args.stub_latency_ms, args.stub_jitter_ms, args.seed)
+        logic._maybe_client = lambda: stub
+        model_router.ROUTES = {"score": [args.model or "stub"]}
+    elif needs_model:
+        if logic._maybe_client() is None:
+            raise SystemExit(f"--real needs a model: {logic.llm_status()['last_llm_error']}")
+        if args.model:
+            model_router.ROUTES = {"score": [args.model]}
+
+    results: Dict[str, Any] = {}
+    for b in backends:
+        t0 = time.perf_counter()
+        rows = run_backend(b, items, meter)
+        results[b] = summarize(rows)
+        results[b]["duration_s"] = round(time.perf_counter() - t0, 3)
+
+    result: Dict[str, Any] = {
+        "meta": {
+            "commit": _git_commit(),
+            "corpus": os.path.relpath(args.corpus),
+            "items": len(items),
+            "model": "real" if args.real else "stub",
+            "route": model_router.candidates("score", "LC") if needs_model else None,
+            "stub_accuracy": None if args.real else args.stub_accuracy,
+            "stub_latency_ms": None if args.real else args.stub_latency_ms,
+            "pass_at": judge.PASS_AT,
+            "fail_at": judge.FAIL_AT,
+            "python": sys.version.split()[0],
+        },
+        "backends": results,
+    }
+    if args.calibrate:
+        result["suggested"] = suggest_thresholds(items, args.target_precision)
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    print(f"{'backend':<8} {'kind':<4} {'agree':>6} {'prec':>6} {'recall':>6} {'kappa':>6} "
+          f"{'model%':>6} {'p50ms':>9} {'p99ms':>9} {'tok/verdict':>11}", file=sys.stderr)
+    for b, res in results.items():
+        for k in ("all",) + KINDS:
+            m = res.get(k)
+            if not m:
+                continue
+            fmt = lambda v: f"{v:.3f}" if isinstance(v, float) else "-"
+            print(f"{b:<8} {k:<4} {fmt(m['agreement']):>6} {fmt(m['precision']):>6} {fmt(m['recall']):>6} "
+                  f"{fmt(m['kappa']):>6} {fmt(m['model_share']):>6} {m['p50_ms']:>9.3f} {m['p99_ms']:>9.3f} "
+                  f"{m['tokens_in_per_verdict'] + m['tokens_out_per_verdict']:>11.1f}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance, args.max_agreement_drop)
+        for r in regressions:
+            print(f"[judge_eval] REGRESSION {r}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
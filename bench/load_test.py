@@ -0,0 +1,450 @@
+# bench/load_test.py
+"""
+End-to-end load test for server.py.
+
+Starts the FastAPI app in-process under uvicorn (or targets an already running
+server with --url) and drives many concurrent virtual players through the same
+loop the browser runs: /new -> /roll -> /prefetch + /resolve -> /submit_answer -> /grade
+(long-poll) -> /state.
+
+In-process runs patch a stub model client into logic.py, so LLM latency is
+simulated (--llm-latency-ms / --llm-jitter-ms) and no API key is needed.
+
+    python -m bench.load_test --players 16 --loops 20 --llm-latency-ms 300 --out bench_output.json
+    python -m bench.load_test --baseline old.json --tolerance 0.2
+
+Results are JSON (p50/p95/p99 per route, throughput, error rates). With
+--baseline the run exits 1 if any route's p95 or error rate regressed.
+"""
+import argparse
+import http.client
+import json
+import math
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlparse
+
+ROUTES = ["/new", "/roll", "/prefetch", "/resolve", "/submit_answer", "/grade", "/state"]
+
+ANSWERS = {
+    "LC": "Use a hash map keyed by value. Scan the array once, store prefix sums or seen values in the map "
+          "and return as soon as the complement is found. This runs in linear time with linear extra space.",
+    "SD": "API endpoints for create and read. Key generation with collision checks, a data model in a sharded "
+          "KV store, caching hot keys in front, consistency on create, scaling strategy and tradeoffs.",
+    "BH": "Situation: two teammates disagreed on an API. Task: unblock the release. Action: I ran a short "
+          "design review and wrote down the tradeoffs. Result: we shipped on time and cut bugs by 30%.",
+}
+
+
+# ---------- Stub model backend ----------
+
+class _StubMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _StubChoice:
+    def __init__(self, content: str):
+        self.message = _StubMessage(content)
+
+
+class _StubResponse:
+    def __init__(self, content: str):
+        self.choices = [_StubChoice(content)]
+
+
+class _StubCompletions:
+    def __init__(self, latency_ms: float, jitter_ms: float, pass_rate: float):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.pass_rate = pass_rate
+
+    def create(self, **kwargs) -> _StubResponse:
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        time.sleep(max(0.0, delay) / 1000.0)
+        # One superset object satisfies every generate_* and score_* parser in logic.py
+        n = random.randint(1, 10_000)
+        return _StubResponse(json.dumps({
+            "title": f"Stub Question {n}",
+            "question": "Return the number of pairs that sum to K.",
+            "prompt": "Design a small service that stores and serves short links.",
+            "examples": ["[1,2,3] K=3 -> 1"],
+            "hints": ["Hash map", "Single pass"],
+            "rubric": ["API endpoints", "Data model", "Caching", "Scaling", "Tradeoffs"],
+            "tip": "STAR: Situation, Task, Action, Result.",
+            "correct": random.random() < self.pass_rate,
+            "feedback": "Stubbed verdict.",
+        }))
+
+
+class _StubChat:
+    def __init__(self, completions: _StubCompletions):
+        self.completions = completions
+
+
+class StubClient:
+    """Quacks like the subset of openai.OpenAI that logic.py uses."""
+
+    def __init__(self, latency_ms: float, jitter_ms: float, pass_rate: float):
+        self.chat = _StubChat(_StubCompletions(latency_ms, jitter_ms, pass_rate))
+
+
+def install_stub(latency_ms: float, jitter_ms: float, pass_rate: float, quiet: bool = True):
+    import accounts
+    import analytics
+    import logic
+    import qpool
+    import server
+    from store import MemoryBackend
+
+    client = StubClient(latency_ms, jitter_ms, pass_rate)
+    logic._maybe_client = lambda: client
+    # Like replay: stub games never reach the real game store, account history or analytics
+    server.BACKEND = MemoryBackend()
+    accounts.ACCOUNTS = accounts.AccountStore("")
+    analytics.SINK = analytics.Sink("")
+    # No shared question pool: its refiller would compete with the players for model slots
+    # (and leave a questions.pool behind), so every question is generated on demand
+    qpool.POOL = qpool.QuestionPool("")
+    qpool.REFILLER = qpool.Refiller(qpool.POOL)
+    if quiet:
+        # Per-request prints to a terminal dominate small routes; silence them for measurement
+        logic._debug = lambda msg: None
+        server._debug = lambda msg: None
+    return client
+
+
+# ---------- In-process server ----------
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_inprocess_server() -> Tuple[Any, threading.Thread, str]:
+    import uvicorn
+    from server import app
+
+    port = _free_port()
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    srv = uvicorn.Server(config)
+    th = threading.Thread(target=srv.run, name="uvicorn", daemon=True)
+    th.start()
+    deadline = time.time() + 10
+    while not srv.started:
+        if time.time() > deadline:
+            raise RuntimeError("uvicorn did not start within 10s")
+        time.sleep(0.01)
+    return srv, th, f"http://127.0.0.1:{port}"
+
+
+# ---------- Virtual player ----------
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {r: [] for r in ROUTES}
+        self.status: Dict[str, Dict[str, int]] = {r: {} for r in ROUTES}
+        self.errors: Dict[str, int] = {r: 0 for r in ROUTES}
+        self.shed: Dict[str, int] = {r: 0 for r in ROUTES}  # 503s from admission control, not failures
+        self.turns = 0
+
+    def add(self, route: str, ms: float, status: int):
+        with self._lock:
+            self.samples.setdefault(route, []).append(ms)
+            codes = self.status.setdefault(route, {})
+            codes[str(status)] = codes.get(str(status), 0) + 1
+            if status == 503:
+                self.shed[route] = self.shed.get(route, 0) + 1
+            elif status == 0 or status >= 400:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def turn(self):
+        with self._lock:
+            self.turns += 1
+
+
+class PlayerClient:
+    """One keep-alive connection plus a cookie jar, like a single browser tab."""
+
+    def __init__(self, base: str, rec: Recorder, timeout: float):
+        u = urlparse(base)
+        self.host, self.port = u.hostname, u.port or 80
+        self.rec = rec
+        self.timeout = timeout
+        self.cookies: Dict[str, str] = {}
+        self._conn: Optional[http.client.HTTPConnection] = None
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self._conn is None:
+            self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def call(self, method: str, route: str, body: Optional[Dict[str, Any]] = None,
+             label: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        headers = {}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+
+        t0 = time.perf_counter()
+        status = 0
+        payload = None
+        try:
+            conn = self._connection()
+            conn.request(method, route, body=data, headers=headers)
+            resp = conn.getresponse()
+            raw = resp.read()
+            status = resp.status
+            for k, v in resp.getheaders():
+                if k.lower() == "set-cookie":
+                    name, _, rest = v.partition("=")
+                    self.cookies[name.strip()] = rest.split(";", 1)[0]
+            if raw:
+                payload = json.loads(raw)
+        except Exception:
+            self.close()
+        self.rec.add(label or route, (time.perf_counter() - t0) * 1000.0, status)
+        return payload
+
+
+def _expects_question(tile: Dict[str, Any]) -> bool:
+    # Mirrors willTileProduceQuestion() in static/app.js
+    if not tile or tile.get("ttype") != "COMPANY":
+        return False
+    group = (tile.get("payload") or {}).get("group")
+    if group == "UTIL":
+        return False
+    if group == "RR":
+        return True
+    return (tile.get("payload") or {}).get("qkind", "").upper() in ("LC", "SD", "BH")
+
+
+def _answer_for(pending: Dict[str, Any]) -> str:
+    kind = pending.get("type", "")
+    if kind == "SYS_DESIGN":
+        return ANSWERS["SD"]
+    if kind == "BEHAVIORAL":
+        return ANSWERS["BH"]
+    return ANSWERS["LC"]
+
+
+def run_player(base: str, rec: Recorder, loops: int, timeout: float, side_pool: ThreadPoolExecutor,
+               seed: Optional[int] = None):
+    """One player's loop; with a seed, its games are seed, seed + 1, ... so reruns see the same dice."""
+    main = PlayerClient(base, rec, timeout)
+    side = PlayerClient(base, rec, timeout)
+    games = 0
+
+    def new_game():
+        nonlocal games
+        main.call("POST", "/new", {"seed": seed + games} if seed is not None else None)
+        games += 1
+
+    try:
+        new_game()
+        st = main.call("GET", "/state") or {}
+        side.cookies = main.cookies
+        board = st.get("board") or []
+        turns = st.get("turns", 0)
+
+        for _ in range(loops):
+            if turns <= 0:
+                new_game()
+                turns = 20
+            roll = main.call("POST", "/roll") or {}
+            if roll.get("skipped") or "pos" not in roll:
+                st = main.call("GET", "/state") or {}
+                turns = st.get("turns", turns)
+                rec.turn()
+                continue
+
+            pos = roll["pos"]
+            prefetch = None
+            if board and _expects_question(board[pos % len(board)]):
+                # The browser fires /prefetch without awaiting it, then immediately calls /resolve
+                prefetch = side_pool.submit(side.call, "POST", "/prefetch", {"pos": pos})
+            res = main.call("POST", "/resolve") or {}
+            if prefetch is not None:
+                prefetch.result()
+
+            pending = res.get("pending")
+            if pending:
+                sub = main.call("POST", "/submit_answer", {"text": _answer_for(pending)}) or {}
+                while sub.get("status") in ("queued", "running"):
+                    sub = main.call("GET", f"/grade/{sub['job_id']}?wait=10", label="/grade") or {}
+            st = main.call("GET", "/state") or {}
+            turns = st.get("turns", turns)
+            rec.turn()
+    finally:
+        main.close()
+        side.close()
+
+
+# ---------- Reporting ----------
+
+def _pct(sorted_vals: List[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    # nearest-rank
+    k = max(0, min(len(sorted_vals) - 1, math.ceil(p / 100.0 * len(sorted_vals)) - 1))
+    return sorted_vals[k]
+
+
+def summarize(rec: Recorder, elapsed_s: float) -> Dict[str, Any]:
+    routes = {}
+    total = 0
+    errors = 0
+    shed = 0
+    for route, vals in rec.samples.items():
+        if not vals:
+            continue
+        s = sorted(vals)
+        n = len(s)
+        total += n
+        errors += rec.errors.get(route, 0)
+        shed += rec.shed.get(route, 0)
+        routes[route] = {
+            "count": n,
+            "errors": rec.errors.get(route, 0),
+            "error_rate": round(rec.errors.get(route, 0) / n, 4),
+            "shed": rec.shed.get(route, 0),
+            "rps": round(n / elapsed_s, 2) if elapsed_s else 0.0,
+            "mean_ms": round(sum(s) / n, 3),
+            "p50_ms": round(_pct(s, 50), 3),
+            "p95_ms": round(_pct(s, 95), 3),
+            "p99_ms": round(_pct(s, 99), 3),
+            "max_ms": round(s[-1], 3),
+            "status": rec.status.get(route, {}),
+        }
+    return {
+        "totals": {
+            "requests": total,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "shed": shed,
+            "throughput_rps": round(total / elapsed_s, 2) if elapsed_s else 0.0,
+            "turns": rec.turns,
+            "turns_per_s": round(rec.turns / elapsed_s, 2) if elapsed_s else 0.0,
+            "duration_s": round(elapsed_s, 3),
+        },
+        "routes": routes,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return human-readable regressions of p95 latency and error rate vs. a previous run."""
+    out = []
+    for route, cur in current.get("routes", {}).items():
+        base = baseline.get("routes", {}).get(route)
+        if not base:
+            continue
+        if base["p95_ms"] > 0 and cur["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            out.append(f"{route} p95 {base['p95_ms']:.1f}ms -> {cur['p95_ms']:.1f}ms")
+        if cur["error_rate"] > base["error_rate"] + 0.01:
+            out.append(f"{route} error_rate {base['error_rate']:.2%} -> {cur['error_rate']:.2%}")
+    return out
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip()
+    except Exception:
+        return ""
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", help="target a running server instead of starting one in-process")
+    ap.add_argument("--players", type=int, default=16, help="concurrent virtual players")
+    ap.add_argument("--loops", type=int, default=20, help="turns per player")
+    ap.add_argument("--llm-latency-ms", type=float, default=250.0, help="stub model latency (in-process only)")
+    ap.add_argument("--llm-jitter-ms", type=float, default=50.0)
+    ap.add_argument("--pass-rate", type=float, default=0.6, help="fraction of stub verdicts that pass")
+    ap.add_argument("--timeout", type=float, default=60.0, help="per-request socket timeout in seconds")
+    ap.add_argument("--seed", type=int, default=None, help="seed the stub and every game, for repeatable runs")
+    ap.add_argument("--verbose", action="store_true", help="keep server/logic debug prints")
+    ap.add_argument("--out", help="write JSON results here (default: stdout)")
+    ap.add_argument("--baseline", help="previous JSON result to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95 growth vs. baseline")
+    args = ap.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    srv = None
+    base = args.url
+    if not base:
+        install_stub(args.llm_latency_ms, args.llm_jitter_ms, args.pass_rate, quiet=not args.verbose)
+        srv, _, base = start_inprocess_server()
+
+    rec = Recorder()
+    t0 = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.players, thread_name_prefix="prefetch") as side_pool, \
+                ThreadPoolExecutor(max_workers=args.players, thread_name_prefix="player") as pool:
+            futs = [pool.submit(run_player, base, rec, args.loops, args.timeout, side_pool,
+                                args.seed * 1000 + i * 100 + 1 if args.seed is not None else None)
+                    for i in range(args.players)]
+            for f in futs:
+                f.result()
+    finally:
+        elapsed = time.perf_counter() - t0
+        if srv is not None:
+            srv.should_exit = True
+
+    result = {
+        "meta": {
+            "commit": _git_commit(),
+            "target": args.url or "in-process",
+            "players": args.players,
+            "loops": args.loops,
+            "llm_latency_ms": None if args.url else args.llm_latency_ms,
+            "llm_jitter_ms": None if args.url else args.llm_jitter_ms,
+            "pass_rate": None if args.url else args.pass_rate,
+            "seed": args.seed,
+            "python": sys.version.split()[0],
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - elapsed)),
+        },
+        **summarize(rec, elapsed),
+    }
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    tot = result["totals"]
+    print(f"[bench] {tot['requests']} requests in {tot['duration_s']}s, {tot['throughput_rps']} rps, "
+          f"error_rate={tot['error_rate']:.2%} shed={tot['shed']}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for r in regressions:
+            print(f"[bench] REGRESSION {r}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# bench/micro.py
+"""
+Microbenchmarks for the game-rule hot paths in server.py, the GameState binary
+format, the local judges in logic.py, llm._safe_json and llm_json.parse.
+
+Each case is warmed up, then timed in calibrated batches (~--batch-ms each) for
+--repeats rounds; we report the best and median ns/op. Allocation figures come
+from tracemalloc on separate, untimed calls: the peak bytes allocated above
+the starting point while one op runs.
+
+    python -m bench.micro
+    python -m bench.micro -k judge --out micro.json
+"""
+import argparse
+import functools
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+os.environ.setdefault("STATE_BACKEND", "memory")  # nothing here should touch the game database
+
+import dedup
+import llm_json
+import logic
+import server
+from board import BOARD
+from gamestate import GameState, POS_OF
+from llm import _safe_json
+from store import Journal
+
+LC_ANSWER = ("Walk the array once and keep a hash map from prefix sum to how many times it was seen. "
+             "For each index add map[prefix - k] to the count, then bump map[prefix]. Linear time and space.")
+SD_ANSWER = ("API endpoints: POST /links and GET /{key}. Key gen uses base62 of a counter to avoid collisions. "
+             "Data model is a KV table. Caching hot keys in Redis. Consistency on create via conditional put. "
+             "Scaling strategy: shard by key. Tradeoffs: counter service is a bottleneck.")
+BH_ANSWER = ("Situation: two teammates disagreed on the schema. Task: ship the migration this sprint. "
+             "Action: I set up a design review and wrote the tradeoffs down. Result: shipped on time, zero rollbacks.")
+SD_RUBRIC = ["API endpoints", "Key gen & collisions", "Data model", "Caching hot keys",
+             "Consistency on create", "Scaling strategy", "Tradeoffs"]
+
+_LC_QUESTION = {"title": "Subarrays Sum to K (count)", "question": "Return how many subarrays sum to K.",
+                "examples": ["[1,-1,2] K=2 -> 2"], "hints": ["Prefix sums", "Map of prefix->freq"]}
+
+
+def _game_fixture():
+    """A mid-game state: most of BROWN and all of RED owned, a few houses, two railroads."""
+    g = server.new_game()
+    for name in ("FedEx", "Starbucks", "IBM", "AMD", "Palantir", "NYC", "SF", "Nokia"):
+        g.own(POS_OF[name])
+    g.houses[POS_OF["IBM"]], g.houses[POS_OF["AMD"]] = 2, 1
+    g.turns = 10 ** 9  # resolve_non_llm_immediate decrements this on every call
+    return g
+
+
+@functools.lru_cache(maxsize=1)
+def _question_index(n: int = 100_000) -> dedup.SimIndex:
+    """Built on first use (filling it takes seconds): an index the size of a long-running content pool, filled with distinct synthetic questions."""
+    rng = random.Random(7)
+    words = [f"w{i}" for i in range(5000)]
+    idx = dedup.SimIndex()
+    for _ in range(n):
+        idx.add(dedup.signature(" ".join(rng.sample(words, 12))))
+    return idx
+
+
+def _malformed(size: int) -> Dict[str, str]:
+    prose = "The model rambles about {braces} and trailing commas, " * (size // 52 + 1)
+    obj = json.dumps({"correct": True, "feedback": "x" * 64})
+    return {
+        "prose_then_object": (prose[:size] + obj),
+        "unclosed_object": ("{" + '"feedback": "' + prose[:size]),
+        "two_objects": (obj + prose[:size] + obj),
+        "braces_no_json": ("{" * 8 + prose[:size] + "}" * 8),
+        "deep_nesting": ('{"x":[' * (size // 6))[:size],  # RecursionError in the decoder, must not escape
+    }
+
+
+def build_cases(g: GameState, size: int) -> List[Tuple[str, Callable[[], Any]]]:
+    go, chance, jail = BOARD[0], BOARD[7], BOARD[10]
+    sig = dedup.signature(dedup.question_text(_LC_QUESTION))
+    blob = g.to_bytes()
+    cases: List[Tuple[str, Callable[[], Any]]] = [
+        ("side_for_index", lambda: server.side_for_index(27)),
+        ("lc_diff_for_side", lambda: server.lc_diff_for_side(33)),
+        ("_has_full_monopoly(RED)", lambda: server._has_full_monopoly(g, "RED")),
+        ("_has_full_monopoly(BROWN)", lambda: server._has_full_monopoly(g, "BROWN")),
+        ("_owned_railroad_count", lambda: server._owned_railroad_count(g)),
+        ("_reward_for_property_progress", lambda: server._reward_for_property_progress("HARD", True, True, 3)),
+        ("resolve_non_llm_immediate(GO)", lambda: server.resolve_non_llm_immediate(g, Journal({}), go)),
+        ("resolve_non_llm_immediate(JAIL)", lambda: server.resolve_non_llm_immediate(g, Journal({}), jail)),
+        ("resolve_non_llm_immediate(CHANCE)", lambda: server.resolve_non_llm_immediate(g, Journal({}), chance)),
+        ("judge score_lc_answer", lambda: logic.score_lc_answer(_LC_QUESTION, LC_ANSWER)),
+        ("judge score_sd_answer", lambda: logic.score_sd_answer(SD_RUBRIC, SD_ANSWER)),
+        ("judge score_beh_answer", lambda: logic.score_beh_answer(BH_ANSWER)),
+        ("_state_fields", lambda: server._state_fields("bench", g)),
+        ("GameState.to_bytes", g.to_bytes),
+        ("GameState.from_bytes", lambda: GameState.from_bytes(blob)),
+        ("dedup signature", lambda: dedup.signature(dedup.question_text(_LC_QUESTION))),
+        ("dedup find (100k stored)", lambda: _question_index().find(sig)),
+    ]
+    for label, text in _malformed(size).items():
+        cases.append((f"_safe_json {label} {size // 1024}KiB", lambda t=text: _safe_json(t, {})))
+        cases.append((f"llm_json.parse(score) {label} {size // 1024}KiB", lambda t=text: llm_json.parse(t, "score")))
+    return cases
+
+
+# ---------- Measurement ----------
+
+def _calibrate(fn: Callable[[], Any], batch_ms: float) -> int:
+    n = 1
+    while True:
+        t0 = time.perf_counter_ns()
+        for _ in range(n):
+            fn()
+        dt = time.perf_counter_ns() - t0
+        if dt >= batch_ms * 1e6 or n >= 1 << 24:
+            return n
+        n *= 2 if dt < batch_ms * 1e5 else max(2, int(batch_ms * 1e6 / max(dt, 1)))
+
+
+def _allocs(fn: Callable[[], Any], samples: int = 5) -> Dict[str, float]:
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(samples):
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            result = fn()
+            _, peak = tracemalloc.get_traced_memory()
+            del result
+            peaks.append(peak - base)
+    finally:
+        tracemalloc.stop()
+    return {"alloc_peak_bytes": statistics.median(peaks)}
+
+
+def measure(fn: Callable[[], Any], warmup_ms: float, batch_ms: float, repeats: int) -> Dict[str, Any]:
+    deadline = time.perf_counter() + warmup_ms / 1000.0
+    while time.perf_counter() < deadline:
+        fn()
+    n = _calibrate(fn, batch_ms)
+    per_op = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            t0 = time.perf_counter_ns()
+            for _ in range(n):
+                fn()
+            per_op.append((time.perf_counter_ns() - t0) / n)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {
+        "iterations": n,
+        "repeats": repeats,
+        "best_ns_per_op": round(min(per_op), 1),
+        "median_ns_per_op": round(statistics.median(per_op), 1),
+        "stdev_pct": round(100 * statistics.pstdev(per_op) / statistics.mean(per_op), 2),
+        **_allocs(fn),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-k", dest="filter", default="", help="only run cases whose name contains this substring")
+    ap.add_argument("--warmup-ms", type=float, default=200.0)
+    ap.add_argument("--batch-ms", type=float, default=100.0)
+    ap.add_argument("--repeats", type=int, default=7)
+    ap.add_argument("--size", type=int, default=64 * 1024, help="bytes of malformed model output for _safe_json")
+    ap.add_argument("--verbose", action="store_true", help="keep server/logic debug prints")
+    ap.add_argument("--out", help="write JSON results here")
+    args = ap.parse_args(argv)
+
+    if not args.verbose:
+        logic._debug = lambda msg: None
+        server._debug = lambda msg: None
+        llm_json._debug = lambda msg: None
+    # Local judges only: never reach for a model client here
+    logic.USE_LLM = False
+    g = _game_fixture()
+
+    results: Dict[str, Any] = {}
+    for name, fn in build_cases(g, args.size):
+        if args.filter and args.filter not in name:
+            continue
+        r = measure(fn, args.warmup_ms, args.batch_ms, args.repeats)
+        results[name] = r
+        print(f"{name:<48} {r['median_ns_per_op']:>14,.1f} ns/op  (best {r['best_ns_per_op']:,.1f}, "
+              f"±{r['stdev_pct']}%)  peak {r['alloc_peak_bytes']:>9,.0f} B/op",
+              file=sys.stderr)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "cases": results}, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+# bench/startup.py
+"""
+Cold-start benchmark for server.py.
+
+Each repeat launches a fresh interpreter that imports server (building the app), then
+serves one GET /state in-process. We report, per phase, the median and p90 over the
+repeats: process wall time, time to import server, and time for the first /state. We
+also report whether the OpenAI SDK got imported along the way, and the slowest
+top-level imports from -X importtime.
+
+    python -m bench.startup --repeats 10 --out startup.json
+    python -m bench.startup --baseline startup.json --tolerance 0.2
+
+With --baseline the run exits 1 if median import time regressed by more than --tolerance.
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARKER = "@@startup "
+
+PROBE = f"""
+import json, sys, time
+t0 = time.perf_counter()
+import server
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(server.app)
+t2 = time.perf_counter()
+client.get("/state")
+t3 = time.perf_counter()
+print({MARKER!r} + json.dumps({{"import_ms": (t1 - t0) * 1e3, "first_state_ms": (t3 - t2) * 1e3,
+                                 "openai_loaded": "openai" in sys.modules}}))
+"""
+
+
+def _pct(sorted_vals: List[float], p: float) -> float:
+    # Nearest-rank percentile, same as bench.load_test
+    k = max(0, min(len(sorted_vals) - 1, math.ceil(p / 100.0 * len(sorted_vals)) - 1))
+    return sorted_vals[k]
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({"STATE_BACKEND": "memory", "GAME_DB": ""})
+    return env
+
+
+def run_once(importtime: bool = False) -> Tuple[Dict[str, Any], str]:
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", PROBE]
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=ROOT, env=_env(), capture_output=True, text=True, timeout=120)
+    wall_ms = (time.perf_counter() - t0) * 1e3
+    if proc.returncode != 0:
+        raise RuntimeError(f"probe failed:\n{proc.stderr[-2000:]}")
+    line = next(ln for ln in proc.stdout.splitlines() if ln.startswith(MARKER))
+    out = json.loads(line[len(MARKER):])
+    out["wall_ms"] = wall_ms
+    return out, proc.stderr
+
+
+def top_imports(importtime_log: str, n: int) -> List[Dict[str, Any]]:
+    """Slowest top-level imports (cumulative microseconds) from a -X importtime log."""
+    rows = []
+    for ln in importtime_log.splitlines():
+        parts = ln[len("import time:"):].split("|")
+        if not ln.startswith("import time:") or len(parts) != 3 or "cumulative" in ln:
+            continue
+        _, cum_us, name = parts
+        if name[1:].startswith(" "):  # indented: nested under another import
+            continue
+        rows.append({"module": name.strip(), "cumulative_ms": round(int(cum_us) / 1e3, 1)})
+    return sorted(rows, key=lambda r: -r["cumulative_ms"])[:n]
+
+
+def _stats(vals: List[float]) -> Dict[str, float]:
+    s = sorted(vals)
+    return {"p50_ms": round(statistics.median(s), 1), "p90_ms": round(_pct(s, 90), 1), "min_ms": round(s[0], 1)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeats", type=int, default=7, help="fresh interpreters to launch")
+    ap.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    ap.add_argument("--out", help="write JSON results here (default: stdout)")
+    ap.add_argument("--baseline", help="previous JSON result to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed relative growth of median import time")
+    args = ap.parse_args(argv)
+
+    run_once()  # warm the OS page cache and __pycache__ so repeats measure the same thing
+    runs = [run_once()[0] for _ in range(args.repeats)]
+    _, log = run_once(importtime=True)
+
+    result = {
+        "meta": {"python": sys.version.split()[0], "repeats": args.repeats,
+                 "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())},
+        "wall": _stats([r["wall_ms"] for r in runs]),
+        "import_server": _stats([r["import_ms"] for r in runs]),
+        "first_state": _stats([r["first_state_ms"] for r in runs]),
+        "openai_imported": any(r["openai_loaded"] for r in runs),
+        "top_imports": top_imports(log, args.top),
+    }
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    print(f"[bench] import server p50={result['import_server']['p50_ms']}ms "
+          f"wall p50={result['wall']['p50_ms']}ms openai_imported={result['openai_imported']}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            base = json.load(f)["import_server"]["p50_ms"]
+        cur = result["import_server"]["p50_ms"]
+        if base > 0 and cur > base * (1 + args.tolerance):
+            print(f"[bench] REGRESSION import server p50 {base}ms -> {cur}ms", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
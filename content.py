@@ -0,0 +1,237 @@
+# content.py
+"""
+Offline question packs.
+
+A pack holds pre-generated questions for every kind x difficulty bucket, so a deployment
+without a model still gets real variety at zero model latency. The server memory-maps the
+file; opening it reads only the small bucket table, and sample() decodes one record.
+
+    python -m content --out packs/default.pack                       # seed questions only
+    python -m content --import extra.jsonl --generate 200 --workers 8   # plus imports and model output
+
+Sources are JSONL lines {"kind": "LC"|"SD"|"BH", "difficulty": ..., <question fields>};
+packs/seed.jsonl is always included. --generate asks the model for N more per bucket,
+cycling the SD topics and BH themes. Records are validated with the llm_json schemas,
+near-duplicates within a bucket are dropped (dedup), and LC/SD grading artifacts are
+computed at build time.
+
+File layout (little-endian):
+    header   MAGIC, version u16, buckets u16, records u32
+    buckets  kind 2s, difficulty u8, pad, first record u32, count u32
+    offsets  (records + 1) x u32, relative to the data section
+    data     UTF-8 JSON question objects
+"""
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from settings import get_settings
+
+CONTENT_PACK = get_settings().content_pack  # empty string disables packs
+SEED_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "packs", "seed.jsonl")
+
+MAGIC = b"IVQP"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHHI")
+_BUCKET = struct.Struct("<2sBxII")
+_OFFSET = struct.Struct("<I")
+
+KINDS = ("LC", "SD", "BH")
+DIFFS = ("EASY", "MEDIUM", "HARD")
+_SCHEMA_OF = {"LC": "lc_question", "SD": "sd_question", "BH": "beh_question"}
+
+
+def _debug(msg: str):
+    print(f"[content] {msg}")
+
+
+# ---------- Reading ----------
+
+class ContentPack:
+    """A memory-mapped pack; sample() is O(1) and decodes a single record."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_buckets, n_records = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} content pack")
+        self.buckets: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        pos = _HEADER.size
+        for _ in range(n_buckets):
+            kind, diff, first, count = _BUCKET.unpack_from(self._mm, pos)
+            self.buckets[(kind.decode("ascii"), DIFFS[diff])] = (first, count)
+            pos += _BUCKET.size
+        self._offsets = pos
+        self._data = pos + (n_records + 1) * _OFFSET.size
+        self.records = n_records
+
+    def count(self, kind: str, diff: str) -> int:
+        return self.buckets.get((kind, diff), (0, 0))[1]
+
+    def record(self, i: int) -> Dict[str, Any]:
+        start, end = struct.unpack_from("<II", self._mm, self._offsets + i * _OFFSET.size)
+        return json.loads(self._mm[self._data + start:self._data + end])
+
+    def sample(self, kind: str, diff: str, rng: random.Random = None) -> Optional[Dict[str, Any]]:
+        first, count = self.buckets.get((kind, diff), (0, 0))
+        if not count:
+            return None
+        return self.record(first + (rng or random).randrange(count))
+
+
+_PACK: Optional[ContentPack] = None
+_PACK_LOADED = False
+_PACK_LOCK = threading.Lock()
+
+
+def get_pack() -> Optional[ContentPack]:
+    """The configured pack, opened on first use; None when missing or unreadable."""
+    global _PACK, _PACK_LOADED
+    if _PACK_LOADED:
+        return _PACK
+    with _PACK_LOCK:
+        if not _PACK_LOADED:
+            if CONTENT_PACK and os.path.exists(CONTENT_PACK):
+                try:
+                    t0 = time.perf_counter()
+                    _PACK = ContentPack(CONTENT_PACK)
+                    _debug(f"opened {CONTENT_PACK}: {_PACK.records} questions "
+                           f"in {(time.perf_counter() - t0) * 1e3:.1f}ms")
+                except Exception as e:
+                    _debug(f"cannot open {CONTENT_PACK}: {type(e).__name__}: {e}")
+            _PACK_LOADED = True
+    return _PACK
+
+
+def sample(kind: str, diff: str, rng: random.Random = None) -> Optional[Dict[str, Any]]:
+    """A random pack question for the bucket, or None when there is no pack or the bucket is empty."""
+    pack = get_pack()
+    return pack.sample(kind, diff, rng) if pack is not None else None
+
+
+# ---------- Building ----------
+
+def read_jsonl(path: str) -> List[Dict[str, Any]]:
+    out = []
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                out.append(json.loads(line))
+            except ValueError as e:
+                _debug(f"{path}:{n}: skipped, {e}")
+    return out
+
+
+def _generate(kind: str, diff: str, i: int) -> Dict[str, Any]:
+    import logic
+    if kind == "LC":
+        q = logic.generate_lc_question(diff)
+    elif kind == "SD":
+        q = logic.generate_sd_prompt(diff, topic=logic.SD_TOPICS[i % len(logic.SD_TOPICS)])
+    else:
+        q = logic.generate_beh_prompt(diff, theme=logic.BH_THEMES[i % len(logic.BH_THEMES)])
+    return {"kind": kind, "difficulty": diff, **q}
+
+
+def generate(per_bucket: int, workers: int) -> List[Dict[str, Any]]:
+    """per_bucket model-generated questions for every bucket. Needs a configured model."""
+    import logic
+    if logic._maybe_client() is None:
+        raise SystemExit(f"--generate needs a model: {logic.llm_status()['last_llm_error']}")
+    jobs = [(k, d, i) for k in KINDS for d in DIFFS for i in range(per_bucket)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda job: _generate(*job), jobs))
+
+
+def _prepare(items: List[Dict[str, Any]]) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+    """Validated, de-duplicated questions per bucket, with grading artifacts attached."""
+    from dedup import SimIndex, signature, question_text
+    from judge import lc_artifacts, sd_artifacts
+    from llm_json import SCHEMAS, SchemaError, validate
+
+    buckets: Dict[Tuple[str, str], List[Dict[str, Any]]] = {(k, d): [] for k in KINDS for d in DIFFS}
+    index = {b: SimIndex() for b in buckets}
+    dropped = {"invalid": 0, "duplicate": 0}
+    for item in items:
+        b = (str(item.get("kind", "")).upper(), str(item.get("difficulty", "")).upper())
+        if b not in buckets:
+            dropped["invalid"] += 1
+            continue
+        try:
+            q = validate(item, SCHEMAS[_SCHEMA_OF[b[0]]])
+        except SchemaError:
+            dropped["invalid"] += 1
+            continue
+        if not index[b].add(signature(question_text(q)))[1]:
+            dropped["duplicate"] += 1
+            continue
+        if b[0] == "LC":
+            q = {"examples": [], "hints": [], **q}
+            q["grading"] = lc_artifacts(q)
+        elif b[0] == "SD":
+            q["grading"] = sd_artifacts(q["rubric"])
+        else:
+            q = {"tip": "", **q}
+        buckets[b].append(q)
+    _debug(f"dropped {dropped['invalid']} invalid, {dropped['duplicate']} near-duplicate")
+    return buckets
+
+
+def write_pack(path: str, buckets: Dict[Tuple[str, str], List[Dict[str, Any]]]):
+    table, offsets, blobs = [], [0], []
+    first = 0
+    for (kind, diff), qs in buckets.items():
+        table.append(_BUCKET.pack(kind.encode("ascii"), DIFFS.index(diff), first, len(qs)))
+        for q in qs:
+            blob = json.dumps(q, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            blobs.append(blob)
+            offsets.append(offsets[-1] + len(blob))
+        first += len(qs)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(table), first))
+        f.write(b"".join(table))
+        f.write(b"".join(_OFFSET.pack(o) for o in offsets))
+        f.write(b"".join(blobs))
+    os.replace(tmp, path)  # servers holding the old map keep reading the old inode
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--out", default=CONTENT_PACK or "packs/default.pack", help="pack file to write")
+    ap.add_argument("--import", dest="imports", action="append", default=[], help="extra JSONL source (repeatable)")
+    ap.add_argument("--generate", type=int, default=0, help="model-generated questions per bucket")
+    ap.add_argument("--workers", type=int, default=4, help="concurrent model requests for --generate")
+    ap.add_argument("--no-seed", action="store_true", help=f"leave out {os.path.relpath(SEED_FILE)}")
+    args = ap.parse_args(argv)
+
+    items: List[Dict[str, Any]] = [] if args.no_seed else read_jsonl(SEED_FILE)
+    for path in args.imports:
+        items.extend(read_jsonl(path))
+    if args.generate:
+        items.extend(generate(args.generate, args.workers))
+
+    buckets = _prepare(items)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    write_pack(args.out, buckets)
+    for (kind, diff), qs in buckets.items():
+        print(f"{kind} {diff:<6} {len(qs):>6}", file=sys.stderr)
+    print(f"[content] wrote {args.out} ({os.path.getsize(args.out):,} bytes)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+# dedup.py
+"""
+Near-duplicate detection for generated questions.
+
+Each question is reduced to a MinHash signature (HASHES 32-bit minima) over the normalized
+terms of its title and statement. The signature is cut into BANDS bands of ROWS rows. Two
+questions sharing any band are candidates (LSH); a candidate counts as a duplicate when the
+signatures agree on at least THRESHOLD of their rows, i.e. estimated Jaccard >= THRESHOLD.
+Lookups only touch the matching band buckets, so they stay flat as the index grows.
+Per-game seen-sets are the packed band keys of the questions already shown.
+"""
+import base64
+import hashlib
+import re
+import threading
+from array import array
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+from settings import get_settings
+
+BANDS = 8
+ROWS = 4
+HASHES = BANDS * ROWS
+THRESHOLD = get_settings().dedup_threshold
+# A game lasts ~20 turns; keep some headroom and forget the oldest beyond that
+SEEN_CAP = get_settings().dedup_seen_cap
+
+_MASK64 = (1 << 64) - 1
+_PRIME = 0x100000001B3
+_WORD = re.compile(r"[a-z0-9]+")
+_STOP = frozenset("a an the of to in on for and or with is are be by at as it its from that this which "
+                  "your you return given find".split())
+
+
+def _debug(msg: str):
+    print(f"[dedup] {msg}")
+
+
+def _seeds(n: int) -> List[Tuple[int, int]]:
+    out = []
+    for i in range(n):
+        d = hashlib.blake2b(f"minhash-{i}".encode("ascii"), digest_size=16).digest()
+        out.append((int.from_bytes(d[:8], "little") | 1, int.from_bytes(d[8:], "little")))
+    return out
+
+
+# Fixed seeds so every worker computes the same signature for the same text
+_SEEDS = _seeds(HASHES)
+
+
+# ---------- Signatures ----------
+
+def question_text(q: Dict[str, Any]) -> str:
+    """The parts of a generated question that identify it (title plus statement)."""
+    q = q or {}
+    return f"{q.get('title', '')} {q.get('question') or q.get('prompt') or ''}"
+
+
+def _terms(text: str) -> set:
+    out = set()
+    for w in _WORD.findall(text.lower()):
+        if w in _STOP:
+            continue
+        if len(w) > 3 and w.endswith("s") and not w.endswith("ss"):
+            w = w[:-1]
+        out.add(w)
+    return out
+
+
+_TERM_CACHE: Dict[str, int] = {}
+
+
+def _term_hash(t: str) -> int:
+    h = _TERM_CACHE.get(t)
+    if h is None:
+        h = int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "little")
+        if len(_TERM_CACHE) < 200_000:
+            _TERM_CACHE[t] = h
+    return h
+
+
+def signature(text: str) -> Tuple[int, ...]:
+    hs = [_term_hash(t) for t in _terms(text)] or [0]
+    return tuple(min(((h * a + b) & _MASK64) >> 32 for h in hs) for a, b in _SEEDS)
+
+
+def band_keys(sig: Tuple[int, ...]) -> List[int]:
+    """One 32-bit key per band; the band index is mixed in so bands never collide with each other."""
+    keys = []
+    for b in range(BANDS):
+        k = b + 1
+        for r in sig[b * ROWS:(b + 1) * ROWS]:
+            k = ((k ^ r) * _PRIME) & _MASK64
+        keys.append((k ^ (k >> 32)) & 0xFFFFFFFF)
+    return keys
+
+
+def similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / HASHES
+
+
+# ---------- Process-wide index ----------
+
+class SimIndex:
+    """Insert-time dedup over every question this process has generated."""
+
+    def __init__(self, threshold: float = THRESHOLD):
+        self.threshold = threshold
+        self._sigs = array("I")  # HASHES entries per stored question
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(BANDS)]
+        self._lock = threading.Lock()  # request threads and the question-pool refiller both add
+
+    def __len__(self) -> int:
+        return len(self._sigs) // HASHES
+
+    def _sig(self, qid: int) -> Tuple[int, ...]:
+        return tuple(self._sigs[qid * HASHES:(qid + 1) * HASHES])
+
+    def find(self, sig: Tuple[int, ...], keys: Optional[List[int]] = None) -> Optional[int]:
+        """Id of a stored near-duplicate, or None."""
+        with self._lock:
+            return self._find(sig, keys)
+
+    def _find(self, sig: Tuple[int, ...], keys: Optional[List[int]]) -> Optional[int]:
+        checked = set()
+        for b, key in enumerate(keys or band_keys(sig)):
+            for qid in self._buckets[b].get(key, ()):
+                if qid in checked:
+                    continue
+                checked.add(qid)
+                if similarity(self._sig(qid), sig) >= self.threshold:
+                    return qid
+        return None
+
+    def add(self, sig: Tuple[int, ...]) -> Tuple[int, bool]:
+        """Store sig unless a near-duplicate exists. Returns (id, inserted)."""
+        keys = band_keys(sig)
+        with self._lock:
+            dup = self._find(sig, keys)
+            if dup is not None:
+                return dup, False
+            qid = len(self)
+            self._sigs.extend(sig)
+            for b, key in enumerate(keys):
+                self._buckets[b].setdefault(key, []).append(qid)
+        return qid, True
+
+
+QUESTIONS = SimIndex()
+
+
+# ---------- Per-game seen-sets ----------
+
+class SeenSet:
+    """
+    Band keys of questions already shown in one game, packed 4 bytes each for the state blob
+    (32 bytes a question, ~640 for a 20-turn game). Not a bitset: hashing keys into a few
+    hundred bytes of bits would call a fresh question "seen" far too often, and a bitset cannot
+    forget its oldest entries at SEEN_CAP.
+    """
+
+    __slots__ = ("keys",)
+
+    def __init__(self, packed: Union[bytes, str, None] = None):
+        self.keys = array("I")
+        if packed:
+            self.keys.frombytes(packed if isinstance(packed, bytes) else base64.b64decode(packed))
+
+    def near(self, sig: Tuple[int, ...]) -> bool:
+        # Sharing a band is the LSH candidate test; with few entries that is precise enough
+        keys = band_keys(sig)
+        seen = self.keys
+        return any(seen[i + b] == k for i in range(0, len(seen), BANDS) for b, k in enumerate(keys))
+
+    def add(self, sig: Tuple[int, ...]):
+        self.keys.extend(band_keys(sig))
+        if len(self.keys) > SEEN_CAP * BANDS:
+            del self.keys[:BANDS]
+
+    def to_bytes(self) -> bytes:
+        return self.keys.tobytes()
+
+    def pack(self) -> str:
+        return base64.b64encode(self.keys.tobytes()).decode("ascii")
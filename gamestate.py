@@ -0,0 +1,209 @@
+# gamestate.py
+# Compact single-player game state. Ownership is a 40-bit mask over board positions and house
+# counts are a bytearray indexed by position, so rule checks are bit tests instead of list scans.
+#
+# to_bytes()/from_bytes() is the persistence and cross-process format. A bare state is 26
+# bytes and a new game with its skill record ~78. The optional sections (skill, seen-set, and
+# the pending/prefetch/last_outcome dicts as JSON) are only written when set. Version 1 states
+# (no seed) still load. to_dict()/apply() speak the older JSON shape
+# ("owned" as [{"name": ...}], "houses" as {name: count}); the event log and API use it.
+#
+# Each game carries a seed. rng(stream) derives dice, card and question picks from
+# (seed, stream, rolls), so a roll's outcome is a function of the game alone: a commit that
+# retries after a version conflict redraws the same dice, and a replay of the seed and
+# answer log reproduces the game exactly (see replay.py).
+import base64
+import json
+import random
+import struct
+from typing import Dict, Any, List, Optional
+
+from board import BOARD
+
+FORMAT_VERSION = 2
+N_TILES = len(BOARD)
+POS_OF = {t.name: i for i, t in enumerate(BOARD)}
+
+_HEADER = struct.Struct("<BBBBii")  # version, pos, pos_prev, flags, offers, turns
+_RNG = struct.Struct("<II")  # seed, rolls (version 2+)
+_SKILL = struct.Struct("<3i3H18H")  # rating*10 per kind, answers per kind, (passes, attempts) per kind x diff
+
+# flags
+SKIP_TURN = 0x01
+EXTRA_ROLL = 0x02
+PASSED_START = 0x04
+HAS_SKILL = 0x10
+HAS_SEEN = 0x20
+HAS_EXTRA = 0x40
+
+_KINDS = ("LC", "SD", "BH")
+_DIFFS = ("EASY", "MEDIUM", "HARD")
+_EXTRA_FIELDS = ("pending", "prefetch", "last_outcome")
+
+FIELDS = ("pos", "pos_prev", "offers", "owned", "houses", "turns", "pending", "prefetch", "last_outcome",
+          "skip_turn", "extra_roll", "passed_start", "seen", "skill", "seed", "rolls")
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+class GameState:
+    __slots__ = ("pos", "pos_prev", "offers", "turns", "owned", "houses", "pending", "prefetch",
+                 "last_outcome", "skip_turn", "extra_roll", "passed_start", "seen", "skill", "seed", "rolls")
+
+    def __init__(self, turns: int = 20, seed: int = 0):
+        self.pos = 0
+        self.pos_prev = 0
+        self.offers = 0
+        self.turns = turns
+        self.owned = 0  # bit i set = board position i owned
+        self.houses = bytearray(N_TILES)  # house count per board position
+        self.pending: Optional[Dict[str, Any]] = None
+        self.prefetch: Optional[Dict[str, Any]] = None
+        self.last_outcome: Optional[Dict[str, Any]] = None
+        self.skip_turn = False
+        self.extra_roll = False
+        self.passed_start = False
+        self.seen = b""  # dedup.SeenSet bytes
+        self.skill: Optional[Dict[str, Any]] = None  # skill.new_skill() shape
+        self.seed = seed  # 0: saved before games were seeded
+        self.rolls = 0  # dice rolls so far; indexes the RNG streams
+
+    # ---------- Ownership ----------
+
+    def owns(self, pos: int) -> bool:
+        return bool(self.owned >> pos & 1)
+
+    def own(self, pos: int) -> bool:
+        """Mark pos owned; False if it already was."""
+        if self.owned >> pos & 1:
+            return False
+        self.owned |= 1 << pos
+        return True
+
+    def owns_all(self, mask: int) -> bool:
+        return self.owned & mask == mask
+
+    def owned_positions(self) -> List[int]:
+        return [i for i in range(N_TILES) if self.owned >> i & 1]
+
+    def owned_list(self) -> List[Dict[str, str]]:
+        return [{"name": BOARD[i].name} for i in self.owned_positions()]
+
+    def houses_map(self) -> Dict[str, int]:
+        return {BOARD[i].name: n for i, n in enumerate(self.houses) if n}
+
+    # ---------- Randomness ----------
+
+    def rng(self, stream: str, n: Optional[int] = None) -> random.Random:
+        """The stream's generator for roll n (default: the latest roll). Same game, same draws."""
+        return random.Random(f"{self.seed}:{stream}:{self.rolls if n is None else n}")
+
+    # ---------- JSON shape ----------
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pos": self.pos, "pos_prev": self.pos_prev, "offers": self.offers,
+            "owned": self.owned_list(), "houses": self.houses_map(), "turns": self.turns,
+            "pending": self.pending, "prefetch": self.prefetch, "last_outcome": self.last_outcome,
+            "skip_turn": self.skip_turn, "extra_roll": self.extra_roll, "passed_start": self.passed_start,
+            "seen": base64.b64encode(self.seen).decode("ascii"), "skill": self.skill,
+            "seed": self.seed, "rolls": self.rolls,
+        }
+
+    def apply(self, changes: Dict[str, Any]):
+        """Set fields from the JSON shape (a snapshot or an event's "set")."""
+        for k, v in changes.items():
+            if k == "owned":
+                self.owned = 0
+                for o in v or []:
+                    p = POS_OF.get(o.get("name") if isinstance(o, dict) else o)
+                    if p is not None:
+                        self.owned |= 1 << p
+            elif k == "houses":
+                self.houses = bytearray(N_TILES)
+                for name, n in (v or {}).items():
+                    if name in POS_OF:
+                        self.houses[POS_OF[name]] = min(int(n), 255)
+            elif k == "seen":
+                self.seen = base64.b64decode(v) if v else b""
+            elif k in FIELDS:
+                setattr(self, k, v)
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "GameState":
+        g = cls()
+        g.apply(d)
+        return g
+
+    # ---------- Binary format ----------
+
+    def to_bytes(self) -> bytes:
+        flags = (SKIP_TURN if self.skip_turn else 0) | (EXTRA_ROLL if self.extra_roll else 0) \
+            | (PASSED_START if self.passed_start else 0)
+        tail = []
+        if self.skill:
+            flags |= HAS_SKILL
+            sk = self.skill
+            tail.append(_SKILL.pack(*(int(round(sk[k][0] * 10)) for k in _KINDS), *(sk[k][1] for k in _KINDS),
+                                    *(x for k in _KINDS for d in _DIFFS for x in sk[f"{k}:{d}"])))
+        if self.seen:
+            flags |= HAS_SEEN
+            tail.append(struct.pack("<H", len(self.seen)) + self.seen)
+        extra = {k: getattr(self, k) for k in _EXTRA_FIELDS if getattr(self, k) is not None}
+        if extra:
+            flags |= HAS_EXTRA
+            blob = _dumps(extra).encode("utf-8")
+            tail.append(struct.pack("<I", len(blob)) + blob)
+        houses = [(i, n) for i, n in enumerate(self.houses) if n]
+        return b"".join([
+            _HEADER.pack(FORMAT_VERSION, self.pos, self.pos_prev, flags, self.offers, self.turns),
+            _RNG.pack(self.seed, self.rolls),
+            self.owned.to_bytes(5, "little"),
+            bytes([len(houses)]), bytes(b for pair in houses for b in pair),
+            *tail,
+        ])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "GameState":
+        version, pos, pos_prev, flags, offers, turns = _HEADER.unpack_from(data, 0)
+        if version not in (1, FORMAT_VERSION):
+            raise ValueError(f"unknown game state format {version}")
+        g = cls(turns)
+        g.pos, g.pos_prev, g.offers = pos, pos_prev, offers
+        g.skip_turn, g.extra_roll, g.passed_start = bool(flags & SKIP_TURN), bool(flags & EXTRA_ROLL), \
+            bool(flags & PASSED_START)
+        i = _HEADER.size
+        if version >= 2:
+            g.seed, g.rolls = _RNG.unpack_from(data, i)
+            i += _RNG.size
+        g.owned = int.from_bytes(data[i:i + 5], "little")
+        i += 5
+        n = data[i]
+        i += 1
+        for p, c in zip(data[i:i + 2 * n:2], data[i + 1:i + 2 * n:2]):
+            g.houses[p] = c
+        i += 2 * n
+        if flags & HAS_SKILL:
+            vals = _SKILL.unpack_from(data, i)
+            i += _SKILL.size
+            sk: Dict[str, Any] = {k: [vals[j] / 10.0, vals[3 + j]] for j, k in enumerate(_KINDS)}
+            rest = iter(vals[6:])
+            for k in _KINDS:
+                for d in _DIFFS:
+                    sk[f"{k}:{d}"] = [next(rest), next(rest)]
+            g.skill = sk
+        if flags & HAS_SEEN:
+            (n,) = struct.unpack_from("<H", data, i)
+            g.seen = bytes(data[i + 2:i + 2 + n])
+            i += 2 + n
+        if flags & HAS_EXTRA:
+            (n,) = struct.unpack_from("<I", data, i)
+            for k, v in json.loads(data[i + 4:i + 4 + n].decode("utf-8")).items():
+                setattr(g, k, v)
+        return g
+
+    def __repr__(self) -> str:
+        return f"GameState(pos={self.pos}, offers={self.offers}, turns={self.turns}, owned={self.owned:#012x}, " \
+               f"seed={self.seed}, rolls={self.rolls})"
@@ -0,0 +1,121 @@
+# grading.py
+"""
+Background grading jobs.
+
+POST /submit_answer claims the pending challenge for a job and returns its id right away;
+a bounded pool of GRADE_WORKERS threads runs the judge/model call and commits the verdict.
+Results stay in this process for GRADE_JOB_TTL_S so GET /grade/{job_id} can return or
+long-poll them. The game state records which job owns the pending challenge, so a poll
+that lands on another worker can still answer from the game itself.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+from settings import get_settings
+
+GRADE_WORKERS = get_settings().grade_workers
+GRADE_QUEUE = get_settings().grade_queue  # jobs allowed to wait for a worker
+GRADE_TIMEOUT_S = get_settings().grade_timeout_s  # after this a claimed challenge may be resubmitted
+GRADE_JOB_TTL_S = get_settings().grade_job_ttl_s
+
+
+def _debug(msg: str):
+    print(f"[grading] {msg}")
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class Job:
+    __slots__ = ("id", "gid", "status", "result", "error", "created", "finished", "future")
+
+    def __init__(self, job_id: str, gid: str):
+        self.id = job_id
+        self.gid = gid
+        self.status = "queued"  # queued -> running -> done | failed
+        self.result: Optional[Dict[str, Any]] = None
+        self.error = ""
+        self.created = time.time()
+        self.finished = 0.0
+        self.future: Optional[Future] = None
+
+    def view(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"ok": self.status != "failed", "job_id": self.id, "status": self.status}
+        if self.status == "done":
+            out.update(self.result or {})
+        elif self.status == "failed":
+            out["error"] = self.error
+        return out
+
+
+class JobQueue:
+    """Bounded pool; submit() refuses work beyond workers + max_queued instead of queueing without limit."""
+
+    def __init__(self, workers: int = GRADE_WORKERS, max_queued: int = GRADE_QUEUE, ttl_s: float = GRADE_JOB_TTL_S):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl_s = ttl_s
+        self.lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._inflight = 0
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="grade")
+        return self._pool
+
+    def _expire(self, now: float):
+        for jid in [jid for jid, j in self._jobs.items() if j.finished and now - j.finished > self.ttl_s]:
+            del self._jobs[jid]
+
+    def submit(self, job_id: str, gid: str, fn: Callable[[], Dict[str, Any]]) -> Optional[Job]:
+        """Queue fn; None when the pool and its queue are full."""
+        with self.lock:
+            if self._inflight >= self.workers + self.max_queued:
+                return None
+            self._expire(time.time())
+            job = Job(job_id, gid)
+            self._jobs[job_id] = job
+            self._inflight += 1
+            job.future = self._executor().submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[], Dict[str, Any]]):
+        job.status = "running"
+        try:
+            job.result = fn()
+            job.status = "done"
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = "failed"
+            _debug(f"job {job.id} for {job.gid} failed: {job.error}")
+        finally:
+            job.finished = time.time()
+            with self.lock:
+                self._inflight -= 1
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def wait(self, job: Job, timeout: float):
+        """Until the job finishes or timeout passes, without holding a thread."""
+        if job.future is None or job.future.done() or timeout <= 0:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job.future)), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"inflight": self._inflight, "workers": self.workers, "max_queued": self.max_queued,
+                    "tracked": len(self._jobs)}
+
+
+JOBS = JobQueue()
@@ -0,0 +1,385 @@
+# judge.py
+# Local first-pass judge. Scores an answer in well under a millisecond using:
+# - a concept lexicon (techniques, design components, STAR parts) with synonyms,
+# - per-question indexes (expected concepts + TF-IDF reference vector), built once and cached,
+# - unigram+bigram TF-IDF cosine against the question's reference text.
+# The combined score is compared with calibrated thresholds: >= PASS_AT is a confident pass,
+# <= FAIL_AT a confident fail, anything between is "ambiguous" and worth a model call.
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+
+from settings import get_settings
+
+PASS_AT = get_settings().judge_pass_at
+FAIL_AT = get_settings().judge_fail_at
+INDEX_CACHE_SIZE = 2048
+
+# ---------- Concept lexicon ----------
+# concept -> phrases (already lowercase; multi-word phrases are matched on the token stream)
+LC_CONCEPTS: Dict[str, List[str]] = {
+    "hash_map": ["hash map", "hashmap", "hash table", "hashtable", "dictionary", "dict", "map", "counter",
+                 "frequency", "freq"],
+    "set": ["set", "hash set", "hashset", "seen"],
+    "sliding_window": ["sliding window", "window", "shrink", "expand"],
+    "two_pointers": ["two pointers", "two pointer", "left pointer", "right pointer", "pointers"],
+    "prefix_sum": ["prefix sum", "prefix sums", "prefix", "running sum", "cumulative"],
+    "stack": ["stack", "monotonic stack", "push", "pop"],
+    "queue": ["queue", "deque", "fifo"],
+    "heap": ["heap", "priority queue", "min heap", "max heap"],
+    "linked_list": ["linked list", "doubly linked", "node", "head", "tail"],
+    "graph": ["graph", "adjacency", "edges", "indegree", "in degree", "neighbors"],
+    "bfs": ["bfs", "breadth first", "level order"],
+    "dfs": ["dfs", "depth first", "recursion", "recursive", "backtrack", "backtracking"],
+    "toposort": ["topological", "toposort", "topo sort", "kahn", "cycle detection", "cycle"],
+    "binary_search": ["binary search", "bisect", "lower bound"],
+    "sort": ["sort", "sorted", "sorting"],
+    "dp": ["dynamic programming", "dp", "memo", "memoize", "memoization", "tabulation"],
+    "greedy": ["greedy"],
+    "union_find": ["union find", "disjoint set", "dsu"],
+    "trie": ["trie", "prefix tree"],
+    "lowercase": ["lowercase", "lower case", "case insensitive", "normalize"],
+    "complexity": ["o n", "o 1", "o log n", "o n log n", "linear", "constant time", "log n", "time complexity",
+                   "space complexity"],
+}
+
+SD_CONCEPTS: Dict[str, List[str]] = {
+    "api": ["api", "endpoint", "endpoints", "rest", "grpc", "post", "get", "put", "protocol"],
+    "storage": ["database", "db", "storage", "store", "sql", "nosql", "kv", "key value", "blob", "s3", "table",
+                "schema", "data model", "metadata", "cassandra", "dynamo", "postgres", "mysql"],
+    "cache": ["cache", "caching", "redis", "memcached", "cdn", "hot keys", "hot key", "lru", "ttl"],
+    "sharding": ["shard", "sharding", "partition", "partitioning", "consistent hashing", "scale out",
+                 "horizontal"],
+    "replication": ["replica", "replicas", "replication", "multi region", "failover", "leader", "follower"],
+    "consistency": ["consistency", "consistent", "eventual", "strong", "idempotent", "idempotency", "ordering",
+                    "transaction", "quorum", "conditional"],
+    "queue": ["queue", "kafka", "pubsub", "pub sub", "stream", "fanout", "fan out", "fanin", "fan in", "retry",
+              "retries", "async", "worker", "workers"],
+    "scaling": ["scale", "scaling", "load balancer", "autoscale", "throughput", "qps", "rps", "latency",
+                "bottleneck", "bottlenecks"],
+    "keys": ["key generation", "key gen", "base62", "hash", "collision", "collisions", "counter", "id"],
+    "index": ["index", "indexes", "indices", "secondary index"],
+    "observability": ["monitoring", "metrics", "observability", "logging", "alerts", "tracing"],
+    "security": ["auth", "encryption", "e2ee", "key management", "tls", "keys"],
+    "tradeoffs": ["tradeoff", "tradeoffs", "trade off", "trade offs", "versus", "vs", "instead", "downside",
+                  "cost"],
+}
+
+BH_CONCEPTS: Dict[str, List[str]] = {
+    "situation": ["situation", "context", "background", "when i was", "at my", "on a project", "our team",
+                  "we had", "there was"],
+    "task": ["task", "goal", "objective", "responsible", "my role", "needed to", "had to", "challenge", "deadline"],
+    "action": ["action", "actions", "i led", "i built", "i wrote", "i proposed", "i organized", "i set up",
+               "i talked", "i met", "i decided", "i created", "i drove", "i worked", "i ran", "i implemented",
+               "i negotiated", "i aligned"],
+    "result": ["result", "results", "outcome", "impact", "shipped", "delivered", "reduced", "increased",
+               "improved", "saved", "launched", "learned", "cut"],
+}
+
+STOPWORDS = frozenset("""
+a an the and or but if then else of to in on for with by at from as is are was were be been it its this that
+these those i we you they he she them our my your their me us so not no do does did can could would should will
+just than too very into over under about up down out off again more most some such only own same any each both
+all how what which who whom why where when while there here use using used return returns""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_NUMBER = re.compile(r"\d")
+
+
+def _stem(w: str) -> str:
+    # Deliberately tiny: enough to fold plurals/tenses for matching, not linguistics
+    for suf in ("ings", "ing", "ied", "ies", "ed", "es", "s"):
+        if len(w) > len(suf) + 2 and w.endswith(suf):
+            return w[: -len(suf)] + ("y" if suf in ("ied", "ies") else "")
+    return w
+
+
+def tokens(text: str) -> List[str]:
+    return _TOKEN.findall((text or "").lower())
+
+
+def content_terms(toks: Iterable[str]) -> List[str]:
+    """Stemmed unigrams without stopwords, plus bigrams of those."""
+    uni = [_stem(t) for t in toks if t not in STOPWORDS]
+    return uni + [f"{a} {b}" for a, b in zip(uni, uni[1:])]
+
+
+class Lexicon:
+    """Maps token n-grams (up to 3) to concepts; built once per concept table."""
+
+    def __init__(self, table: Dict[str, List[str]]):
+        self.by_phrase: Dict[Tuple[str, ...], str] = {}
+        self.max_len = 1
+        for concept, phrases in table.items():
+            for ph in phrases:
+                key = tuple(_stem(t) for t in tokens(ph))
+                if key:
+                    self.by_phrase.setdefault(key, concept)
+                    self.max_len = max(self.max_len, len(key))
+
+    def concepts(self, toks: List[str]) -> set:
+        st = [_stem(t) for t in toks]
+        found = set()
+        for n in range(1, self.max_len + 1):
+            for i in range(len(st) - n + 1):
+                c = self.by_phrase.get(tuple(st[i:i + n]))
+                if c:
+                    found.add(c)
+        return found
+
+
+LC_LEX = Lexicon(LC_CONCEPTS)
+SD_LEX = Lexicon(SD_CONCEPTS)
+BH_LEX = Lexicon(BH_CONCEPTS)
+
+
+# ---------- TF-IDF ----------
+
+def _background_docs() -> List[str]:
+    docs = [" ".join(v) for table in (LC_CONCEPTS, SD_CONCEPTS, BH_CONCEPTS) for v in table.values()]
+    docs += [
+        "scan the array once and return the index", "count the number of subarrays", "return the length",
+        "design a service that stores and serves data for users", "tell me about a time you",
+        "the candidate explains the approach step by step", "iterate over each element and update the answer",
+    ]
+    return docs
+
+
+class Idf:
+    def __init__(self, docs: List[str]):
+        df: Dict[str, int] = {}
+        for d in docs:
+            for t in set(content_terms(tokens(d))):
+                df[t] = df.get(t, 0) + 1
+        self.n = len(docs)
+        self.idf = {t: math.log((1 + self.n) / (1 + c)) + 1.0 for t, c in df.items()}
+        self.default = math.log(1 + self.n) + 1.0
+
+    def vector(self, terms: List[str]) -> Dict[str, float]:
+        tf: Dict[str, int] = {}
+        for t in terms:
+            tf[t] = tf.get(t, 0) + 1
+        vec = {t: (1.0 + math.log(c)) * self.idf.get(t, self.default) for t, c in tf.items()}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {t: v / norm for t, v in vec.items()}
+
+
+IDF = Idf(_background_docs())
+
+
+def cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(t, 0.0) for t, v in a.items())
+
+
+# ---------- Per-question indexes ----------
+
+class QuestionIndex:
+    __slots__ = ("kind", "expected", "ref_vec", "rubric_terms")
+
+    def __init__(self, kind: str, expected: set, ref_vec: Dict[str, float], rubric_terms: List[set]):
+        self.kind = kind
+        self.expected = expected
+        self.ref_vec = ref_vec
+        self.rubric_terms = rubric_terms
+
+
+_INDEX: "OrderedDict[Any, QuestionIndex]" = OrderedDict()
+_INDEX_LOCK = threading.Lock()  # graders run on the threadpool
+
+
+def _cached(key: Any, build) -> QuestionIndex:
+    """LRU of built indexes; a build runs outside the lock (two racing builds are identical)."""
+    with _INDEX_LOCK:
+        idx = _INDEX.get(key)
+        if idx is not None:
+            _INDEX.move_to_end(key)
+            return idx
+    idx = build()
+    with _INDEX_LOCK:
+        _INDEX[key] = idx
+        while len(_INDEX) > INDEX_CACHE_SIZE:
+            _INDEX.popitem(last=False)
+    return idx
+
+
+def lc_index(question: Dict[str, Any]) -> QuestionIndex:
+    q = question or {}
+    key = ("LC", q.get("title", ""), q.get("question", ""), tuple(str(h) for h in (q.get("hints") or [])))
+
+    def build():
+        art = _valid(q.get("grading")) or lc_artifacts(q)
+        return QuestionIndex("LC", set(art["techniques"]), IDF.vector(art["terms"]), [])
+
+    return _cached(key, build)
+
+
+def sd_index(rubric: List[str], grading: Optional[Dict[str, Any]] = None) -> QuestionIndex:
+    items = [str(r) for r in (rubric or [])]
+    key = ("SD", tuple(items))
+
+    def build():
+        art = _valid(grading) or sd_artifacts(items)
+        return QuestionIndex("SD", set(art["concepts"]), IDF.vector(art["terms"]), [set(t) for t in art["items"]])
+
+    return _cached(key, build)
+
+
+# ---------- Grading artifacts ----------
+# Built once when a question is generated and stored with it as question["grading"], so
+# neither the local judge nor the model prompt re-derives them for every answer.
+
+ARTIFACT_VERSION = 1
+
+
+def _valid(art: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    return art if isinstance(art, dict) and art.get("v") == ARTIFACT_VERSION else None
+
+
+def lc_artifacts(question: Dict[str, Any]) -> Dict[str, Any]:
+    q = question or {}
+    hint_toks = tokens(" ".join(str(h) for h in (q.get("hints") or [])))
+    all_toks = tokens(" ".join([str(q.get("title", "")), str(q.get("question", ""))])) + hint_toks
+    # Hints name the intended technique; fall back to whatever the statement mentions
+    expected = LC_LEX.concepts(hint_toks) or LC_LEX.concepts(all_toks)
+    expected.discard("complexity")
+    return {"v": ARTIFACT_VERSION, "techniques": sorted(expected), "terms": sorted(set(content_terms(all_toks)))}
+
+
+def sd_artifacts(rubric: List[str]) -> Dict[str, Any]:
+    items = []
+    for r in rubric or []:
+        rt = tokens(str(r))
+        terms = {_stem(t) for t in rt if t not in STOPWORDS and len(t) > 1}
+        terms |= {"@" + c for c in SD_LEX.concepts(rt)}
+        items.append(sorted(terms))
+    all_toks = tokens(" ".join(str(r) for r in rubric or []))
+    return {"v": ARTIFACT_VERSION, "concepts": sorted(SD_LEX.concepts(all_toks)), "items": items,
+            "terms": sorted(set(content_terms(all_toks)))}
+
+
+def model_context(kind: str, question: Dict[str, Any]) -> str:
+    """Compact question summary for the model grader, built from the stored artifacts."""
+    q = question or {}
+    if kind == "LC":
+        art = _valid(q.get("grading")) or lc_artifacts(q)
+        tech = ", ".join(t.replace("_", " ") for t in art["techniques"]) or "any correct approach"
+        return f"Question: {q.get('title', '')} - {q.get('question', '')}\nIntended technique: {tech}"
+    if kind == "SD":
+        art = _valid(q.get("grading")) or sd_artifacts(q.get("rubric") or [])
+        concepts = ", ".join(c.replace("_", " ") for c in art["concepts"])
+        return f"Rubric: {'; '.join(str(r) for r in q.get('rubric') or [])}\nKey concepts: {concepts}"
+    return ""
+
+
+# ---------- Scoring ----------
+
+def _verdict(score: float, detail: Dict[str, Any]) -> Dict[str, Any]:
+    if score >= PASS_AT:
+        verdict = "pass"
+    elif score <= FAIL_AT:
+        verdict = "fail"
+    else:
+        verdict = "ambiguous"
+    return {"score": round(score, 4), "verdict": verdict, "confident": verdict != "ambiguous",
+            "correct": score >= (PASS_AT + FAIL_AT) / 2, **detail}
+
+
+def _length_factor(n_words: int, lo: int, hi: int) -> float:
+    if n_words <= lo:
+        return 0.0
+    return min(1.0, (n_words - lo) / float(hi - lo))
+
+
+def judge_lc(question: Dict[str, Any], text: str) -> Dict[str, Any]:
+    idx = lc_index(question)
+    toks = tokens(text)
+    found = LC_LEX.concepts(toks)
+    techniques = found - {"complexity", "lowercase"}
+    coverage = len(idx.expected & found) / len(idx.expected) if idx.expected else (1.0 if techniques else 0.0)
+    sim = cosine(IDF.vector(content_terms(toks)), idx.ref_vec)
+    length = _length_factor(len(toks), 5, 30)
+    score = (0.50 * coverage + 0.20 * min(1.0, sim * 2.5) + 0.15 * length
+             + 0.10 * (1.0 if techniques else 0.0) + 0.05 * (1.0 if "complexity" in found else 0.0))
+    if len(toks) < 8:
+        score = min(score, FAIL_AT)  # a phrase is not an approach
+    missing = sorted(idx.expected - found)
+    return _verdict(score, {"coverage": round(coverage, 3), "similarity": round(sim, 3), "missing": missing})
+
+
+def judge_sd(rubric: List[str], text: str, grading: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    idx = sd_index(rubric, grading)
+    toks = tokens(text)
+    stems = {_stem(t) for t in toks}
+    concepts = SD_LEX.concepts(toks)
+    feats = stems | {"@" + c for c in concepts}
+    hit = [bool(rt & feats) for rt in idx.rubric_terms]
+    coverage = sum(hit) / len(hit) if hit else min(1.0, len(concepts) / 5.0)
+    breadth = min(1.0, len(concepts) / 6.0)
+    sim = cosine(IDF.vector(content_terms(toks)), idx.ref_vec)
+    length = _length_factor(len(toks), 15, 80)
+    score = 0.55 * coverage + 0.20 * breadth + 0.10 * min(1.0, sim * 2.5) + 0.15 * length
+    if len(toks) < 12:
+        score = min(score, FAIL_AT)
+    missing = [r for r, h in zip(rubric or [], hit) if not h]
+    return _verdict(score, {"coverage": round(coverage, 3), "similarity": round(sim, 3), "missing": missing})
+
+
+def judge_beh(text: str) -> Dict[str, Any]:
+    toks = tokens(text)
+    parts = BH_LEX.concepts(toks)
+    quantified = bool(_NUMBER.search(text or ""))
+    first_person = sum(1 for t in toks if t == "i") >= 2
+    length = _length_factor(len(toks), 20, 90)
+    score = (0.60 * len(parts) / 4.0 + 0.15 * (1.0 if quantified else 0.0)
+             + 0.10 * (1.0 if first_person else 0.0) + 0.15 * length)
+    if len(toks) < 15:
+        score = min(score, FAIL_AT)
+    missing = [p for p in ("situation", "task", "action", "result") if p not in parts]
+    return _verdict(score, {"coverage": round(len(parts) / 4.0, 3), "quantified": quantified, "missing": missing})
+
+
+# ---------- Calibration ----------
+
+def calibrate(samples: List[Tuple[float, bool]], target_precision: float = 0.95) -> Tuple[float, float]:
+    """
+    Pick (fail_at, pass_at) from labeled (score, correct) pairs so that confident verdicts on
+    each side are right at least target_precision of the time, while keeping the ambiguous
+    band as narrow as possible. Feed it judge_* scores on a labeled corpus.
+    """
+    s = sorted(samples)
+    pass_at = 1.01
+    for i in range(len(s)):
+        above = s[i:]
+        if above and sum(1 for _, ok in above if ok) / len(above) >= target_precision:
+            pass_at = s[i][0]
+            break
+    fail_at = -0.01
+    for i in range(len(s) - 1, -1, -1):
+        below = s[: i + 1]
+        if below and sum(1 for _, ok in below if not ok) / len(below) >= target_precision:
+            fail_at = s[i][0]
+            break
+    if fail_at >= pass_at:
+        mid = (fail_at + pass_at) / 2
+        fail_at, pass_at = mid - 1e-6, mid + 1e-6
+    return round(fail_at, 4), round(pass_at, 4)
+
+
+def feedback_for(kind: str, res: Dict[str, Any]) -> str:
+    missing = res.get("missing") or []
+    if res["correct"]:
+        return {"LC": "Good. Clear steps and appropriate data structures.",
+                "SD": "Solid coverage of key items.",
+                "BH": "Clear STAR structure with a concrete outcome."}[kind]
+    if kind == "LC":
+        tip = f" Consider: {', '.join(m.replace('_', ' ') for m in missing[:2])}." if missing else ""
+        return "Evaluated locally. Outline clear steps and name the structures." + tip
+    if kind == "SD":
+        tip = f" Missing: {', '.join(missing[:3])}." if missing else ""
+        return "Cover API, storage, scaling, consistency, and one tradeoff." + tip
+    tip = f" Missing: {', '.join(missing)}." if missing else ""
+    return "Use STAR with specific actions and a measurable result." + tip
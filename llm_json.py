@@ -0,0 +1,235 @@
+# llm_json.py
+"""
+JSON extraction and validation for model output.
+
+ObjectScanner finds balanced {...} spans in one pass. It only stops on brace, quote and
+backslash characters, tracks string/escape state, and can be fed a response in chunks
+as it streams. extract() tries a plain json.loads first, then the scanned spans
+(outermost first, nesting bounded by MAX_DEPTH), so the decode work stays linear in the
+response size. When nothing decodes, salvage() pulls the schema's fields out one by one
+and keeps truncated strings and the complete items of truncated lists.
+
+parse() is the entry point for logic.py. It extracts the object and validates it against
+one of the SCHEMAS below, coercing types and clamping lengths to the limits in prompts.py.
+"""
+import json
+import re
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+
+MAX_DEPTH = 3  # nesting levels whose spans are tried as candidates
+SALVAGE_TRIES = 3  # occurrences of a key tried before giving up on that field
+
+_TOKENS = re.compile(r'[{}"\\]')
+_DECODER = json.JSONDecoder(strict=False)  # models put raw newlines inside strings
+# Deeply nested input makes the C decoder raise RecursionError; treat it like any bad JSON
+_DECODE_ERRORS = (ValueError, RecursionError)
+_WS = " \t\r\n"
+
+
+def _debug(msg: str):
+    print(f"[llm_json] {msg}")
+
+
+class SchemaError(ValueError):
+    pass
+
+
+# ---------- Scanning ----------
+
+class ObjectScanner:
+    """Incremental balanced-brace scanner; feed() text, read .spans as (depth, start, end)."""
+
+    def __init__(self):
+        self.spans: List[Tuple[int, int, int]] = []
+        self.opened: List[int] = []  # start offsets of objects still open
+        self.offset = 0
+        self.in_str = False
+        self.escape = False
+
+    def feed(self, chunk: str):
+        base = self.offset
+        skip_to = 0
+        if self.escape:  # a backslash ended the previous chunk
+            self.escape = False
+            skip_to = 1
+        for m in _TOKENS.finditer(chunk, skip_to):
+            i = m.start()
+            if i < skip_to:
+                continue
+            ch = chunk[i]
+            if self.in_str:
+                if ch == "\\":
+                    if i + 1 >= len(chunk):
+                        self.escape = True
+                    skip_to = i + 2
+                elif ch == '"':
+                    self.in_str = False
+            elif ch == '"' and self.opened:  # quotes in prose outside any object are not strings
+                self.in_str = True
+            elif ch == "{":
+                self.opened.append(base + i)
+            elif ch == "}" and self.opened:
+                start = self.opened.pop()
+                depth = len(self.opened)
+                if depth < MAX_DEPTH:
+                    self.spans.append((depth, start, base + i + 1))
+        self.offset += len(chunk)
+
+
+def extract(text: str) -> Optional[Dict[str, Any]]:
+    """First JSON object in text, or None."""
+    text = text or ""
+    try:
+        obj = _DECODER.decode(text)
+        if isinstance(obj, dict):
+            return obj
+    except _DECODE_ERRORS:
+        pass
+    sc = ObjectScanner()
+    sc.feed(text)
+    for _, start, end in sorted(sc.spans):
+        try:
+            obj = _DECODER.decode(text[start:end])
+        except _DECODE_ERRORS:
+            continue
+        if isinstance(obj, dict):
+            return obj
+    return None
+
+
+# ---------- Salvage ----------
+
+def _value_at(text: str, i: int) -> Tuple[bool, Any]:
+    """Decode the value at text[i:], finishing a truncated string or list if needed."""
+    try:
+        return True, _DECODER.raw_decode(text, i)[0]
+    except _DECODE_ERRORS:
+        pass
+    if text.startswith('"', i):
+        try:
+            # Cut off mid-string: close it (dropping a dangling backslash)
+            return True, _DECODER.decode(text[i:].rstrip("\\") + '"')
+        except _DECODE_ERRORS:
+            return False, None
+    if text.startswith("[", i):
+        items, j = [], i + 1
+        while True:
+            while j < len(text) and text[j] in _WS + ",":
+                j += 1
+            if j >= len(text) or text[j] == "]":
+                return True, items
+            try:
+                v, j = _DECODER.raw_decode(text, j)
+            except _DECODE_ERRORS:
+                return True, items
+            items.append(v)
+    return False, None
+
+
+def salvage(text: str, keys) -> Dict[str, Any]:
+    """Whatever "key": value pairs can be recovered from broken JSON, first occurrence wins."""
+    out: Dict[str, Any] = {}
+    text = text or ""
+    for key in keys:
+        needle = json.dumps(key)
+        pos, tries = 0, 0
+        while tries < SALVAGE_TRIES:
+            i = text.find(needle, pos)
+            if i < 0:
+                break
+            pos = i + len(needle)
+            j = pos
+            while j < len(text) and text[j] in _WS:
+                j += 1
+            if j >= len(text) or text[j] != ":":
+                continue
+            j += 1
+            while j < len(text) and text[j] in _WS:
+                j += 1
+            tries += 1
+            ok, v = _value_at(text, j)
+            if ok:
+                out[key] = v
+                break
+    return out
+
+
+# ---------- Schemas ----------
+
+class Field(NamedTuple):
+    kind: type  # str, bool or list (of strings)
+    limit: int = 0  # max chars of a string or of each list item
+    items: int = 0  # max list items
+    required: bool = False
+
+
+SCHEMAS: Dict[str, Dict[str, Field]] = {
+    "lc_question": {
+        "title": Field(str, 45, required=True),
+        "question": Field(str, 240, required=True),
+        "examples": Field(list, 120, 2),
+        "hints": Field(list, 90, 3),
+    },
+    "sd_question": {
+        "title": Field(str, 45, required=True),
+        "prompt": Field(str, 240, required=True),
+        "rubric": Field(list, 80, 7, required=True),
+    },
+    "beh_question": {
+        "title": Field(str, 45, required=True),
+        "prompt": Field(str, 140, required=True),
+        "tip": Field(str, 90),
+    },
+    "score": {
+        "correct": Field(bool),
+        "pass_fail": Field(str, 16),
+        "feedback": Field(str, 160),
+    },
+}
+
+_TRUE = ("true", "pass", "correct", "yes", "1")
+_FALSE = ("false", "fail", "incorrect", "no", "0")
+
+
+def _text(v: Any, limit: int) -> str:
+    s = v if isinstance(v, str) else ("" if v is None else json.dumps(v) if isinstance(v, (dict, list)) else str(v))
+    s = s.strip().replace("\r", "")
+    return s[:limit] if limit else s
+
+
+def _coerce(f: Field, v: Any) -> Any:
+    if f.kind is bool:
+        if isinstance(v, bool):
+            return v
+        if isinstance(v, (int, float)):
+            return v != 0
+        s = str(v).strip().lower()
+        return True if s in _TRUE else False if s in _FALSE else None
+    if f.kind is list:
+        seq = v if isinstance(v, list) else [v]
+        items = [_text(x, f.limit) for x in seq if x is not None]
+        return [x for x in items if x][:f.items or None]
+    return _text(v, f.limit)
+
+
+def validate(obj: Dict[str, Any], schema: Dict[str, Field]) -> Dict[str, Any]:
+    """Schema fields of obj, coerced and clamped; raises SchemaError when a required one is empty."""
+    out: Dict[str, Any] = {}
+    for key, f in schema.items():
+        v = _coerce(f, obj[key]) if key in obj else None
+        if v in (None, "", []):
+            if f.required:
+                raise SchemaError(f"missing {key}")
+            continue
+        out[key] = v
+    return out
+
+
+def parse(text: str, kind: str) -> Dict[str, Any]:
+    """Validated object of SCHEMAS[kind] from a model response, salvaging partial output."""
+    schema = SCHEMAS[kind]
+    obj = extract(text)
+    if obj is None:
+        obj = salvage(text, schema)
+        _debug(f"{kind}: no complete object, salvaged {sorted(obj)}")
+    return validate(obj, schema)
@@ -1,39 +1,37 @@
 # logic.py
-import os
+import importlib.util
 import random
-from typing import Dict, Any, List
-
-# Load .env automatically for every teammate without IDE config
-try:
-    from dotenv import load_dotenv
-
-    load_dotenv(override=False)
-    _DOTENV_LOADED = True
-except Exception:
-    _DOTENV_LOADED = False
-
-# Optional OpenAI generation
-try:
-    from openai import OpenAI
-
-    _HAS_OPENAI_LIB = True
-except Exception:
-    _HAS_OPENAI_LIB = False
-
-OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-
-def _parse_bool(s: str) -> bool:
-    return str(s).strip().lower() in ("1", "true", "yes", "y", "on")
-
-
-if os.getenv("USE_LLM") is not None:
-    USE_LLM = _parse_bool(os.getenv("USE_LLM"))
-else:
-    USE_LLM = bool(OPENAI_API_KEY)
-
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+import content
+from answer_cache import ANSWERS
+from settings import get_settings
+from judge import judge_lc, judge_sd, judge_beh, feedback_for, lc_artifacts, sd_artifacts, model_context
+from llm_json import parse
+from model_router import complete
+from tracing import span
+
+_DOTENV_LOADED = get_settings().dotenv_loaded
+
+# Optional OpenAI generation. The SDK takes ~0.5s to import, so only check that it is installed
+# here and import it in _maybe_client() on first model use.
+_HAS_OPENAI_LIB = importlib.util.find_spec("openai") is not None
+
+OPENAI_MODEL = get_settings().openai_model
+OPENAI_API_KEY = get_settings().openai_api_key
+USE_LLM = get_settings().use_llm
+JUDGE_FIRST_PASS = get_settings().judge_first_pass
+
+# Varied per generated SD/BH question; content.py cycles through them when building packs
+SD_TOPICS = ["URL shortener", "rate limiter", "chat room", "news feed",
+             "image sharing", "metrics ingestion", "log aggregation"]
+BH_THEMES = ["conflict", "leadership", "failure", "ambiguity", "ownership"]
+
+_CLIENT = None  # built once, reused across requests and threads
 _LAST_LLM_ERROR: str = ""
+_LOCAL = threading.local()
 
 
 def _debug(msg: str):
@@ -52,7 +50,7 @@ def _client_status_detail() -> Dict[str, Any]:
 
 
 def _maybe_client():
-    global _LAST_LLM_ERROR
+    global _LAST_LLM_ERROR, _CLIENT
     _LAST_LLM_ERROR = ""
     if not USE_LLM:
         _LAST_LLM_ERROR = "USE_LLM is false"
@@ -66,20 +64,46 @@ def _maybe_client():
         _LAST_LLM_ERROR = "OPENAI_API_KEY not present in process environment"
         _debug("No OPENAI_API_KEY, using local judging")
         return None
+    if _CLIENT is not None:
+        return _CLIENT
     try:
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        from openai import OpenAI
+
+        _CLIENT = OpenAI(api_key=OPENAI_API_KEY)
         _debug(f"OpenAI client created, model={OPENAI_MODEL}")
-        return client
+        return _CLIENT
     except Exception as e:
         _LAST_LLM_ERROR = f"client init error: {type(e).__name__}: {e}"
         _debug(f"Failed to create OpenAI client, using local judging. Reason: {_LAST_LLM_ERROR}")
         return None
 
 
+@contextmanager
+def local_only():
+    """Inside this block generation and scoring on this thread skip the model (overload fallback)."""
+    prev = getattr(_LOCAL, "on", False)
+    _LOCAL.on = True
+    try:
+        yield
+    finally:
+        _LOCAL.on = prev
+
+
+def _client():
+    return None if getattr(_LOCAL, "on", False) else _maybe_client()
+
+
+def model_configured() -> bool:
+    """Whether settings allow a model at all; unlike _client() it never logs or touches the status."""
+    return USE_LLM and _HAS_OPENAI_LIB and bool(OPENAI_API_KEY)
+
+
 def llm_status() -> Dict[str, Any]:
+    # Reports what _maybe_client() would do without importing the SDK or building a client
+    ready = model_configured() and not _LAST_LLM_ERROR.startswith("client init")
     st = {
         **_client_status_detail(),
-        "mode": "openai" if _maybe_client() else "local",
+        "mode": "openai" if ready else "local",
     }
     _debug(f"llm_status: {st}")
     return st
@@ -94,10 +118,6 @@ LC_REWARDS: Dict[str, Dict[str, int]] = {
 
 
 # ---------- Utility helpers ----------
-def _clean(s: str) -> str:
-    return (s or "").strip().replace("\r", "")
-
-
 def _difficulty_norm(d: str) -> str:
     d = (d or "MEDIUM").upper()
     if d in ("EASY", "MEDIUM", "HARD"):
@@ -120,33 +140,40 @@ def _safe_bool_correct(obj: Dict[str, Any], default: bool = False) -> bool:
     return default
 
 
+# ---------- Grading artifacts ----------
+def _with_grading(kind: str, q: Dict[str, Any]) -> Dict[str, Any]:
+    # Derived once here and carried with the question, not re-derived per answer
+    try:
+        q["grading"] = lc_artifacts(q) if kind == "LC" else sd_artifacts(q.get("rubric") or [])
+    except Exception as e:
+        _debug(f"Grading artifacts failed for {kind}: {type(e).__name__}: {e}")
+    return q
+
+
 # ---------- LC generation ----------
-def generate_lc_question(difficulty: str) -> Dict[str, Any]:
+def generate_lc_question(difficulty: str, rng: Optional[random.Random] = None) -> Dict[str, Any]:
     from prompts import LC_QUESTION_PROMPT
     diff = _difficulty_norm(difficulty)
-    client = _maybe_client()
+    client = _client()
 
     if client:
         try:
             _debug("Generating LC question via OpenAI (JSON)")
-            resp = client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are an expert coding interviewer. Return strict JSON only."},
-                    {"role": "user", "content": LC_QUESTION_PROMPT.format(difficulty=diff)},
-                ],
-                response_format={"type": "json_object"},
-            )
-            import json
-            obj = json.loads(resp.choices[0].message.content or "{}")
-            title = _clean(str(obj.get("title", "")))[:45]
-            question = _clean(str(obj.get("question", "")))[:240]
-            examples = obj.get("examples") or []
-            hints = obj.get("hints") or []
-            return {"title": title, "question": question, "examples": examples[:2], "hints": hints[:3]}
+            with span("llm.generate.LC"):
+                reply = complete(client, "generate", "LC",
+                                 "You are an expert coding interviewer. Return strict JSON only.",
+                                 LC_QUESTION_PROMPT.format(difficulty=diff))
+            with span("parse.LC"):
+                obj = parse(reply, "lc_question")
+            return _with_grading("LC", {"examples": [], "hints": [], **obj})
         except Exception as e:
             _debug(f"OpenAI LC generation failed: {type(e).__name__}: {e}")
 
+    q = content.sample("LC", diff, rng)
+    if q is not None:
+        _debug("LC question from content pack")
+        return q
+
     _debug("Generating LC question locally (compact)")
     bank = {
         "EASY": [
@@ -192,78 +219,75 @@ def generate_lc_question(difficulty: str) -> Dict[str, Any]:
             },
         ],
     }
-    return random.choice(bank[_difficulty_norm(difficulty)])
+    return _with_grading("LC", dict((rng or random).choice(bank[_difficulty_norm(difficulty)])))
 
 
 # ---------- LC scoring ----------
 def score_lc_answer(question: Dict[str, Any], text: str) -> Dict[str, Any]:
-    client = _maybe_client()
+    with span("judge.local.LC"):
+        local = judge_lc(question, text)
+    if JUDGE_FIRST_PASS and local["confident"]:
+        _debug(f"LC judged locally with confidence (score={local['score']})")
+        return {"correct": local["correct"], "feedback": feedback_for("LC", local), "judge_source": "local"}
+
+    client = _client()
     if client:
+        cached = ANSWERS.lookup("LC", question, text)
+        if cached.reused:
+            _debug(f"LC verdict reused from a graded paraphrase (similarity={cached.similarity:.2f})")
+            return cached.reused
         try:
-            _debug(f"LC scoring via OpenAI model={OPENAI_MODEL}")
+            _debug("LC scoring via OpenAI")
             from prompts import LC_SCORE_PROMPT
-            resp = client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a fair technical interviewer. Return strict JSON only."},
-                    {"role": "user",
-                     "content": f"{LC_SCORE_PROMPT}\n\nQuestion:\n{question}\n\nCandidate answer:\n{text}"},
-                ],
-                response_format={"type": "json_object"},
-            )
-            import json
-            obj = json.loads(resp.choices[0].message.content or "{}")
-            return {
+            with span("llm.score.LC"):
+                reply = complete(client, "score", "LC",
+                                 "You are a fair technical interviewer. Return strict JSON only.",
+                                 f"{LC_SCORE_PROMPT}\n\n{model_context('LC', question)}\n\nCandidate answer:\n{text}")
+            with span("parse.LC"):
+                obj = parse(reply, "score")
+            out = {
                 "correct": _safe_bool_correct(obj),
-                "feedback": _clean(obj.get("feedback", "")),
+                "feedback": obj.get("feedback", ""),
                 "judge_source": "openai",
             }
+            ANSWERS.record(cached, out)
+            return out
         except Exception as e:
             _debug(f"OpenAI LC scoring failed, falling back: {type(e).__name__}: {e}")
 
     _debug("LC scoring locally")
-    words = len((text or "").split())
-    pseudo_score = sum(
-        1 for c in ("set", "map", "hash", "window", "prefix", "queue", "stack") if c in (text or "").lower())
-    correct = (words >= 20 and pseudo_score >= 1)
-    fb = ("Evaluated locally. Outline clear steps and name the structures."
-          if not correct else "Good. Clear steps and appropriate data structures.")
-    return {"correct": bool(correct), "feedback": fb, "judge_source": "local"}
+    return {"correct": local["correct"], "feedback": feedback_for("LC", local), "judge_source": "local"}
 
 
 # ---------- SD generation ----------
-def generate_sd_prompt(difficulty: str = "MEDIUM") -> Dict[str, Any]:
+def generate_sd_prompt(difficulty: str = "MEDIUM", topic: Optional[str] = None,
+                       rng: Optional[random.Random] = None) -> Dict[str, Any]:
     from prompts import SD_QUESTION_PROMPT
     diff = _difficulty_norm(difficulty)
-    client = _maybe_client()
+    client = _client()
 
     if client:
         try:
             _debug("Generating SD prompt via OpenAI (JSON)")
-            topic = random.choice([
-                "URL shortener", "rate limiter", "chat room", "news feed",
-                "image sharing", "metrics ingestion", "log aggregation"
-            ])
-            resp = client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a seasoned systems architect. Return strict JSON only."},
-                    {"role": "user", "content": SD_QUESTION_PROMPT.format(topic=topic, difficulty=diff)},
-                ],
-                response_format={"type": "json_object"},
-            )
-            import json
-            obj = json.loads(resp.choices[0].message.content or "{}")
-            title = _clean(str(obj.get("title", "")))[:45]
-            prompt = _clean(str(obj.get("prompt", "")))[:240]
-            rubric = [_clean(str(x))[:80] for x in (obj.get("rubric") or [])][:7]
-            return {"title": title, "prompt": prompt, "rubric": rubric}
+            topic = topic or (rng or random).choice(SD_TOPICS)
+            with span("llm.generate.SD"):
+                reply = complete(client, "generate", "SD",
+                                 "You are a seasoned systems architect. Return strict JSON only.",
+                                 SD_QUESTION_PROMPT.format(topic=topic, difficulty=diff))
+            with span("parse.SD"):
+                obj = parse(reply, "sd_question")
+            return _with_grading("SD", obj)
         except Exception as e:
             _debug(f"OpenAI SD generation failed: {type(e).__name__}: {e}")
 
+    q = content.sample("SD", diff, rng)
+    if q is not None:
+        _debug("SD prompt from content pack")
+        return q
+
     _debug("Generating SD prompt locally (compact)")
     if diff == "EASY":
-        return {
+        return _with_grading("SD", {
             "title": "URL Shortener",
             "prompt": "Create and resolve short links. Support ~1M keys and 1k rps. Keep it simple.",
             "rubric": [
@@ -275,9 +299,9 @@ def generate_sd_prompt(difficulty: str = "MEDIUM") -> Dict[str, Any]:
                 "Scaling strategy",
                 "Tradeoffs",
             ],
-        }
+        })
     if diff == "MEDIUM":
-        return {
+        return _with_grading("SD", {
             "title": "Image Sharing Feed",
             "prompt": "Users post images and follow others. Build a feed and trending list.",
             "rubric": [
@@ -289,8 +313,8 @@ def generate_sd_prompt(difficulty: str = "MEDIUM") -> Dict[str, Any]:
                 "Sharding strategy",
                 "Bottlenecks/tradeoffs",
             ],
-        }
-    return {
+        })
+    return _with_grading("SD", {
         "title": "Global Chat (E2EE)",
         "prompt": "Groups, presence, and E2EE across regions. Low latency and reliable delivery.",
         "rubric": [
@@ -302,71 +326,74 @@ def generate_sd_prompt(difficulty: str = "MEDIUM") -> Dict[str, Any]:
             "Indexes/storage",
             "Observability/tradeoffs",
         ],
-    }
+    })
 
 
 # ---------- SD scoring ----------
-def score_sd_answer(rubric: List[str], text: str) -> Dict[str, Any]:
-    client = _maybe_client()
+def score_sd_answer(rubric: List[str], text: str, grading: Optional[Dict[str, Any]] = None,
+                    question: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    with span("judge.local.SD"):
+        local = judge_sd(rubric, text, grading)
+    if JUDGE_FIRST_PASS and local["confident"]:
+        _debug(f"SD judged locally with confidence (score={local['score']})")
+        return {"correct": local["correct"], "feedback": feedback_for("SD", local), "judge_source": "local"}
+
+    client = _client()
     if client:
+        cached = ANSWERS.lookup("SD", question or {"rubric": rubric}, text)
+        if cached.reused:
+            _debug(f"SD verdict reused from a graded paraphrase (similarity={cached.similarity:.2f})")
+            return cached.reused
         try:
-            _debug(f"SD scoring via OpenAI model={OPENAI_MODEL}")
+            _debug("SD scoring via OpenAI")
             from prompts import SD_SCORE_PROMPT
-            resp = client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": "Act as a system design interviewer. Return strict JSON only."},
-                    {"role": "user",
-                     "content": f"{SD_SCORE_PROMPT}\n\nRubric:\n- " + "\n- ".join(rubric) + f"\n\nCandidate:\n{text}"},
-                ],
-                response_format={"type": "json_object"},
-            )
-            import json
-            obj = json.loads(resp.choices[0].message.content or "{}")
-            return {
+            with span("llm.score.SD"):
+                reply = complete(client, "score", "SD",
+                                 "Act as a system design interviewer. Return strict JSON only.",
+                                 f"{SD_SCORE_PROMPT}\n\n{model_context('SD', {'rubric': rubric, 'grading': grading})}"
+                                 f"\n\nCandidate:\n{text}")
+            with span("parse.SD"):
+                obj = parse(reply, "score")
+            out = {
                 "correct": _safe_bool_correct(obj),
-                "feedback": _clean(obj.get("feedback", "")),
+                "feedback": obj.get("feedback", ""),
                 "judge_source": "openai",
             }
+            ANSWERS.record(cached, out)
+            return out
         except Exception as e:
             _debug(f"OpenAI SD scoring failed, falling back: {type(e).__name__}: {e}")
 
     _debug("SD scoring locally")
-    lower = (text or "").lower()
-    hits = sum(1 for r in rubric if r and r.split()[0].lower() in lower)
-    needed = max(1, len(rubric) // 3)
-    correct = hits >= needed
-    fb = "Cover API, storage, scaling, consistency, and one tradeoff." if not correct else "Solid coverage of key items."
-    return {"correct": bool(correct), "feedback": fb, "judge_source": "local"}
+    return {"correct": local["correct"], "feedback": feedback_for("SD", local), "judge_source": "local"}
 
 
 # ---------- Behavioral generation ----------
-def generate_beh_prompt(difficulty: str = "MEDIUM") -> Dict[str, Any]:
+def generate_beh_prompt(difficulty: str = "MEDIUM", theme: Optional[str] = None,
+                        rng: Optional[random.Random] = None) -> Dict[str, Any]:
     from prompts import BEHAVIORAL_QUESTION_PROMPT
     diff = _difficulty_norm(difficulty)
-    client = _maybe_client()
+    client = _client()
 
     if client:
         try:
             _debug("Generating behavioral prompt via OpenAI (JSON)")
-            theme = random.choice(["conflict", "leadership", "failure", "ambiguity", "ownership"])
-            resp = client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a behavioral interviewer. Return strict JSON only."},
-                    {"role": "user", "content": BEHAVIORAL_QUESTION_PROMPT.format(theme=theme, difficulty=diff)},
-                ],
-                response_format={"type": "json_object"},
-            )
-            import json
-            obj = json.loads(resp.choices[0].message.content or "{}")
-            title = _clean(str(obj.get("title", "")))[:45]
-            prompt = _clean(str(obj.get("prompt", "")))[:140]
-            tip = _clean(str(obj.get("tip", "")))[:90]
-            return {"title": title, "prompt": prompt, "tip": tip}
+            theme = theme or (rng or random).choice(BH_THEMES)
+            with span("llm.generate.BH"):
+                reply = complete(client, "generate", "BH",
+                                 "You are a behavioral interviewer. Return strict JSON only.",
+                                 BEHAVIORAL_QUESTION_PROMPT.format(theme=theme, difficulty=diff))
+            with span("parse.BH"):
+                obj = parse(reply, "beh_question")
+            return {"tip": "", **obj}
         except Exception as e:
             _debug(f"OpenAI behavioral generation failed: {type(e).__name__}: {e}")
 
+    q = content.sample("BH", diff, rng)
+    if q is not None:
+        _debug("Behavioral prompt from content pack")
+        return q
+
     _debug("Generating behavioral prompt locally (compact)")
     if diff == "EASY":
         return {
@@ -388,40 +415,44 @@ def generate_beh_prompt(difficulty: str = "MEDIUM") -> Dict[str, Any]:
 
 
 # ---------- Behavioral scoring ----------
-def score_beh_answer(text: str) -> Dict[str, Any]:
-    client = _maybe_client()
+def score_beh_answer(text: str, question: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    with span("judge.local.BH"):
+        local = judge_beh(text)
+    if JUDGE_FIRST_PASS and local["confident"]:
+        _debug(f"Behavioral judged locally with confidence (score={local['score']})")
+        return {"correct": local["correct"], "feedback": feedback_for("BH", local), "judge_source": "local"}
+
+    client = _client()
     if client:
+        cached = ANSWERS.lookup("BH", question, text)
+        if cached.reused:
+            _debug(f"Behavioral verdict reused from a graded paraphrase (similarity={cached.similarity:.2f})")
+            return cached.reused
         try:
-            _debug(f"Behavioral scoring via OpenAI model={OPENAI_MODEL}")
+            _debug("Behavioral scoring via OpenAI")
             from prompts import BEHAVIORAL_SCORE_PROMPT
-            resp = client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": "Coach scoring behavioral STAR answers. Return strict JSON only."},
-                    {"role": "user", "content": f"{BEHAVIORAL_SCORE_PROMPT}\n\nAnswer:\n{text}"},
-                ],
-                response_format={"type": "json_object"},
-            )
-            import json
-            obj = json.loads(resp.choices[0].message.content or "{}")
-            return {
+            with span("llm.score.BH"):
+                reply = complete(client, "score", "BH",
+                                 "Coach scoring behavioral STAR answers. Return strict JSON only.",
+                                 f"{BEHAVIORAL_SCORE_PROMPT}\n\nAnswer:\n{text}")
+            with span("parse.BH"):
+                obj = parse(reply, "score")
+            out = {
                 "correct": _safe_bool_correct(obj),
-                "feedback": _clean(obj.get("feedback", "")),
+                "feedback": obj.get("feedback", ""),
                 "judge_source": "openai",
             }
+            ANSWERS.record(cached, out)
+            return out
         except Exception as e:
             _debug(f"OpenAI behavioral scoring failed, falling back: {type(e).__name__}: {e}")
 
     _debug("Behavioral scoring locally")
-    lower = (text or "").lower()
-    present = sum(1 for k in ("situation", "task", "action", "result") if k in lower)
-    correct = present >= 3
-    fb = "Use STAR with specific actions and a measurable result." if not correct else "Clear STAR structure with a concrete outcome."
-    return {"correct": bool(correct), "feedback": fb, "judge_source": "local"}
+    return {"correct": local["correct"], "feedback": feedback_for("BH", local), "judge_source": "local"}
 
 
 # ---------- Cards (no cash anywhere) ----------
-def generate_card() -> Dict[str, Any]:
+def generate_card(rng: Optional[random.Random] = None) -> Dict[str, Any]:
     cards = [
         {"title": "Recruiter Referral", "text": "A friend forwards your resume to a hiring manager.",
          "effect": {"offers": 1}},
@@ -432,4 +463,4 @@ def generate_card() -> Dict[str, Any]:
         {"title": "Extra Practice", "text": "Daily leetcoding streak.", "effect": {"extra_roll": True}},
         {"title": "Rest Day", "text": "Take a breath.", "effect": {"turn_skip": True}},
     ]
-    return random.choice(cards)
+    return (rng or random).choice(cards)
@@ -0,0 +1,249 @@
+# model_router.py
+"""
+Per-call model selection.
+
+Every model call names an operation ("generate" or "score") and a question kind (LC/SD/BH).
+MODEL_ROUTES lists candidate models per route, preferred first:
+
+    MODEL_ROUTES="score:SD=gpt-4o,gpt-4o-mini; generate:BH=gpt-4o-mini; *=gpt-4o-mini"
+
+Keys are tried as "op:KIND", then "op", then "*"; without a match the route is OPENAI_MODEL.
+A call goes to the first candidate that is healthy (recent p95 within the operation's
+MODEL_SLO_MS budget, error rate below MAX_ERROR_RATE) and whose expected cost per call fits
+MODEL_COST_CEILING. When every candidate is degraded the fastest one is used. A small
+share of calls still probes a degraded preferred model, so it is promoted back once it
+recovers. A failed call is retried once on the next candidate.
+
+The API follows the model: gpt-5* models use the Responses API, the rest Chat Completions.
+"""
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
+
+from settings import get_settings
+
+WINDOW = 50  # recent calls kept per (route, model)
+MIN_SAMPLES = 5  # calls before a model's p95/error rate counts against it
+MAX_ERROR_RATE = 0.3
+EXPLORE = 0.05  # share of calls that probe a degraded preferred model
+MAX_ATTEMPTS = 2
+JSON_ONLY = "\n\nReturn ONLY a valid JSON object."
+
+# USD per 1M tokens (input, output), list prices; MODEL_PRICES overrides or adds entries
+PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-5-nano": (0.05, 0.40),
+    "gpt-5-mini": (0.25, 2.00),
+    "gpt-5": (1.25, 10.00),
+}
+# Output tokens assumed before a route has real usage to go by
+DEFAULT_OUTPUT_TOKENS = {"generate": 250, "score": 120}
+
+
+def _debug(msg: str):
+    print(f"[router] {msg}")
+
+
+def _pairs(spec: str) -> Dict[str, str]:
+    """ "a=x,y; b=z" -> {"a": "x,y", "b": "z"}"""
+    out = {}
+    for part in spec.replace("\n", ";").split(";"):
+        key, sep, value = part.partition("=")
+        if sep and key.strip():
+            out[key.strip()] = value.strip()
+    return out
+
+
+def _parse_routes(spec: str) -> Dict[str, List[str]]:
+    return {k: [m.strip() for m in v.split(",") if m.strip()] for k, v in _pairs(spec).items()}
+
+
+def _parse_floats(spec: str) -> Dict[str, float]:
+    out = {}
+    for part in spec.replace(";", ",").split(","):
+        key, sep, value = part.partition("=")
+        try:
+            if sep:
+                out[key.strip()] = float(value)
+        except ValueError:
+            _debug(f"ignoring {part.strip()!r}")
+    return out
+
+
+def _parse_prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    out = {}
+    for part in spec.replace(";", ",").split(","):
+        model, sep, value = part.partition("=")
+        pin, slash, pout = value.partition("/")
+        try:
+            if sep and slash:
+                out[model.strip()] = (float(pin), float(pout))
+        except ValueError:
+            _debug(f"ignoring price {part.strip()!r}")
+    return out
+
+
+DEFAULT_MODEL = get_settings().openai_model
+ROUTES = _parse_routes(get_settings().model_routes)
+SLO_MS = {"generate": 9000.0, "score": 6000.0, **_parse_floats(get_settings().model_slo_ms)}
+COST_CEILING = _parse_floats(get_settings().model_cost_ceiling)  # USD per call, by op or "op:KIND"
+PRICES.update(_parse_prices(get_settings().model_prices))
+
+
+def api_for(model: str) -> str:
+    return "responses" if model.startswith("gpt-5") else "chat"
+
+
+def candidates(op: str, kind: str) -> List[str]:
+    return ROUTES.get(f"{op}:{kind}") or ROUTES.get(op) or ROUTES.get("*") or [DEFAULT_MODEL]
+
+
+# ---------- Live statistics ----------
+
+class ModelStats:
+    """Recent latency/outcomes for one model on one route, plus smoothed token usage."""
+
+    __slots__ = ("calls", "tokens_in", "tokens_out", "total", "errors")
+
+    def __init__(self):
+        self.calls: deque = deque(maxlen=WINDOW)  # (latency_ms, ok)
+        self.tokens_in = 0.0
+        self.tokens_out = 0.0
+        self.total = 0
+        self.errors = 0
+
+    def record(self, ms: float, ok: bool, usage: Optional[Tuple[int, int]]):
+        self.calls.append((ms, ok))
+        self.total += 1
+        self.errors += 0 if ok else 1
+        if usage:
+            a = 0.2 if self.tokens_in else 1.0
+            self.tokens_in += a * (usage[0] - self.tokens_in)
+            self.tokens_out += a * (usage[1] - self.tokens_out)
+
+    def p95(self) -> Optional[float]:
+        if len(self.calls) < MIN_SAMPLES:
+            return None
+        s = sorted(ms for ms, _ in self.calls)
+        return s[min(len(s) - 1, int(0.95 * len(s)))]
+
+    def error_rate(self) -> float:
+        if len(self.calls) < MIN_SAMPLES:
+            return 0.0
+        return sum(1 for _, ok in self.calls if not ok) / len(self.calls)
+
+
+class Router:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._stats: Dict[Tuple[str, str, str], ModelStats] = {}
+
+    def _get(self, op: str, kind: str, model: str) -> ModelStats:
+        key = (op, kind, model)
+        st = self._stats.get(key)
+        if st is None:
+            st = self._stats[key] = ModelStats()
+        return st
+
+    def expected_cost(self, op: str, kind: str, model: str, prompt_chars: int) -> Optional[float]:
+        price = PRICES.get(model)
+        if price is None:
+            return None
+        st = self._stats.get((op, kind, model))
+        t_in = st.tokens_in if st and st.tokens_in else prompt_chars / 4.0
+        t_out = st.tokens_out if st and st.tokens_out else DEFAULT_OUTPUT_TOKENS.get(op, 200)
+        return (t_in * price[0] + t_out * price[1]) / 1e6
+
+    def healthy(self, op: str, model_stats: ModelStats) -> bool:
+        p95 = model_stats.p95()
+        return (p95 is None or p95 <= SLO_MS.get(op, 9000.0)) and model_stats.error_rate() < MAX_ERROR_RATE
+
+    def plan(self, op: str, kind: str, prompt_chars: int = 0) -> List[str]:
+        """Models to try, in order."""
+        cands = candidates(op, kind)
+        ceiling = COST_CEILING.get(f"{op}:{kind}", COST_CEILING.get(op))
+        with self.lock:
+            affordable = [m for m in cands
+                          if ceiling is None or (self.expected_cost(op, kind, m, prompt_chars) or 0.0) <= ceiling]
+            affordable = affordable or cands[-1:]  # the last candidate is the floor even above the ceiling
+            stats = {m: self._get(op, kind, m) for m in affordable}
+            good = [m for m in affordable if self.healthy(op, stats[m])]
+            bad = sorted((m for m in affordable if m not in good), key=lambda m: stats[m].p95() or 0.0)
+        preferred = affordable[0]
+        if good and preferred not in good and random.random() < EXPLORE:
+            return [preferred] + good + [m for m in bad if m != preferred]
+        return good + bad
+
+    def record(self, op: str, kind: str, model: str, ms: float, ok: bool, usage: Optional[Tuple[int, int]] = None):
+        with self.lock:
+            self._get(op, kind, model).record(ms, ok, usage)
+
+    def snapshot(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        with self.lock:
+            for (op, kind, model), st in sorted(self._stats.items()):
+                p95 = st.p95()
+                out.setdefault(f"{op}:{kind}", {})[model] = {
+                    "calls": st.total, "errors": st.errors, "recent": len(st.calls),
+                    "p95_ms": round(p95, 1) if p95 is not None else None,
+                    "error_rate": round(st.error_rate(), 3), "healthy": self.healthy(op, st),
+                    "tokens_in": round(st.tokens_in), "tokens_out": round(st.tokens_out),
+                }
+        return {"routes": {k: candidates(*k.split(":", 1)) for k in out}, "slo_ms": SLO_MS,
+                "cost_ceiling": COST_CEILING, "stats": out}
+
+
+ROUTER = Router()
+
+
+# ---------- Calls ----------
+
+def _call(client, model: str, system: str, user: str) -> Tuple[str, Optional[Tuple[int, int]]]:
+    """One request on the model's API. Returns (text, (input_tokens, output_tokens))."""
+    if api_for(model) == "responses":
+        # The Responses API takes neither temperature nor response_format here
+        resp = client.responses.create(model=model, input=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": user + JSON_ONLY},
+        ])
+        text = getattr(resp, "output_text", "") or "".join(
+            getattr(c, "text", "") for item in getattr(resp, "output", []) or []
+            for c in getattr(item, "content", []) or [] if getattr(c, "type", "") == "output_text")
+        if not text:
+            raise RuntimeError("empty response content from Responses API")
+        u = getattr(resp, "usage", None)
+        return text, (getattr(u, "input_tokens", 0), getattr(u, "output_tokens", 0)) if u else None
+
+    messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+    try:
+        resp = client.chat.completions.create(model=model, messages=messages, response_format={"type": "json_object"})
+    except TypeError:
+        # Older SDKs without response_format
+        messages[1]["content"] = user + JSON_ONLY
+        resp = client.chat.completions.create(model=model, messages=messages)
+    u = getattr(resp, "usage", None)
+    return resp.choices[0].message.content or "", \
+        (getattr(u, "prompt_tokens", 0), getattr(u, "completion_tokens", 0)) if u else None
+
+
+def complete(client, op: str, kind: str, system: str, user: str) -> str:
+    """Text of the first successful call along the route's plan; raises the last error."""
+    last: Optional[Exception] = None
+    for model in ROUTER.plan(op, kind, len(system) + len(user))[:MAX_ATTEMPTS]:
+        t0 = time.perf_counter()
+        try:
+            text, usage = _call(client, model, system, user)
+        except Exception as e:
+            ROUTER.record(op, kind, model, (time.perf_counter() - t0) * 1000.0, False)
+            _debug(f"{op}:{kind} on {model} failed: {type(e).__name__}: {e}")
+            last = e
+            continue
+        ROUTER.record(op, kind, model, (time.perf_counter() - t0) * 1000.0, True, usage)
+        return text
+    raise last if last is not None else RuntimeError(f"no model for {op}:{kind}")
@@ -0,0 +1,298 @@
+# qpool.py
+"""
+A question pool shared by every worker on the host.
+
+With `uvicorn --workers N` each process would otherwise keep its own ready questions and
+the model would write them N times. Instead the pool is one memory-mapped file
+(QUESTION_POOL) holding a ring of ready questions per (kind, difficulty) bucket; all
+workers map the same pages, pop from it when a landing needs a question, and exactly one of
+them, the refiller, keeps it topped up. Memory use (buckets x QUESTION_POOL_SLOTS x
+QUESTION_POOL_SLOT_BYTES) and generation cost stay the same whatever N is.
+
+File layout (little-endian):
+    header   MAGIC, version u16, buckets u16, slots u16, pad u16, slot bytes u32
+    buckets  head u32, tail u32, pushes u32, pops u32, misses u32, skipped u32, expected f64
+             (one per bucket)
+    slots    per bucket, per slot: length u32 + zlib'd compact JSON of the pending question
+
+head and tail only grow (count = tail - head), so a pop or push touches one bucket entry and
+one slot. Both run under a per-process lock plus flock on the file, held for a memcpy. The
+refiller is whichever worker holds the non-blocking flock on QUESTION_POOL + ".refill"; when
+it exits the kernel drops the lock and another worker takes over within REFILL_RETRY_S. Its
+QUESTION_POOL_WORKERS threads fill the bucket emptiest relative to its target, one question
+each at a time and only on an idle model slot, so refilling never delays a player.
+
+A bucket's target is a floor plus its decayed demand. Every roll adds, under `expected`, the
+probability that the next roll lands on a question of each bucket (expect()); that forecast
+leads actual asks by a full turn. Pops and misses count too, so questions asked without a
+forecast (rooms, cards) still raise the target.
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from admission import admit
+from settings import get_settings
+
+try:
+    import fcntl
+except ImportError:  # no flock (Windows): the pool stays off
+    fcntl = None
+
+QUESTION_POOL = get_settings().question_pool
+SLOTS = get_settings().question_pool_slots
+SLOT_BYTES = get_settings().question_pool_slot_bytes
+REFILL_S = get_settings().question_pool_refill_ms / 1000.0
+WORKERS = get_settings().question_pool_workers
+REFILL_RETRY_S = 5.0
+REFILL_BACKOFF_MAX_S = 30.0  # longest wait while generation keeps producing nothing
+MIN_FILL = 2  # questions kept in every bucket before demand says otherwise
+DECAY = 0.98  # per refill tick
+
+MAGIC = b"IVQR"
+FORMAT_VERSION = 2
+_HEADER = struct.Struct("<4sHHHHI")
+_BUCKET = struct.Struct("<IIIIIId")
+_LEN = struct.Struct("<I")
+_MASK32 = 0xFFFFFFFF
+
+KINDS = ("LC", "SD", "BH")
+DIFFS = ("EASY", "MEDIUM", "HARD")
+BUCKETS: Tuple[Tuple[str, str], ...] = tuple((k, d) for k in KINDS for d in DIFFS)
+_INDEX = {b: i for i, b in enumerate(BUCKETS)}
+
+
+def _debug(msg: str):
+    print(f"[qpool] {msg}")
+
+
+class QuestionPool:
+    def __init__(self, path: str = QUESTION_POOL, slots: int = SLOTS, slot_bytes: int = SLOT_BYTES):
+        self.path = path if fcntl is not None else ""  # empty disables the pool
+        self.slots = max(1, min(slots, 0xFFFF))
+        self.slot_bytes = max(256, slot_bytes)
+        self._buckets_at = _HEADER.size
+        self._slots_at = -(-(_HEADER.size + len(BUCKETS) * _BUCKET.size) // 64) * 64
+        self.size = self._slots_at + len(BUCKETS) * self.slots * self.slot_bytes
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._mm: Optional[mmap.mmap] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    # ---------- Mapping ----------
+
+    def _open(self) -> Optional[mmap.mmap]:
+        if self._mm is not None or not self.path:
+            return self._mm
+        with self._lock:
+            if self._mm is None:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    if os.fstat(fd).st_size != self.size or os.pread(fd, _HEADER.size, 0) != self._header():
+                        # New file, or one laid out for other settings: start empty
+                        os.ftruncate(fd, 0)
+                        os.ftruncate(fd, self.size)
+                        os.pwrite(fd, self._header(), 0)
+                        _debug(f"initialized {self.path} ({self.size} bytes)")
+                    self._mm = mmap.mmap(fd, self.size)
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                self._fd = fd
+        return self._mm
+
+    def _header(self) -> bytes:
+        return _HEADER.pack(MAGIC, FORMAT_VERSION, len(BUCKETS), self.slots, 0, self.slot_bytes)
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield self._mm
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _bucket(self, mm, i: int) -> List[int]:
+        return list(_BUCKET.unpack_from(mm, self._buckets_at + i * _BUCKET.size))
+
+    def _set_bucket(self, mm, i: int, vals: List[Any]):
+        _BUCKET.pack_into(mm, self._buckets_at + i * _BUCKET.size, *(v & _MASK32 for v in vals[:6]), vals[6])
+
+    def _slot(self, i: int, n: int) -> int:
+        return self._slots_at + (i * self.slots + n % self.slots) * self.slot_bytes
+
+    # ---------- Push / pop ----------
+
+    def pop(self, qkind: str, diff: str) -> Optional[Dict[str, Any]]:
+        """The oldest ready question of the bucket, or None (counted as a miss)."""
+        i = _INDEX.get((qkind, diff))
+        if i is None or self._open() is None:
+            return None
+        with self._locked() as mm:
+            head, tail, pushes, pops, misses, skipped, expected = self._bucket(mm, i)
+            if (tail - head) & _MASK32 == 0:
+                self._set_bucket(mm, i, [head, tail, pushes, pops, misses + 1, skipped, expected])
+                return None
+            at = self._slot(i, head)
+            (n,) = _LEN.unpack_from(mm, at)
+            blob = mm[at + _LEN.size:at + _LEN.size + n]
+            self._set_bucket(mm, i, [head + 1, tail, pushes, pops + 1, misses, skipped, expected])
+        return json.loads(zlib.decompress(blob))
+
+    def push(self, qkind: str, diff: str, pending: Dict[str, Any]) -> bool:
+        """Add a ready question; False when the bucket is full or the question does not fit a slot."""
+        i = _INDEX.get((qkind, diff))
+        if i is None or self._open() is None:
+            return False
+        blob = zlib.compress(json.dumps(pending, separators=(",", ":"), ensure_ascii=False).encode("utf-8"), 6)
+        with self._locked() as mm:
+            head, tail, pushes, pops, misses, skipped, expected = self._bucket(mm, i)
+            if _LEN.size + len(blob) > self.slot_bytes or (tail - head) & _MASK32 >= self.slots:
+                self._set_bucket(mm, i, [head, tail, pushes, pops, misses, skipped + 1, expected])
+                return False
+            at = self._slot(i, tail)
+            _LEN.pack_into(mm, at, len(blob))
+            mm[at + _LEN.size:at + _LEN.size + len(blob)] = blob
+            self._set_bucket(mm, i, [head, tail + 1, pushes + 1, pops, misses, skipped, expected])
+        return True
+
+    def expect(self, forecast: Dict[Tuple[str, str], float]):
+        """Add one roll's forecast {bucket: probability of asking for it next} to the shared demand."""
+        idx = [(_INDEX[b], p) for b, p in forecast.items() if b in _INDEX and p > 0]
+        if not idx or self._open() is None:
+            return
+        with self._locked() as mm:
+            for i, p in idx:
+                vals = self._bucket(mm, i)
+                vals[6] += p
+                self._set_bucket(mm, i, vals)
+
+    def levels(self) -> Dict[Tuple[str, str], Dict[str, int]]:
+        if self._open() is None:
+            return {}
+        with self._locked() as mm:
+            rows = [self._bucket(mm, i) for i in range(len(BUCKETS))]
+        return {b: {"ready": (r[1] - r[0]) & _MASK32, "pushes": r[2], "pops": r[3], "misses": r[4], "skipped": r[5],
+                    "expected": round(r[6], 3)} for b, r in zip(BUCKETS, rows)}
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        return {"enabled": True, "path": self.path, "bytes": self.size, "slots": self.slots,
+                "slot_bytes": self.slot_bytes, "refiller": REFILLER.is_refiller,
+                "buckets": {f"{k}:{d}": v for (k, d), v in self.levels().items()}}
+
+
+POOL = QuestionPool()
+
+
+# ---------- Refiller ----------
+
+class Refiller:
+    """Runs in every worker; only the one holding the .refill flock generates, on WORKERS threads."""
+
+    def __init__(self, pool: QuestionPool, workers: int = WORKERS):
+        self.pool = pool
+        self.workers = max(1, workers)
+        self.is_refiller = False
+        self.generated = 0
+        self._thread: Optional[threading.Thread] = None
+        self._make: Optional[Callable[[str, str], Optional[Dict[str, Any]]]] = None
+        self._lock = threading.Lock()
+        self._weights: Dict[Tuple[str, str], float] = {b: 0.0 for b in BUCKETS}
+        self._seen: Dict[Tuple[str, str], Tuple[int, float]] = {}
+        self._inflight: Dict[Tuple[str, str], int] = {b: 0 for b in BUCKETS}
+        self._decayed_at = 0.0
+
+    def start(self, make: Callable[[str, str], Optional[Dict[str, Any]]]):
+        """make(qkind, diff) returns a new pending question, or None when there is nothing to add."""
+        if not self.pool.enabled or self._thread is not None:
+            return
+        self._make = make
+        self._thread = threading.Thread(target=self._elect, name="qpool-refiller", daemon=True)
+        self._thread.start()
+
+    def _elect(self):
+        fd = os.open(self.pool.path + ".refill", os.O_RDWR | os.O_CREAT, 0o600)
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                time.sleep(REFILL_RETRY_S)
+        self.is_refiller = True
+        _debug(f"worker {os.getpid()} is the refiller")
+        for n in range(1, self.workers):
+            threading.Thread(target=self._run, args=(n,), name=f"qpool-refiller-{n}", daemon=True).start()
+        self._run(0)
+
+    def _run(self, n: int):
+        delay = REFILL_S
+        while True:
+            try:
+                done = self.tick(f"qpool-{n}")
+            except Exception as e:
+                _debug(f"refill failed: {type(e).__name__}: {e}")
+                done = None
+            if done:
+                delay = REFILL_S
+                continue
+            # Nothing needed (False): poll again soon. Nothing produced (None): back off
+            delay = min(delay * 2, REFILL_BACKOFF_MAX_S) if done is None else REFILL_S
+            time.sleep(delay)
+
+    def targets(self, levels: Dict[Tuple[str, str], Dict[str, int]]) -> Dict[Tuple[str, str], int]:
+        """Questions to keep ready per bucket: MIN_FILL plus the decayed demand seen by all workers."""
+        now = time.monotonic()
+        if now - self._decayed_at >= REFILL_S:
+            self._decayed_at = now
+            for b, lv in levels.items():
+                asked, expected = lv["pops"] + lv["misses"], lv["expected"]
+                was_asked, was_expected = self._seen.get(b, (asked, expected))
+                # The forecast leads; actual asks cover questions nobody forecast
+                new = max((asked - was_asked) & _MASK32, expected - was_expected)
+                self._weights[b] = self._weights[b] * DECAY + new
+                self._seen[b] = (asked, expected)
+        return {b: min(self.pool.slots, MIN_FILL + math.ceil(w)) for b, w in self._weights.items()}
+
+    def tick(self, client: str = "qpool") -> Optional[bool]:
+        """
+        Generate one question for the neediest bucket. False when there was nothing to do (or no
+        idle model slot), None when generation produced nothing.
+        """
+        with self._lock:
+            levels = self.pool.levels()
+            targets = self.targets(levels)
+            have = {b: levels[b]["ready"] + self._inflight[b] for b in BUCKETS}
+            # Emptiest bucket relative to its target first, so a hot bucket cannot starve the rest
+            b = min(BUCKETS, key=lambda b: (have[b] / targets[b], -targets[b]))
+            if have[b] >= targets[b]:
+                return False
+            self._inflight[b] += 1
+        try:
+            with admit(client, "prefetch") as ok:
+                if not ok:
+                    return False
+                pending = self._make(*b)
+        finally:
+            with self._lock:
+                self._inflight[b] -= 1
+        if pending is None:
+            return None
+        if self.pool.push(*b, pending):
+            self.generated += 1
+        return True
+
+
+REFILLER = Refiller(POOL)
@@ -0,0 +1,201 @@
+# replay.py
+"""
+Deterministic game replay.
+
+A game's dice, cards and local question picks all come from its seed (GameState.rng), so
+the seed plus the answers typed in is the game's whole input. This re-runs that input
+in-process against a memory backend with the model switched off, with no HTTP, think time
+or model latency:
+
+    python -m replay --game <gid> --save run.json    # a recorded game from GAME_DB, checked against its log
+    python -m replay run.json --repeat 200            # re-run a script, e.g. under a profiler
+    python -m replay --seed 42 --answers answers.txt  # ad hoc: one answer per line (or a JSON list)
+
+A script is {"seed": n, "answers": [...], "verdicts": [...], "steps": n, "trace": [...]}; only
+the seed is required. When the script carries verdicts (recorded games do), each answer gets
+the verdict the game recorded, so games the model judged replay exactly; --local-judge
+re-grades with the local judge instead. With a trace, every roll, question and verdict is
+compared with it and the first divergence is reported (exit 1).
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+import uuid
+from typing import Dict, Any, Iterator, List, Optional
+
+import accounts
+import analytics
+import qpool
+import server
+from logic import local_only
+from store import MemoryBackend, SqliteBackend
+
+
+def _debug(msg: str):
+    print(f"[replay] {msg}", file=sys.stderr)
+
+
+# ---------- Scripts ----------
+
+def script_from_log(backend, gid: str) -> Dict[str, Any]:
+    """Seed, answer log, verdicts and move trace of a recorded game."""
+    loaded = backend.load(gid)
+    if loaded is None:
+        raise SystemExit(f"unknown game {gid}")
+    seed = loaded[1].seed
+    if not seed:
+        raise SystemExit(f"game {gid} predates seeded games and cannot be replayed")
+    answers: List[str] = []
+    verdicts: List[Dict[str, Any]] = []
+    trace: List[List[Any]] = []
+    for e in backend.events(gid):
+        kind, data = e["kind"], e.get("data") or {}
+        if kind == "roll":
+            trace.append(["roll", data["d1"], data["d2"], data["pos"]])
+        elif kind == "skip":
+            trace.append(["skip"])
+        elif kind == "question":
+            trace.append(["question", data.get("type")])
+        elif kind == "submitted":
+            answers.append(data.get("answer", ""))  # empty for answers logged before answers were kept
+        elif kind == "grade_failed" and answers:
+            answers.pop()  # never graded; the player answered the same challenge again
+        elif kind == "verdict":
+            verdicts.append({"passed": data.get("passed"), "difficulty": data.get("difficulty")})
+            trace.append(["verdict", data.get("passed")])
+    steps = sum(1 for t in trace if t[0] in ("roll", "skip"))
+    return {"game_id": gid, "seed": seed, "answers": answers, "verdicts": verdicts, "steps": steps, "trace": trace}
+
+
+def read_answers(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return [str(a) for a in json.loads(text)]
+    return text.splitlines()
+
+
+# ---------- Playing ----------
+
+def play(script: Dict[str, Any], local_judge: bool = False) -> Dict[str, Any]:
+    """Run one game from the script on server.BACKEND; returns its trace and final state."""
+    gid = uuid.uuid4().hex
+    server.BACKEND.create(gid, server.new_game(script["seed"]))
+    answers: Iterator[str] = iter(script.get("answers") or [])
+    verdicts: Iterator[Dict[str, Any]] = iter([] if local_judge else script.get("verdicts") or [])
+    limit = script.get("steps")
+    trace: List[List[Any]] = []
+    steps = 0
+    g = server._load(gid)
+    with local_only():
+        while g.turns > 0 and (limit is None or steps < limit):
+            out, g = server.roll_dice(gid)
+            steps += 1
+            if out["skipped"]:
+                trace.append(["skip"])
+                continue
+            trace.append(["roll", out["d1"], out["d2"], out["pos"]])
+            server.resolve_landing(gid)
+            g = server._load(gid)
+            p = g.pending
+            if not p:
+                continue
+            trace.append(["question", p["type"]])
+            text = next(answers, "")
+            v = next(verdicts, None)
+            if v is not None and v.get("passed") is not None:
+                passed, diff, feedback, judge_source = bool(v["passed"]), v.get("difficulty") or "MEDIUM", "", "replay"
+            else:
+                passed, diff, feedback, judge_source = server._grade(p, text, g.pos)
+
+            def apply(g, j, kind=p["type"], diff=diff, passed=passed, feedback=feedback, src=judge_source):
+                server._apply_verdict(g, j, kind, diff, passed, feedback, src)
+
+            _, g = server._update(gid, apply)
+            trace.append(["verdict", passed])
+    return {"trace": trace, "steps": steps, "offers": g.offers, "turns_left": g.turns,
+            "owned": [o["name"] for o in g.owned_list()], "houses": g.houses_map(), "rolls": g.rolls}
+
+
+def first_divergence(expected: List[List[Any]], actual: List[List[Any]]) -> Optional[Dict[str, Any]]:
+    for i, (a, b) in enumerate(zip(expected, actual)):
+        if list(a) != list(b):
+            return {"index": i, "recorded": a, "replayed": b}
+    if len(expected) != len(actual):
+        i = min(len(expected), len(actual))
+        return {"index": i, "recorded": expected[i] if i < len(expected) else None,
+                "replayed": actual[i] if i < len(actual) else None}
+    return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("script", nargs="?", help="script JSON written by --save")
+    ap.add_argument("--game", help="build the script from this recorded game")
+    ap.add_argument("--db", help="SQLite file to read --game from (default: GAME_DB)")
+    ap.add_argument("--seed", type=int, help="ad hoc script: this seed")
+    ap.add_argument("--answers", help="ad hoc script: answers, one per line or a JSON list")
+    ap.add_argument("--local-judge", action="store_true", help="re-grade with the local judge instead of recorded verdicts")
+    ap.add_argument("--repeat", type=int, default=1, help="runs of the script, for timing")
+    ap.add_argument("--save", help="write the script here")
+    ap.add_argument("--verbose", action="store_true", help="keep server/logic debug prints")
+    args = ap.parse_args(argv)
+
+    if args.game:
+        source = SqliteBackend(args.db) if args.db else server.BACKEND
+        script = script_from_log(source, args.game)
+    elif args.script:
+        with open(args.script, "r", encoding="utf-8") as f:
+            script = json.load(f)
+    elif args.seed:
+        script = {"seed": args.seed}
+    else:
+        ap.error("give a script, --game or --seed")
+    if args.seed and (args.game or args.script):
+        script["seed"] = args.seed
+    if args.answers:
+        script["answers"] = read_answers(args.answers)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(script, f, indent=1, ensure_ascii=False)
+        _debug(f"wrote {args.save}")
+
+    # Never write replays into the real game store, account history or analytics
+    server.BACKEND = MemoryBackend()
+    accounts.ACCOUNTS = accounts.AccountStore("")
+    analytics.SINK = analytics.Sink("")
+    qpool.POOL = qpool.QuestionPool("")  # questions come from the seed alone
+    runs = []
+    with open(os.devnull, "w") as devnull:
+        # Per-move debug prints would dominate the timing
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)
+        t0 = time.perf_counter()
+        with quiet:
+            for _ in range(max(1, args.repeat)):
+                runs.append(play(script, args.local_judge))
+        elapsed = time.perf_counter() - t0
+
+    result = runs[0]
+    nondeterministic = sum(1 for r in runs[1:] if r["trace"] != result["trace"])
+    divergence = first_divergence(script["trace"], result["trace"]) if script.get("trace") else None
+    summary = {
+        "seed": script["seed"],
+        **{k: v for k, v in result.items() if k != "trace"},
+        "questions": sum(1 for t in result["trace"] if t[0] == "question"),
+        "runs": len(runs),
+        "ms_per_game": round(elapsed * 1000.0 / len(runs), 3),
+        "games_per_s": round(len(runs) / elapsed, 1) if elapsed else None,
+        "nondeterministic_runs": nondeterministic,
+        "divergence": divergence,
+    }
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    if divergence:
+        _debug(f"diverged from the recorded game at step {divergence['index']}")
+    return 1 if divergence or nondeterministic else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
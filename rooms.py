@@ -0,0 +1,420 @@
+# rooms.py
+# Local multiplayer: rooms of 2-8 players sharing one board, with round-robin turns and
+# push updates over a WebSocket per client.
+#
+# Everything runs on the event loop: no thread or task per room. Model calls go to the
+# threadpool. Each room event is JSON-encoded once and put on every subscriber's bounded
+# queue; a client that falls behind is dropped and resyncs from GET /rooms/{rid}.
+# Dice, cards and local question picks come from the room's own seeded generator, used
+# under the room lock; the seed is revealed once the game is over.
+# Rooms live in this process, so run rooms on a single worker (or with sticky routing).
+import asyncio
+import json
+import random
+import secrets
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+from fastapi import APIRouter, Body, HTTPException, WebSocket, WebSocketDisconnect
+from starlette.concurrency import run_in_threadpool
+
+from board import BOARD
+from dedup import SeenSet
+import skill
+from logic import generate_card
+
+MIN_PLAYERS = 2
+MAX_PLAYERS = 8
+ROOM_TTL_S = 6 * 3600  # idle rooms are swept after this
+SUBSCRIBER_QUEUE = 64
+EVENT_LOG = 256  # recent events kept per room for late joiners
+
+JAIL_IDX = next(i for i, t in enumerate(BOARD) if t.ttype == "JAIL")
+
+
+def _debug(msg: str):
+    print(f"[rooms] {msg}")
+
+
+class Player:
+    __slots__ = ("pid", "token", "name", "pos", "pos_prev", "offers", "turns",
+                 "skip_turn", "extra_roll", "skill")
+
+    def __init__(self, name: str, turns: int):
+        self.pid = secrets.token_hex(4)
+        self.token = secrets.token_urlsafe(16)
+        self.name = (name or "Player").strip()[:24] or "Player"
+        self.pos = 0
+        self.pos_prev = 0
+        self.offers = 0
+        self.turns = turns
+        self.skip_turn = False
+        self.extra_roll = False
+        self.skill = skill.new_skill()
+
+    def public(self) -> Dict[str, Any]:
+        return {"id": self.pid, "name": self.name, "pos": self.pos, "pos_prev": self.pos_prev,
+                "offers": self.offers, "turns": self.turns}
+
+
+class Room:
+    __slots__ = ("rid", "host", "players", "turn", "phase", "turns", "owners", "houses",
+                 "pending", "seen", "seq", "log", "subscribers", "lock", "touched", "seed", "rng")
+
+    def __init__(self, turns: int, seed: Optional[int] = None):
+        self.rid = secrets.token_hex(4)
+        self.host: Optional[str] = None
+        self.players: List[Player] = []
+        self.turn = 0  # index into players of whoever acts next
+        self.phase = "lobby"  # lobby -> roll <-> answer -> done
+        self.turns = turns
+        # Shared board: owner player id and house count per board position
+        self.owners: List[Optional[str]] = [None] * len(BOARD)
+        self.houses = bytearray(len(BOARD))
+        self.pending: Optional[Dict[str, Any]] = None
+        self.seen = SeenSet()  # questions already asked in this room
+        self.seq = 0
+        self.log: deque = deque(maxlen=EVENT_LOG)
+        self.subscribers: set = set()
+        self.lock = asyncio.Lock()
+        self.touched = time.time()
+        self.seed = seed or secrets.randbits(32)
+        self.rng = random.Random(self.seed)
+
+    def player(self, pid: str, token: str) -> Player:
+        for p in self.players:
+            if p.pid == pid and secrets.compare_digest(p.token, token or ""):
+                return p
+        raise HTTPException(status_code=403, detail="Unknown player or bad token")
+
+    def current(self) -> Optional[Player]:
+        return self.players[self.turn] if self.players else None
+
+    def by_id(self, pid: Optional[str]) -> Optional[Player]:
+        return next((p for p in self.players if p.pid == pid), None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        from server import public_pending
+        cur = self.current()
+        pending = None
+        if self.pending:
+            pending = public_pending({k: v for k, v in self.pending.items() if k != "pid"})
+            pending["player"] = self.pending["pid"]
+        return {
+            "room_id": self.rid,
+            "seq": self.seq,
+            "phase": self.phase,
+            "host": self.host,
+            "current": cur.pid if cur else None,
+            "players": [p.public() for p in self.players],
+            "owners": {BOARD[i].name: o for i, o in enumerate(self.owners) if o},
+            "houses": {BOARD[i].name: h for i, h in enumerate(self.houses) if h},
+            "pending": pending,
+            "seed": self.seed if self.phase == "done" else None,
+        }
+
+    def publish(self, kind: str, **data):
+        """Append an event and fan it out. Called with the room lock held, on the event loop."""
+        self.seq += 1
+        self.touched = time.time()
+        event = {"seq": self.seq, "kind": kind, **data}
+        self.log.append(event)
+        msg = json.dumps(event, separators=(",", ":"))
+        for q in list(self.subscribers):
+            try:
+                q.put_nowait(msg)
+            except asyncio.QueueFull:
+                # Slow consumer: cut it loose instead of buffering without bound
+                self.subscribers.discard(q)
+
+
+ROOMS: Dict[str, Room] = {}
+
+
+def _sweep():
+    cutoff = time.time() - ROOM_TTL_S
+    for rid in [rid for rid, r in ROOMS.items() if r.touched < cutoff and not r.subscribers]:
+        ROOMS.pop(rid, None)
+
+
+def _room(rid: str) -> Room:
+    room = ROOMS.get(rid)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Unknown room")
+    return room
+
+
+# ---------- Turn rules ----------
+
+def _advance(room: Room):
+    """Hand the turn to the next player with turns left (or the same one on an extra roll)."""
+    cur = room.current()
+    room.pending = None
+    if cur.extra_roll:
+        cur.extra_roll = False
+    else:
+        cur.turns -= 1
+        for step in range(1, len(room.players) + 1):
+            nxt = (room.turn + step) % len(room.players)
+            if room.players[nxt].turns > 0:
+                room.turn = nxt
+                break
+        else:
+            room.phase = "done"
+            ranking = sorted(room.players, key=lambda p: -p.offers)
+            room.publish("game_over", standings=[p.public() for p in ranking])
+            return
+    room.phase = "roll"
+    room.publish("turn", player=room.current().pid)
+
+
+def _rr_count(room: Room, pid: str) -> int:
+    return sum(1 for i, t in enumerate(BOARD)
+               if room.owners[i] == pid and t.ttype == "COMPANY" and t.payload.get("group") == "RR")
+
+
+def _owns_group(room: Room, pid: str, group: str) -> bool:
+    return all(room.owners[i] == pid for i, t in enumerate(BOARD)
+               if t.ttype == "COMPANY" and t.payload.get("group") == group)
+
+
+def _challenge_for(room: Room, player: Player) -> Optional[Dict[str, Any]]:
+    """What the landing asks of the player: acquire, build or rent (answer to avoid paying)."""
+    from server import lc_diff_for_side
+
+    pos = player.pos
+    tile = BOARD[pos]
+    if tile.ttype != "COMPANY":
+        return None
+    group = tile.payload.get("group")
+    if group == "UTIL":
+        return None
+    owner = room.owners[pos]
+    if group == "RR":
+        qkind, diff = "LC", "MEDIUM"
+    else:
+        qkind = (tile.payload.get("qkind") or "").upper()
+        if qkind not in ("LC", "SD", "BH"):
+            return None
+        diff = skill.adapt(player.skill, qkind, lc_diff_for_side(pos))
+    if owner is None:
+        role = "acquire"
+    elif owner == player.pid:
+        if group == "RR" or not _owns_group(room, player.pid, group) or room.houses[pos] >= 5:
+            return None
+        role = "build"
+    else:
+        role = "rent"
+    return {"qkind": qkind, "diff": diff, "role": role, "owner": owner, "pos": pos}
+
+
+def _rent_due(room: Room, pos: int, diff: str) -> int:
+    from server import SCHEDULE, RR_SCHEDULE
+
+    tile = BOARD[pos]
+    if tile.payload.get("group") == "RR":
+        return RR_SCHEDULE.get(_rr_count(room, room.owners[pos]), 0)
+    return SCHEDULE.get(diff, SCHEDULE["MEDIUM"])[min(5, room.houses[pos])]
+
+
+def _apply_answer(room: Room, player: Player, passed: bool, diff: str, feedback: str,
+                  judge_source: Optional[str]) -> Dict[str, Any]:
+    from server import SCHEDULE, RR_SCHEDULE
+
+    ch = room.pending
+    pos = ch["pos"]
+    tile = BOARD[pos]
+    is_rr = tile.payload.get("group") == "RR"
+    table = SCHEDULE.get(diff, SCHEDULE["MEDIUM"])
+    if diff in skill.DIFFS:
+        skill.update(player.skill, ch["qkind"], diff, passed)
+    result = {"player": player.pid, "tile": tile.name, "role": ch["role"], "passed": passed,
+              "feedback": feedback, "judge_source": judge_source, "reward": 0, "rent": 0}
+
+    if ch["role"] == "acquire" and passed:
+        room.owners[pos] = player.pid
+        result["reward"] = RR_SCHEDULE.get(_rr_count(room, player.pid), 0) if is_rr else table[0]
+    elif ch["role"] == "build" and passed:
+        room.houses[pos] += 1
+        result["reward"] = table[min(5, room.houses[pos])]
+        result["houses"] = room.houses[pos]
+    elif ch["role"] == "rent" and not passed:
+        owner = room.by_id(ch["owner"])
+        rent = _rent_due(room, pos, diff)
+        player.offers -= rent
+        if owner is not None:
+            owner.offers += rent
+        result["rent"] = rent
+        result["owner"] = ch["owner"]
+    player.offers += result["reward"]
+    return result
+
+
+def _apply_tile(room: Room, player: Player, card: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Non-question effects of the landing tile; returns an event payload if anything happened."""
+    tile = BOARD[player.pos]
+    if tile.ttype == "GOTO_JAIL":
+        player.pos_prev = player.pos
+        player.pos = JAIL_IDX
+        return {"player": player.pid, "effect": "jail", "pos": player.pos}
+    if tile.ttype in ("CHANCE", "COMMUNITY") and card:
+        eff = card.get("effect", {})
+        player.offers += eff.get("offers", 0)
+        player.skip_turn = bool(eff.get("turn_skip")) or player.skip_turn
+        player.extra_roll = bool(eff.get("extra_roll")) or player.extra_roll
+        return {"player": player.pid, "effect": "card", "title": card.get("title"), "text": card.get("text")}
+    return None
+
+
+# ---------- Routes ----------
+
+router = APIRouter(prefix="/rooms")
+
+
+@router.post("")
+async def post_room(name: str = Body("Host", embed=True), turns: int = Body(20, embed=True),
+                    seed: Optional[int] = Body(None, embed=True)):
+    _sweep()
+    room = Room(max(1, min(100, turns)), seed)
+    host = Player(name, room.turns)
+    room.players.append(host)
+    room.host = host.pid
+    ROOMS[room.rid] = room
+    room.publish("join", player=host.public())
+    _debug(f"room {room.rid} created by {host.name}")
+    return {"room_id": room.rid, "player_id": host.pid, "token": host.token}
+
+
+@router.post("/{rid}/join")
+async def post_join(rid: str, name: str = Body("Player", embed=True)):
+    room = _room(rid)
+    async with room.lock:
+        if room.phase != "lobby":
+            raise HTTPException(status_code=409, detail="Game already started")
+        if len(room.players) >= MAX_PLAYERS:
+            raise HTTPException(status_code=409, detail="Room is full")
+        p = Player(name, room.turns)
+        room.players.append(p)
+        room.publish("join", player=p.public())
+    return {"room_id": rid, "player_id": p.pid, "token": p.token}
+
+
+@router.post("/{rid}/start")
+async def post_start(rid: str, player_id: str = Body(..., embed=True), token: str = Body(..., embed=True)):
+    room = _room(rid)
+    async with room.lock:
+        p = room.player(player_id, token)
+        if p.pid != room.host:
+            raise HTTPException(status_code=403, detail="Only the host can start")
+        if room.phase != "lobby":
+            raise HTTPException(status_code=409, detail="Game already started")
+        if len(room.players) < MIN_PLAYERS:
+            raise HTTPException(status_code=409, detail=f"Need at least {MIN_PLAYERS} players")
+        room.phase = "roll"
+        room.turn = 0
+        room.publish("start", order=[x.pid for x in room.players])
+        room.publish("turn", player=room.current().pid)
+    return {"ok": True}
+
+
+@router.get("/{rid}")
+async def get_room(rid: str):
+    return _room(rid).snapshot()
+
+
+@router.post("/{rid}/roll")
+async def post_room_roll(rid: str, player_id: str = Body(..., embed=True), token: str = Body(..., embed=True)):
+    from server import _generate_admitted, public_pending
+
+    room = _room(rid)
+    async with room.lock:
+        p = room.player(player_id, token)
+        if room.phase != "roll" or room.current() is not p:
+            raise HTTPException(status_code=409, detail="Not your turn to roll")
+
+        if p.skip_turn:
+            p.skip_turn = False
+            room.publish("skip", player=p.pid)
+            _advance(room)
+            return {"skipped": True}
+
+        d1, d2 = room.rng.randint(1, 6), room.rng.randint(1, 6)
+        old = p.pos
+        p.pos_prev = old
+        p.pos = (old + d1 + d2) % len(BOARD)
+        if p.pos < old:
+            p.offers += 200  # passing GO
+        room.publish("roll", player=p.pid, d1=d1, d2=d2, pos=p.pos, pos_prev=old)
+
+        ch = _challenge_for(room, p)
+        if ch is not None:
+            pending = await run_in_threadpool(_generate_admitted, f"{rid}:{p.pid}", ch["qkind"], ch["diff"],
+                                              room.seen, room.rng)
+            room.seen.add(tuple(pending["sig"]))
+            room.pending = {**ch, "pid": p.pid, **pending}
+            room.phase = "answer"
+            room.publish("question", player=p.pid, role=ch["role"], owner=ch["owner"],
+                         type=pending["type"], question=public_pending(pending)["question"])
+            return {"skipped": False, "d1": d1, "d2": d2, "pos": p.pos, "pending": public_pending(pending)}
+
+        card = None
+        if BOARD[p.pos].ttype in ("CHANCE", "COMMUNITY"):
+            card = generate_card(room.rng)
+        effect = _apply_tile(room, p, card)
+        if effect:
+            room.publish("tile", **effect)
+        _advance(room)
+        return {"skipped": False, "d1": d1, "d2": d2, "pos": p.pos, "pending": None}
+
+
+@router.post("/{rid}/answer")
+async def post_room_answer(rid: str, player_id: str = Body(..., embed=True), token: str = Body(..., embed=True),
+                           text: str = Body("", embed=True)):
+    from server import _grade_admitted
+
+    room = _room(rid)
+    async with room.lock:
+        p = room.player(player_id, token)
+        if room.phase != "answer" or not room.pending or room.pending["pid"] != p.pid:
+            raise HTTPException(status_code=409, detail="No challenge waiting for you")
+        passed, diff, feedback, judge_source = await run_in_threadpool(
+            _grade_admitted, f"{rid}:{p.pid}", room.pending, text or "", p.pos)
+        result = _apply_answer(room, p, passed, diff, feedback, judge_source)
+        room.publish("verdict", **result, offers={x.pid: x.offers for x in room.players})
+        _advance(room)
+    return result
+
+
+@router.websocket("/{rid}/ws")
+async def room_ws(ws: WebSocket, rid: str):
+    room = ROOMS.get(rid)
+    if room is None:
+        await ws.close(code=4404)
+        return
+    await ws.accept()
+    q: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE)
+    room.subscribers.add(q)
+    # Clients only listen, but reading is how a disconnect is noticed while no moves arrive
+    gone = asyncio.ensure_future(_until_disconnect(ws))
+    try:
+        await ws.send_text(json.dumps({"seq": room.seq, "kind": "snapshot", "room": room.snapshot()}))
+        while q in room.subscribers or not q.empty():
+            nxt = asyncio.ensure_future(q.get())
+            await asyncio.wait((nxt, gone), return_when=asyncio.FIRST_COMPLETED)
+            if gone.done():
+                nxt.cancel()
+                return
+            await ws.send_text(nxt.result())
+        await ws.close(code=4408)  # fell behind; reconnect to resync
+    except WebSocketDisconnect:
+        pass
+    finally:
+        gone.cancel()
+        room.subscribers.discard(q)
+
+
+async def _until_disconnect(ws: WebSocket):
+    """Read and ignore client messages until the socket closes."""
+    while (await ws.receive())["type"] != "websocket.disconnect":
+        pass
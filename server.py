@@ -1,62 +1,221 @@
 # server.py
+import hashlib
+import hmac
+import json
 import random
-from typing import Dict, Any, Optional, List
-from fastapi import FastAPI, Body
+import secrets
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, Callable, Tuple
+
+import anyio.to_thread
+from fastapi import FastAPI, Body, Depends, Request, Response, HTTPException
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
-from collections import deque
+from starlette.concurrency import run_in_threadpool
+from collections import OrderedDict
 
 from board import BOARD, Tile
 from logic import (
     generate_lc_question, score_lc_answer,
     generate_sd_prompt, score_sd_answer,
     generate_beh_prompt, score_beh_answer,
-    generate_card, llm_status
+    generate_card, llm_status, local_only, model_configured, _client
 )
-
-GAME: Dict[str, Any] = {}
+import accounts
+import analytics
+import model_router
+import qpool
+import tracing
+from tracing import span, tag
+from store import Journal, VersionConflict, open_backend, STATE_CACHE_SIZE
+from gamestate import GameState
+from dedup import QUESTIONS, SeenSet, signature, question_text
+import skill
+from grading import JOBS, GRADE_TIMEOUT_S, new_job_id
+from admission import GATE, admit, MODEL_CONCURRENCY, MODEL_QUEUE
+from answer_cache import ANSWERS
+
+try:
+    import orjson
+except ImportError:  # in requirements.txt; the stdlib encoder produces the same JSON, slower
+    orjson = None
+
+# Game state lives in BACKEND keyed by the "gid" cookie; routes never keep it between requests,
+# so any worker can serve any game. See _update() for the commit/retry loop.
+BACKEND = open_backend()
+GID_COOKIE = "gid"
+COMMIT_RETRIES = 8
+DEDUP_RETRIES = 2  # regenerations before accepting a question the player has already seen
+GRADE_MAX_WAIT_S = 25.0  # longest GET /grade long-poll
+CHEAP_THREADS = 16  # request threads kept free of model-bound work, see _lifespan
 
 
 def _debug(msg: str):
     print(f"[server] {msg}")
 
 
-# FORCED_ROLLS = deque([
-#     (2, 2),
-#     (4, 4),
-#     (6, 2),
-#     (2, 6),
-#     (4, 4),
-#     (4, 4),
-# ])
-
-
-def new_game():
-    GAME.clear()
-    GAME.update({
-        "pos": 0,
-        "pos_prev": 0,
-        "offers": 0,
-        "owned": [],  # list of {"name": <tile_name>}
-        "houses": {},  # map: property_name -> house_count (int)
-        "turns": 20,
-
-        "pending": None,
-        "prefetch": None,
-        "last_outcome": None,
-
-        "skip_turn": False,
-        "extra_roll": False,
-        "passed_start": False,
-    })
-    _debug(f"new_game created, llm_status={llm_status()}")
-
-
-def end_turn():
-    if GAME.get("extra_roll"):
-        GAME["extra_roll"] = False
+def new_seed() -> int:
+    return secrets.randbits(32) or 1  # 0 marks games saved before seeding
+
+
+def new_game(seed: Optional[int] = None) -> GameState:
+    g = GameState(turns=20, seed=seed if seed else new_seed())
+    g.skill = skill.new_skill()
+    _debug(f"new_game created, seed={g.seed}")
+    return g
+
+
+# ---------- Game lookup / commit ----------
+
+def _create_game(request: Request, response: Response, seed: Optional[int] = None) -> str:
+    gid = uuid.uuid4().hex
+    BACKEND.create(gid, new_game(seed))
+    account_id = accounts.account_of(request)
+    if account_id:
+        accounts.ACCOUNTS.link(gid, account_id)
+    response.set_cookie(GID_COOKIE, gid, httponly=True, samesite="lax", max_age=30 * 24 * 3600)
+    return gid
+
+
+def resume_token(gid: str) -> str:
+    """Proof of owning a game: whoever was handed it may resume the game in another browser."""
+    return hmac.new(BACKEND.secret(), gid.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+
+def _may_resume(request: Request, gid: str, token: Optional[str]) -> bool:
+    if request.cookies.get(GID_COOKIE) == gid:
+        return True
+    if token and hmac.compare_digest(token, resume_token(gid)):
+        return True
+    account_id = accounts.account_of(request)
+    return account_id is not None and accounts.ACCOUNTS.owner(gid) == account_id
+
+
+def _game_id(request: Request, response: Response) -> str:
+    """The caller's game id, starting a new game if the cookie is missing or unknown."""
+    gid = request.cookies.get(GID_COOKIE)
+    if gid and BACKEND.exists(gid):
+        return gid
+    return _create_game(request, response)
+
+
+def _load(gid: str) -> GameState:
+    loaded = BACKEND.load(gid)
+    if loaded is None:
+        raise HTTPException(status_code=404, detail="Unknown game")
+    return loaded[1]
+
+
+def _update(gid: str, fn: Callable[[GameState, Journal], Any]) -> Tuple[Any, GameState]:
+    """
+    Load, apply fn(g, journal), commit with the loaded version; on a concurrent write reload
+    and re-apply. fn must be quick and side-effect free (no model calls) since it may re-run.
+    A commit that leaves the game out of turns reports it to the account history. Committed
+    events are handed to the analytics buffer.
+    """
+    for _ in range(COMMIT_RETRIES):
+        version, g = BACKEND.load(gid)
+        j = Journal(g)
+        result = fn(g, j)
+        try:
+            BACKEND.commit(gid, version, j, g)
+            analytics.SINK.emit(gid, j.events, g)
+            if g.turns <= 0:
+                accounts.ACCOUNTS.finish(gid, g)
+            return result, g
+        except VersionConflict:
+            _debug(f"version conflict on {gid}@{version}, retrying")
+    raise HTTPException(status_code=409, detail="Game is busy, retry")
+
+
+def _issue_pending(g: GameState, j: Journal, pending: Dict[str, Any], prefetched: bool = False):
+    g.pending = pending
+    if pending.get("sig"):
+        seen = SeenSet(g.seen)
+        seen.add(tuple(pending["sig"]))
+        g.seen = seen.to_bytes()
+    q = pending.get("question") or {}
+    j.record("question", type=pending.get("type"), title=q.get("title"), prefetched=prefetched)
+
+
+def public_pending(pending: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Pending challenge as shown to the player: grading artifacts and signatures stay server-side."""
+    if not pending:
+        return pending
+    q = {k: v for k, v in (pending.get("question") or {}).items() if k != "grading"}
+    return {**{k: v for k, v in pending.items() if k != "sig"}, "question": q}
+
+
+# ---------- /state payloads ----------
+
+def _encode(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+# The board never changes, so it is encoded once
+BOARD_JSON = _encode([{"name": t.name, "ttype": t.ttype, "payload": t.payload} for t in BOARD])
+
+
+class StatePayloads:
+    """
+    Per-worker cache of each game's encoded /state fields, keyed by the backend version it
+    was built from. A poll of an unchanged game costs a version lookup and a byte join.
+    """
+
+    def __init__(self, size: int = STATE_CACHE_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[int, bytes]]" = OrderedDict()
+
+    def get(self, gid: str, version: Optional[int]) -> Optional[bytes]:
+        with self.lock:
+            hit = self._items.get(gid)
+            if hit is None or hit[0] != version:
+                return None
+            self._items.move_to_end(gid)
+            return hit[1]
+
+    def put(self, gid: str, version: int, fields: bytes):
+        with self.lock:
+            hit = self._items.get(gid)
+            if hit is not None and hit[0] > version:
+                return  # a slower poll built an older version; keep the newer one
+            self._items[gid] = (version, fields)
+            self._items.move_to_end(gid)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+STATE_PAYLOADS = StatePayloads()
+
+
+def _state_fields(gid: str, g: GameState) -> bytes:
+    """The game's part of the /state object, encoded without the closing brace."""
+    return _encode({
+        "game_id": gid,
+        "pos": g.pos,
+        "pos_prev": g.pos_prev,
+        "offers": g.offers,
+        "owned": g.owned_list(),
+        "houses": g.houses_map(),
+        "turns": g.turns,
+        "pending": public_pending(g.pending),
+        "last_outcome": g.last_outcome,
+        "has_prefetch": g.prefetch is not None,
+        "skill": skill.summary(g.skill),
+    })[:-1]
+
+
+def end_turn(g: GameState):
+    if g.extra_roll:
+        g.extra_roll = False
     else:
-        GAME["turns"] -= 1
+        g.turns -= 1
 
 
 def side_for_index(i: int) -> str:
@@ -86,24 +245,13 @@ def _is_ownable_property(tile: Tile) -> bool:
     return tile.ttype == "COMPANY" and tile.payload.get("group") not in ("RR", "UTIL")
 
 
-def _landed_property_name() -> Optional[str]:
-    tile = BOARD[GAME["pos"]]
+def _landed_property_name(g: GameState) -> Optional[str]:
+    tile = BOARD[g.pos]
     if _is_ownable_property(tile):
         return tile.name
     return None
 
 
-def _owned_names_set() -> set:
-    return {o.get("name") for o in GAME["owned"] if isinstance(o, dict)}
-
-
-def _tile_by_name(name: str) -> Optional[Tile]:
-    for t in BOARD:
-        if t.name == name:
-            return t
-    return None
-
-
 def _group_of(tile: Tile) -> Optional[str]:
     if tile.ttype != "COMPANY":
         return None
@@ -114,69 +262,54 @@ def _properties_in_group(group: str) -> List[str]:
     return [t.name for t in BOARD if _is_ownable_property(t) and _group_of(t) == group]
 
 
-def _has_full_monopoly(group: str) -> bool:
-    if not group:
-        return False
-    needed = set(_properties_in_group(group))
-    if not needed:
-        return False
-    return needed.issubset(_owned_names_set())
+# Board positions as bit masks, matching GameState.owned
+_GROUP_MASKS: Dict[str, int] = {}
+for _i, _t in enumerate(BOARD):
+    if _is_ownable_property(_t):
+        _GROUP_MASKS[_group_of(_t)] = _GROUP_MASKS.get(_group_of(_t), 0) | 1 << _i
+_RR_MASK = sum(1 << i for i, t in enumerate(BOARD) if _group_of(t) == "RR")
+
 
+def _has_full_monopoly(g: GameState, group: str) -> bool:
+    mask = _GROUP_MASKS.get(group, 0) if group else 0
+    return bool(mask) and g.owns_all(mask)
 
-def _missing_in_group(group: str) -> List[str]:
-    needed = set(_properties_in_group(group))
-    return sorted(list(needed - _owned_names_set()))
 
+def _missing_in_group(g: GameState, group: str) -> List[str]:
+    mask = _GROUP_MASKS.get(group, 0)
+    return sorted(BOARD[i].name for i in range(len(BOARD)) if mask >> i & 1 and not g.owns(i))
 
-def _grant_ownership_if_applicable():
+
+def _grant_ownership_if_applicable(g: GameState):
     """Add current tile to ownership if ownable (color prop) and not already owned."""
-    prop = _landed_property_name()
-    if not prop:
-        return
-    if any(o.get("name") == prop for o in GAME["owned"]):
-        return
-    GAME["owned"].append({"name": prop})
+    if _landed_property_name(g):
+        g.own(g.pos)
 
 
-def _maybe_build_house_on_current() -> bool:
+def _maybe_build_house_on_current(g: GameState) -> bool:
     """
     If player already owns the landed property AND owns the full color group,
     increment its house count. Returns True if a house was built.
     """
-    prop = _landed_property_name()
-    if not prop:
-        return False
-    if prop not in _owned_names_set():
+    if not _landed_property_name(g) or not g.owns(g.pos):
         return False
-    tile = BOARD[GAME["pos"]]
-    group = _group_of(tile)
-    if not _has_full_monopoly(group):
+    if not _has_full_monopoly(g, _group_of(BOARD[g.pos])):
         return False
-    GAME["houses"][prop] = GAME["houses"].get(prop, 0) + 1
+    g.houses[g.pos] += 1
     return True
 
 
-def _owned_railroad_count() -> int:
+def _owned_railroad_count(g: GameState) -> int:
     """Count how many distinct railroads are owned."""
-    cnt = 0
-    for o in GAME["owned"]:
-        name = o.get("name")
-        t = _tile_by_name(name) if name else None
-        if t and t.ttype == "COMPANY" and t.payload.get("group") == "RR":
-            cnt += 1
-    return cnt
+    return (g.owned & _RR_MASK).bit_count()
 
 
-def _own_current_railroad_if_needed() -> bool:
+def _own_current_railroad_if_needed(g: GameState) -> bool:
     """Own the current railroad tile if not already owned. Returns True if newly owned."""
-    tile = BOARD[GAME["pos"]]
+    tile = BOARD[g.pos]
     if tile.ttype != "COMPANY" or tile.payload.get("group") != "RR":
         return False
-    name = tile.name
-    if name in _owned_names_set():
-        return False
-    GAME["owned"].append({"name": name})
-    return True
+    return g.own(g.pos)
 
 
 # ---------- Progression reward schedules ----------
@@ -223,36 +356,38 @@ def _reward_for_property_progress(diff: str, before_owned: bool, built_house: bo
     return 0
 
 
-def resolve_non_llm_immediate(tile: Tile):
+def resolve_non_llm_immediate(g: GameState, j: Journal, tile: Tile, card: Optional[Dict[str, Any]] = None):
     # Passing GO grants offer points
-    if GAME.get("passed_start"):
-        GAME["offers"] += 200
-        GAME["passed_start"] = False
+    if g.passed_start:
+        g.offers += 200
+        g.passed_start = False
 
     t = tile.ttype
     if t in ("START", "JAIL", "FREE_PARKING"):
-        end_turn()
+        end_turn(g)
         return {"pending": None}
 
     if t == "GOTO_JAIL":
         jail_idx = next((i for i, tt in enumerate(BOARD) if tt.ttype == "JAIL"), None)
         if jail_idx is not None:
-            GAME["pos_prev"] = GAME["pos"]
-            GAME["pos"] = jail_idx
-        end_turn()
-        GAME["last_outcome"] = {"kind": "warning", "title": "Go to Jail!", "feedback": "", "judge_source": None}
+            g.pos_prev = g.pos
+            g.pos = jail_idx
+        end_turn(g)
+        j.record("jail", pos=g.pos)
+        g.last_outcome = {"kind": "warning", "title": "Go to Jail!", "feedback": "", "judge_source": None}
         return {"pending": None}
 
     if t in ("CHANCE", "COMMUNITY"):
-        card = generate_card()
+        card = card or generate_card()
         eff = card.get("effect", {})
-        GAME["offers"] += eff.get("offers", 0)
+        g.offers += eff.get("offers", 0)
         if eff.get("turn_skip"):
-            GAME["skip_turn"] = True
+            g.skip_turn = True
         if eff.get("extra_roll"):
-            GAME["extra_roll"] = True
-        end_turn()
-        GAME["last_outcome"] = {
+            g.extra_roll = True
+        end_turn(g)
+        j.record("card", deck=t, title=card.get("title"), effect=eff)
+        g.last_outcome = {
             "kind": "info",
             "title": card.get("title", t.title()),
             "feedback": card.get("text", ""),
@@ -263,7 +398,116 @@ def resolve_non_llm_immediate(tile: Tile):
     return {"pending": None}
 
 
-app = FastAPI()
+def _question_for_landing(g: GameState, pos: Optional[int] = None) -> Optional[Tuple[str, str]]:
+    """
+    (qkind, difficulty) of the question landing on pos (default: g's square) asks, or None.
+    Railroads always ask a MEDIUM LC. Owned color properties without the full set ask nothing.
+    """
+    pos = g.pos if pos is None else pos
+    landing = BOARD[pos]
+    group = _group_of(landing)
+    if landing.ttype == "COMPANY" and group == "RR":
+        return "LC", "MEDIUM"
+    if landing.ttype == "COMPANY" and group not in ("RR", "UTIL"):
+        if g.owns(pos) and not _has_full_monopoly(g, group):
+            return None
+        qkind = (landing.payload.get("qkind") or "").upper()
+        if qkind in ("LC", "SD", "BH"):
+            return qkind, skill.adapt(g.skill, qkind, lc_diff_for_side(pos))
+    return None
+
+
+def _demand_forecast(g: GameState) -> Dict[Tuple[str, str], float]:
+    """Probability of each (qkind, difficulty) question on the next roll from g's square (2d6, no doubles/cards)."""
+    out: Dict[Tuple[str, str], float] = {}
+    for total, p in skill.DICE:
+        plan = _question_for_landing(g, (g.pos + total) % len(BOARD))
+        if plan:
+            out[plan] = out.get(plan, 0.0) + p
+    return out
+
+
+def _generate_pending(qkind: str, diff: str, seen: Optional[SeenSet] = None,
+                      rng: Optional[random.Random] = None) -> Dict[str, Any]:
+    """Model-backed (slow) question generation; call outside _update().
+
+    Takes a ready question from the shared pool when there is one, then regenerates up to
+    DEDUP_RETRIES times while the question is a near-duplicate of one in seen.
+    Local picks (content pack, built-in bank, topics) draw from rng, usually the game's "question" stream.
+    """
+    for attempt in range(DEDUP_RETRIES + 1):
+        pending = qpool.POOL.pop(qkind, diff) or _generate_once(qkind, diff, rng)
+        sig = signature(question_text(pending["question"]))
+        pending["sig"] = list(sig)
+        if seen is None or not seen.near(sig):
+            break
+        _debug(f"near-duplicate {qkind} question {pending['question'].get('title')!r} (attempt {attempt + 1})")
+    _, inserted = QUESTIONS.add(sig)
+    if inserted:
+        _debug(f"question index size={len(QUESTIONS)}")
+    return pending
+
+
+def _generate_once(qkind: str, diff: str, rng: Optional[random.Random] = None) -> Dict[str, Any]:
+    if qkind == "LC":
+        return {"type": f"LC_{diff}", "question": generate_lc_question(diff, rng=rng)}
+    if qkind == "SD":
+        return {"type": "SYS_DESIGN", "question": generate_sd_prompt(diff, rng=rng), "difficulty": diff}
+    return {"type": "BEHAVIORAL", "question": generate_beh_prompt(diff, rng=rng), "difficulty": diff}
+
+
+def _refill_one(qkind: str, diff: str) -> Optional[Dict[str, Any]]:
+    """A model-written question for the shared pool; None without a model or for a near-copy."""
+    if _client() is None:
+        return None  # local content is already shared through the memory-mapped pack
+    pending = _generate_once(qkind, diff)
+    _, inserted = QUESTIONS.add(signature(question_text(pending["question"])))
+    return pending if inserted else None
+
+
+# ---------- Admission ----------
+
+def _generate_admitted(client: str, qkind: str, diff: str, seen: Optional[SeenSet] = None,
+                       rng: Optional[random.Random] = None) -> Dict[str, Any]:
+    """_generate_pending behind the admission gate; when refused, the question comes from local content."""
+    with admit(client, "resolve") as ok:
+        if ok:
+            return _generate_pending(qkind, diff, seen, rng)
+    _debug(f"model busy, local {qkind} question for {client}")
+    with local_only():
+        return _generate_pending(qkind, diff, seen, rng)
+
+
+def _grade_admitted(client: str, p: Dict[str, Any], text: str, pos: int) -> Tuple[bool, str, str, Optional[str]]:
+    """_grade behind the admission gate; when refused, the local judge decides."""
+    with admit(client, "grade") as ok:
+        if ok:
+            return _grade(p, text, pos)
+    _debug(f"model busy, grading locally for {client}")
+    with local_only():
+        return _grade(p, text, pos)
+
+
+def _busy(what: str) -> JSONResponse:
+    return JSONResponse({"ok": False, "error": f"Model busy, {what} skipped"}, status_code=503,
+                        headers={"Retry-After": str(GATE.retry_after())})
+
+
+@asynccontextmanager
+async def _lifespan(app):
+    # Requests blocked on the model (running or queued at the gate) each hold a threadpool thread;
+    # keep enough on top of them that /state and static files never wait behind the model
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = max(limiter.total_tokens, MODEL_CONCURRENCY + MODEL_QUEUE + CHEAP_THREADS)
+    if model_configured():
+        qpool.REFILLER.start(_refill_one)
+    elif qpool.POOL.enabled:
+        _debug("no model configured, question pool refiller not started")
+    yield
+
+
+app = FastAPI(lifespan=_lifespan)
+tracing.install(app)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
@@ -282,200 +526,201 @@ def get_llm_status():
     return st
 
 
+@app.get("/admin/models", dependencies=[Depends(tracing.require_admin)])
+def get_model_routes():
+    """Per-route model candidates with their recent latency, errors and token usage, plus the admission gate."""
+    return {**model_router.ROUTER.snapshot(), "admission": GATE.stats(), "grading": JOBS.stats(),
+            "accounts": accounts.ACCOUNTS.stats(), "answer_cache": ANSWERS.stats(),
+            "analytics": analytics.SINK.stats(), "question_pool": qpool.POOL.stats()}
+
+
 @app.get("/state")
-def get_state():
-    if not GAME:
-        new_game()
+def get_state(request: Request, response: Response):
+    gid = _game_id(request, response)
     st = llm_status()
     _debug(
         f"GET /state llm={st['mode']} dotenv_loaded={st['dotenv_loaded']} api_key_present={st['api_key_present']} use_llm_flag={st['use_llm_flag']} model={st['model']} last_error={st['last_llm_error']}")
-    return {
-        "pos": GAME["pos"],
-        "pos_prev": GAME["pos_prev"],
-        "offers": GAME["offers"],
-        "owned": GAME["owned"],
-        "houses": GAME["houses"],
-        "turns": GAME["turns"],
-        "pending": GAME["pending"],
-        "last_outcome": GAME.get("last_outcome"),
-        "has_prefetch": GAME.get("prefetch") is not None,
-        "llm": st,
-        "board": [
-            {"name": t.name, "ttype": t.ttype, "payload": t.payload}
-            for t in BOARD
-        ],
-    }
+    with span("state.build"):
+        fields = STATE_PAYLOADS.get(gid, BACKEND.version(gid))
+        if fields is None:
+            loaded = BACKEND.load(gid)
+            if loaded is None:
+                raise HTTPException(status_code=404, detail="Unknown game")
+            fields = _state_fields(gid, loaded[1])
+            STATE_PAYLOADS.put(gid, loaded[0], fields)
+        body = b"".join((fields, b',"llm":', _encode(st), b',"board":', BOARD_JSON, b"}"))
+    out = Response(content=body, media_type="application/json")
+    out.headers.raw.extend(response.headers.raw)  # the gid cookie when this poll started a game
+    return out
 
 
 @app.post("/new")
-def post_new():
-    new_game()
-    _debug("POST /new")
-    return {"ok": True}
+def post_new(request: Request, response: Response, seed: Optional[int] = Body(None, embed=True)):
+    """Start a game; a fixed seed replays the same dice, cards and local questions."""
+    gid = _create_game(request, response, seed)
+    _debug(f"POST /new {gid}")
+    return {"ok": True, "game_id": gid, "resume_token": resume_token(gid)}
+
+
+@app.get("/games")
+def get_games(request: Request, limit: int = 20):
+    """The caller's games: the one in its cookie and, when signed in, the account's."""
+    gids = [request.cookies.get(GID_COOKIE) or ""]
+    account_id = accounts.account_of(request)
+    if account_id:
+        gids += accounts.ACCOUNTS.owned(account_id)
+    games = BACKEND.list_games([g for g in gids if g], max(1, min(limit, 100)))
+    return {"games": [{**row, "resume_token": resume_token(row["game_id"])} for row in games]}
+
+
+@app.post("/resume")
+def post_resume(request: Request, response: Response, game_id: str = Body(..., embed=True),
+                token: Optional[str] = Body(None, embed=True)):
+    """Continue a game given its resume token, or one owned by the signed-in account."""
+    # Someone else's game looks exactly like a missing one
+    if not _may_resume(request, game_id, token) or not BACKEND.exists(game_id):
+        return JSONResponse({"ok": False, "error": "Unknown game"}, status_code=404)
+    response.set_cookie(GID_COOKIE, game_id, httponly=True, samesite="lax", max_age=30 * 24 * 3600)
+    _debug(f"POST /resume {game_id}")
+    return {"ok": True, "game_id": game_id}
+
+
+def roll_dice(gid: str) -> Tuple[Optional[Dict[str, Any]], GameState]:
+    """Roll and move from the game's "dice" stream; (None, g) while an answer is being graded."""
+
+    def apply(g, j):
+        if _grading_job(g.pending):
+            return None
+        if g.skip_turn:
+            g.skip_turn = False
+            g.turns -= 1
+            j.record("skip")
+            return {"skipped": True, "message": "Turn skipped", "pos": g.pos, "pos_prev": g.pos_prev,
+                    "path": [], "d1": 0, "d2": 0, "total": 0}
+
+        if not g.seed:
+            g.seed = new_seed()
+        g.rolls += 1
+        dice = g.rng("dice")
+        d1, d2 = dice.randint(1, 6), dice.randint(1, 6)
+        total = d1 + d2
+        old = g.pos
+        path = [(old + i) % len(BOARD) for i in range(1, total + 1)]
+        newp = path[-1]
+
+        g.pos_prev = old
+        g.pos = newp
+        g.passed_start = newp < old
+        j.record("roll", d1=d1, d2=d2, pos=newp)
+        return {"skipped": False, "d1": d1, "d2": d2, "total": total, "pos": newp, "pos_prev": old, "path": path}
+
+    out, g = _update(gid, apply)
+    if out is not None and qpool.POOL.enabled:
+        # The next roll starts from here, so this is a full turn of lead time for pre-generation
+        qpool.POOL.expect(_demand_forecast(g))
+    return out, g
 
 
 @app.post("/roll")
-def post_roll():
-    if not GAME:
-        new_game()
-
-    if GAME.get("skip_turn"):
-        GAME["skip_turn"] = False
-        GAME["turns"] -= 1
+def post_roll(request: Request, response: Response):
+    gid = _game_id(request, response)
+    out, g = roll_dice(gid)
+    if out is None:
+        return JSONResponse({"ok": False, "error": "Answer is still being graded", "job_id": g.pending["job"]},
+                            status_code=409)
+    if out["skipped"]:
         _debug("POST /roll skipped a turn")
-        return {"skipped": True, "message": "Turn skipped", "pos": GAME["pos"], "pos_prev": GAME["pos_prev"],
-                "path": [], "d1": 0, "d2": 0, "total": 0}
-
-    if 'FORCED_ROLLS' in globals() and isinstance(globals().get('FORCED_ROLLS'), deque) and globals()['FORCED_ROLLS']:
-        d1, d2 = globals()['FORCED_ROLLS'].popleft()
     else:
-        d1 = random.randint(1, 6)
-        d2 = random.randint(1, 6)
-    total = d1 + d2
-
-    old = GAME["pos"]
-    path = [(old + i) % len(BOARD) for i in range(1, total + 1)]
-    newp = path[-1]
-
-    GAME["pos_prev"] = old
-    GAME["pos"] = newp
-    GAME["passed_start"] = newp < old
-
-    _debug(f"POST /roll d1={d1} d2={d2} total={total} old={old} new={newp}")
-    return {"skipped": False, "d1": d1, "d2": d2, "total": total, "pos": newp, "pos_prev": old, "path": path}
+        _debug(f"POST /roll d1={out['d1']} d2={out['d2']} total={out['total']} old={out['pos_prev']} new={out['pos']}")
+    return out
 
 
 @app.post("/prefetch")
-def post_prefetch(pos: int = Body(..., embed=True)):
+def post_prefetch(request: Request, response: Response, pos: int = Body(..., embed=True)):
+    gid = _game_id(request, response)
+    g = _load(gid)
     landing = BOARD[pos]
-    group = landing.payload.get("group") if landing.ttype == "COMPANY" else None
-
-    # Railroads: prefetch MEDIUM LC
-    if landing.ttype == "COMPANY" and group == "RR":
-        diff = "MEDIUM"
-        q = generate_lc_question(diff)
-        GAME["prefetch"] = {"pos": pos, "pending": {"type": f"LC_{diff}", "question": q}}
-        _debug("POST /prefetch created RR LC_MEDIUM")
-        return {"ok": True, "has_prefetch": True}
-
-    if landing.ttype == "COMPANY" and group not in ("RR", "UTIL"):
-        # If the property is already owned but not a full monopoly, do not prefetch
-        prop_name = landing.name
-        owned = prop_name in _owned_names_set()
-        g = _group_of(landing)
-        has_mono = _has_full_monopoly(g) if owned else False
-
-        if owned and not has_mono:
-            GAME["prefetch"] = None
-            _debug("POST /prefetch suppressed due to no full monopoly on owned property")
-            return {"ok": True, "has_prefetch": False}
-
-        qkind = (landing.payload.get("qkind") or "").upper()
-        diff = lc_diff_for_side(pos)
-        if qkind == "LC":
-            q = generate_lc_question(diff)
-            GAME["prefetch"] = {"pos": pos, "pending": {"type": f"LC_{diff}", "question": q}}
-        elif qkind == "SD":
-            q = generate_sd_prompt(diff)
-            GAME["prefetch"] = {"pos": pos, "pending": {"type": "SYS_DESIGN", "question": q, "difficulty": diff}}
-        elif qkind == "BH":
-            q = generate_beh_prompt(diff)
-            GAME["prefetch"] = {"pos": pos, "pending": {"type": "BEHAVIORAL", "question": q, "difficulty": diff}}
-        else:
-            GAME["prefetch"] = None
-    else:
-        GAME["prefetch"] = None
 
-    _debug(f"POST /prefetch pos={pos} has_prefetch={GAME['prefetch'] is not None}")
-    return {"ok": True, "has_prefetch": GAME["prefetch"] is not None}
+    # Same rules as /resolve: RR -> MEDIUM LC, owned color property without the full set -> nothing
+    plan = _question_for_landing(g, pos)
+    pending = None
+    if plan:
+        # Speculative: only on an idle model slot, never queued ahead of real work
+        with admit(gid, "prefetch") as ok:
+            if not ok:
+                return _busy("prefetch")
+            pending = _generate_pending(*plan, seen=SeenSet(g.seen), rng=g.rng("question"))
+    if landing.ttype == "COMPANY" and _group_of(landing) not in ("RR", "UTIL") and plan is None:
+        _debug("POST /prefetch suppressed due to no full monopoly on owned property")
+
+    def apply(g, j):
+        g.prefetch = {"pos": pos, "pending": pending} if pending else None
+        j.record("prefetch", pos=pos, type=pending["type"] if pending else None)
+
+    _update(gid, apply)
+    _debug(f"POST /prefetch pos={pos} has_prefetch={pending is not None}")
+    return {"ok": True, "has_prefetch": pending is not None}
+
+
+def resolve_landing(gid: str) -> Dict[str, Any]:
+    """Settle the square the last roll landed on: issue its question or apply the tile."""
+    g = _load(gid)
+    landing = BOARD[g.pos]
+    group = _group_of(landing)
+    prefetched = g.prefetch and g.prefetch.get("pos") == g.pos
+
+    # Slow work happens before the commit: a fresh question, or the card for CHANCE/COMMUNITY
+    plan = _question_for_landing(g)
+    # Both draw from the game's streams for this roll, so a prefetch and a fresh /resolve pick alike
+    fresh = _generate_admitted(gid, *plan, seen=SeenSet(g.seen), rng=g.rng("question")) \
+        if plan and not prefetched else None
+    card = generate_card(g.rng("card")) if landing.ttype in ("CHANCE", "COMMUNITY") else None
+
+    def apply(g, j):
+        j.record("landing", pos=g.pos, tile=landing.name)
+
+        # Railroads and color properties: issue the question (prefetched if it is ready)
+        if landing.ttype == "COMPANY" and group != "UTIL":
+            if group != "RR" and g.owns(g.pos) and not _has_full_monopoly(g, group):
+                # If owned but not a full monopoly: no question, show info, end turn
+                missing = _missing_in_group(g, group)
+                g.last_outcome = {
+                    "kind": "info",
+                    "title": "You own this, but not the full set",
+                    "feedback": f"You need the entire {group} set to start building. Missing: {', '.join(missing)}." if missing else f"You need the entire {group} set to start building.",
+                    "judge_source": None,
+                }
+                end_turn(g)
+                return "owned-no-monopoly", {"pending": None}
+
+            if g.prefetch and g.prefetch.get("pos") == g.pos:
+                _issue_pending(g, j, g.prefetch["pending"], prefetched=True)
+                g.prefetch = None
+                return "served prefetched pending", {"pending": public_pending(g.pending)}
+            if fresh is not None:
+                _issue_pending(g, j, fresh)
+                return f"created {fresh['type']} pending", {"pending": public_pending(g.pending)}
+            if g.pending:
+                # A concurrent /resolve already issued this landing's question
+                return "pending already issued", {"pending": public_pending(g.pending)}
+            return "no question for tile", resolve_non_llm_immediate(g, j, landing, card)
+
+        g.prefetch = None
+        return "non-company tile", resolve_non_llm_immediate(g, j, landing, card)
+
+    (what, out), _ = _update(gid, apply)
+    _debug(f"resolve {what}")
+    return out
 
 
 @app.post("/resolve")
-def post_resolve():
-    landing = BOARD[GAME["pos"]]
-    group = landing.payload.get("group") if landing.ttype == "COMPANY" else None
-
-    # Railroads: issue MEDIUM LC question
-    if landing.ttype == "COMPANY" and group == "RR":
-        if GAME.get("prefetch") and GAME["prefetch"].get("pos") == GAME["pos"]:
-            GAME["pending"] = GAME["prefetch"]["pending"]
-            GAME["prefetch"] = None
-            _debug("POST /resolve served prefetched RR LC_MEDIUM")
-            return {"pending": GAME["pending"]}
-        diff = "MEDIUM"
-        q = generate_lc_question(diff)
-        GAME["pending"] = {"type": f"LC_{diff}", "question": q}
-        _debug("POST /resolve created RR LC_MEDIUM")
-        return {"pending": GAME["pending"]}
-
-    if landing.ttype == "COMPANY" and group not in ("RR", "UTIL"):
-        prop_name = landing.name
-        owned = prop_name in _owned_names_set()
-        g = _group_of(landing)
-        has_mono = _has_full_monopoly(g) if owned else False
-
-        # If owned but not a full monopoly: no question, show info, end turn
-        if owned and not has_mono:
-            missing = _missing_in_group(g)
-            GAME["last_outcome"] = {
-                "kind": "info",
-                "title": "You own this, but not the full set",
-                "feedback": f"You need the entire {g} set to start building. Missing: {', '.join(missing)}." if missing else f"You need the entire {g} set to start building.",
-                "judge_source": None,
-            }
-            end_turn()
-            _debug(f"POST /resolve owned-no-monopoly, missing={missing}")
-            return {"pending": None}
-
-        # If not owned, or owned with a full monopoly, proceed to create a question
-        if GAME.get("prefetch") and GAME["prefetch"].get("pos") == GAME["pos"]:
-            GAME["pending"] = GAME["prefetch"]["pending"]
-            GAME["prefetch"] = None
-            _debug("POST /resolve served prefetched pending")
-            return {"pending": GAME["pending"]}
-
-        qkind = (landing.payload.get("qkind") or "").upper()
-        diff = lc_diff_for_side(GAME["pos"])
-        if qkind == "LC":
-            q = generate_lc_question(diff)
-            GAME["pending"] = {"type": f"LC_{diff}", "question": q}
-            _debug("POST /resolve created LC pending")
-            return {"pending": GAME["pending"]}
-        if qkind == "SD":
-            q = generate_sd_prompt(diff)
-            GAME["pending"] = {"type": "SYS_DESIGN", "question": q, "difficulty": diff}
-            _debug("POST /resolve created SD pending")
-            return {"pending": GAME["pending"]}
-        if qkind == "BH":
-            q = generate_beh_prompt(diff)
-            GAME["pending"] = {"type": "BEHAVIORAL", "question": q, "difficulty": diff}
-            _debug("POST /resolve created BH pending")
-            return {"pending": GAME["pending"]}
-        return resolve_non_llm_immediate(landing)
-
-    GAME["prefetch"] = None
-    _debug("POST /resolve non-company tile")
-    return resolve_non_llm_immediate(landing)
+def post_resolve(request: Request, response: Response):
+    return resolve_landing(_game_id(request, response))
 
 
-@app.post("/submit_answer")
-def post_submit_answer(payload: Dict[str, Any]):
-    p = GAME.get("pending")
-    if not p:
-        _debug("POST /submit_answer but no pending")
-        return JSONResponse({"ok": False, "error": "No pending challenge"}, status_code=400)
-
-    text = payload.get("text", "") or ""
+def _grade(p: Dict[str, Any], text: str, pos: int) -> Tuple[bool, str, str, Optional[str]]:
+    """Judge an answer to pending challenge p (may call the model). Returns (passed, diff, feedback, judge_source)."""
     kind = p["type"]  # e.g., LC_EASY, LC_MEDIUM, LC_HARD, SYS_DESIGN, BEHAVIORAL
-
-    _debug(f"POST /submit_answer kind={kind}")
-    build_house = False
-
-    # Identify landing tile and its group
-    landing = BOARD[GAME["pos"]]
-    group = landing.payload.get("group") if landing.ttype == "COMPANY" else None
-
-    # ---------- Grade ----------
     passed = False
     judge_source = None
     feedback = ""
@@ -489,14 +734,14 @@ def post_submit_answer(payload: Dict[str, Any]):
         judge_source = res.get("judge_source")
         feedback = res.get("feedback", "")
     elif kind == "SYS_DESIGN":
-        diff = (p.get("difficulty") or lc_diff_for_side(GAME["pos"])).upper()
-        res = score_sd_answer(p["question"].get("rubric", []), text)
+        diff = (p.get("difficulty") or lc_diff_for_side(pos)).upper()
+        res = score_sd_answer(p["question"].get("rubric", []), text, p["question"].get("grading"), p["question"])
         passed = bool(res.get("correct"))
         judge_source = res.get("judge_source")
         feedback = res.get("feedback", "")
     elif kind == "BEHAVIORAL":
-        diff = (p.get("difficulty") or lc_diff_for_side(GAME["pos"])).upper()
-        res = score_beh_answer(text)
+        diff = (p.get("difficulty") or lc_diff_for_side(pos)).upper()
+        res = score_beh_answer(text, p["question"])
         passed = bool(res.get("correct"))
         judge_source = res.get("judge_source")
         feedback = res.get("feedback", "")
@@ -504,37 +749,54 @@ def post_submit_answer(payload: Dict[str, Any]):
         # Unknown kind, treat as fail-safe
         diff = "MEDIUM"
         passed = False
+    return passed, diff, feedback, judge_source
+
+
+def _apply_verdict(g: GameState, j: Journal, kind: str, diff: str, passed: bool,
+                   feedback: str, judge_source: Optional[str], grade_ms: Optional[float] = None) -> int:
+    """Reward bookkeeping for a graded answer on the current tile. Returns the reward."""
+    build_house = False
+
+    # Identify landing tile and its group
+    landing = BOARD[g.pos]
+    group = landing.payload.get("group") if landing.ttype == "COMPANY" else None
 
     reward = 0
+    j.record("verdict", kind=kind, difficulty=diff, passed=passed, judge_source=judge_source,
+             grade_ms=None if grade_ms is None else round(grade_ms, 3))
+    qkind = skill.kind_of(kind)
+    if qkind and diff in skill.DIFFS:
+        g.skill = g.skill or skill.new_skill()
+        skill.update(g.skill, qkind, diff, passed)
 
     if passed:
         # Railroads: award on acquisition count (no houses)
         if landing.ttype == "COMPANY" and group == "RR":
-            newly_owned = _own_current_railroad_if_needed()
+            newly_owned = _own_current_railroad_if_needed(g)
             if newly_owned:
-                rr_count = _owned_railroad_count()
+                rr_count = _owned_railroad_count(g)
                 reward = RR_SCHEDULE.get(rr_count, 0)
             else:
                 reward = 0  # already owned this RR, no new points
 
         # Color properties: ownership + house progression schedule
         elif landing.ttype == "COMPANY" and group not in ("RR", "UTIL"):
-            prop_name = landing.name
-            before_owned = prop_name in _owned_names_set()
+            before_owned = g.owns(g.pos)
 
             if not before_owned:
                 # Ownership acquired now
-                _grant_ownership_if_applicable()
+                _grant_ownership_if_applicable(g)
                 reward = _reward_for_property_progress(diff, before_owned=False, built_house=False, new_house_count=0)
             else:
                 # If already owned, try to build a house (requires full monopoly)
-                built = _maybe_build_house_on_current()
+                built = _maybe_build_house_on_current(g)
                 build_house = built
-                new_house_count = GAME["houses"].get(prop_name, 0) if built else GAME["houses"].get(prop_name, 0)
+                new_house_count = g.houses[g.pos]
                 reward = _reward_for_property_progress(diff, before_owned=True, built_house=built, new_house_count=new_house_count)
 
         # Utilities or anything else: keep zero (no schedule defined)
-        GAME["offers"] += reward
+        g.offers += reward
+        j.record("reward", tile=landing.name, reward=reward, house_built=build_house, offers=g.offers)
 
         # Outcome message
         title_suffix = ""
@@ -542,36 +804,160 @@ def post_submit_answer(payload: Dict[str, Any]):
             # nothing to build on RR
             pass
         elif build_house:
-            if GAME["houses"].get(_landed_property_name(), 0) >= 5:
+            if g.houses[g.pos] >= 5:
                 title_suffix = " - Hotel built!"
             else:
                 title_suffix = " - House built!"
 
-        GAME["last_outcome"] = {
+        g.last_outcome = {
             "kind": "success",
             "title": f"Correct +{reward} offers{title_suffix}",
             "feedback": feedback,
             "judge_source": judge_source,
         }
     else:
-        GAME["last_outcome"] = {
+        g.last_outcome = {
             "kind": "error",
             "title": "Incorrect - no reward",
             "feedback": feedback,
             "judge_source": judge_source,
         }
 
-    GAME["pending"] = None
-    end_turn()
+    g.pending = None
+    end_turn(g)
+    return reward
 
-    st = llm_status()
-    _debug(f"POST /submit_answer completed, reward={reward}, llm_mode={st['mode']}, last_error={st['last_llm_error']}")
+
+def _grading_job(p: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Id of the grading job that holds pending challenge p, unless it was abandoned."""
+    if p and p.get("job") and time.time() - p.get("job_at", 0) < GRADE_TIMEOUT_S:
+        return p["job"]
+    return None
+
+
+def _answer_result(g: GameState) -> Dict[str, Any]:
     return {
-        "ok": True,
-        "offers": GAME["offers"],
-        "turns": GAME["turns"],
-        "owned": GAME["owned"],
-        "houses": GAME["houses"],
-        "last_outcome": GAME["last_outcome"],
-        "llm": st,
+        "offers": g.offers,
+        "turns": g.turns,
+        "owned": g.owned_list(),
+        "houses": g.houses_map(),
+        "last_outcome": g.last_outcome,
+        "llm": llm_status(),
     }
+
+
+def _release_claim(gid: str, job_id: str, err: Exception):
+    """After a failed grading job: free the challenge for a new answer and remember the job failed."""
+
+    def release(g, j):
+        if not g.pending or g.pending.get("job") != job_id:
+            return False
+        g.pending = {**{k: v for k, v in g.pending.items() if k not in ("job", "job_at")}, "failed_job": job_id}
+        j.record("grade_failed", job=job_id, error=f"{type(err).__name__}: {err}"[:200])
+        return True
+
+    try:
+        released, _ = _update(gid, release)
+    except Exception as e:
+        _debug(f"could not release grading job {job_id}: {type(e).__name__}: {e}")
+        return
+    if released:
+        _debug(f"grading job {job_id} failed, challenge released for another answer")
+
+
+def _grade_and_commit(gid: str, job_id: str, p: Dict[str, Any], text: str, pos: int,
+                      local: bool = False) -> Dict[str, Any]:
+    """Body of a grading job: judge (may call the model), then commit the verdict if p is still ours."""
+    kind = p["type"]
+    t0 = time.perf_counter()
+    try:
+        if local:
+            with local_only():
+                passed, diff, feedback, judge_source = _grade(p, text, pos)
+        else:
+            passed, diff, feedback, judge_source = _grade_admitted(gid, p, text, pos)
+        grade_ms = (time.perf_counter() - t0) * 1000.0
+
+        def apply(g, j):
+            if not g.pending or g.pending.get("job") != job_id:
+                return None  # replaced or resubmitted after GRADE_TIMEOUT_S
+            reward = _apply_verdict(g, j, kind, diff, passed, feedback, judge_source, grade_ms)
+            g.last_outcome["job"] = job_id
+            return reward
+
+        reward, g = _update(gid, apply)
+    except Exception as e:
+        _release_claim(gid, job_id, e)
+        raise
+    if reward is None:
+        raise RuntimeError("challenge changed while grading")
+    _debug(f"grading job {job_id} completed, kind={kind} reward={reward}")
+    return _answer_result(g)
+
+
+@app.post("/submit_answer")
+def post_submit_answer(request: Request, response: Response, payload: Dict[str, Any]):
+    gid = _game_id(request, response)
+    g = _load(gid)
+    p = g.pending
+    if not p:
+        _debug("POST /submit_answer but no pending")
+        return JSONResponse({"ok": False, "error": "No pending challenge"}, status_code=400)
+
+    text = payload.get("text", "") or ""
+    kind = p["type"]  # e.g., LC_EASY, LC_MEDIUM, LC_HARD, SYS_DESIGN, BEHAVIORAL
+    tag(kind=kind)
+    job_id = new_job_id()
+
+    def claim(g, j):
+        if g.pending != p:
+            return None  # answered concurrently (double submit)
+        if _grading_job(p):
+            return p["job"]
+        g.pending = {**p, "job": job_id, "job_at": round(time.time(), 3)}
+        j.record("submitted", job=job_id, answer=text)  # the answer log replay.py re-runs
+        return job_id
+
+    claimed, g = _update(gid, claim)
+    if claimed is None:
+        return JSONResponse({"ok": False, "error": "Challenge already answered"}, status_code=409)
+    if claimed != job_id:
+        return JSONResponse({"ok": False, "error": "Answer is already being graded", "job_id": claimed},
+                            status_code=409)
+
+    job = JOBS.submit(job_id, gid, lambda: _grade_and_commit(gid, job_id, g.pending, text, g.pos))
+    if job is None:
+        _debug(f"POST /submit_answer kind={kind}: grading queue full, grading locally inline")
+        result = _grade_and_commit(gid, job_id, g.pending, text, g.pos, local=True)
+        return {"ok": True, "job_id": job_id, "status": "done", **result}
+    _debug(f"POST /submit_answer kind={kind} queued job {job_id}")
+    return JSONResponse({"ok": True, "job_id": job_id, "status": job.status, "poll": f"/grade/{job_id}"},
+                        status_code=202)
+
+
+@app.get("/grade/{job_id}")
+async def get_grade(job_id: str, request: Request, wait: float = 0.0):
+    """A grading job's status; with ?wait=N, hold up to N seconds for it to finish."""
+    gid = request.cookies.get(GID_COOKIE)
+    job = JOBS.get(job_id)
+    if job is not None and job.gid == gid:
+        await JOBS.wait(job, min(wait, GRADE_MAX_WAIT_S))
+        return job.view()
+    # Queued on another worker, or expired here: the game records which job owns its challenge
+    loaded = await run_in_threadpool(BACKEND.load, gid) if gid else None
+    if loaded is not None:
+        g = loaded[1]
+        if g.pending and g.pending.get("job") == job_id:
+            return {"ok": True, "job_id": job_id, "status": "running"}
+        if g.pending and g.pending.get("failed_job") == job_id:
+            return {"ok": False, "job_id": job_id, "status": "failed", "error": "Grading failed; answer again"}
+        if (g.last_outcome or {}).get("job") == job_id:
+            return {"ok": True, "job_id": job_id, "status": "done", **_answer_result(g)}
+    return JSONResponse({"ok": False, "error": "Unknown grading job"}, status_code=404)
+
+
+# Local multiplayer rooms build on the helpers above, so they are registered last
+from rooms import router as rooms_router  # noqa: E402
+
+app.include_router(rooms_router)
+app.include_router(accounts.router)
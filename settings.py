@@ -0,0 +1,173 @@
+# settings.py
+# Process configuration, read once. The first get_settings() call applies .env (never
+# overriding the real environment) and parses every variable the app reads into one frozen
+# object; modules copy what they need into their own constants at import time.
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+
+def _parse_bool(s: str) -> bool:
+    return str(s).strip().lower() in ("1", "true", "yes", "y", "on")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    v = os.getenv(name)
+    return default if v is None else _parse_bool(v)
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+def _load_dotenv() -> bool:
+    # Load .env automatically for every teammate without IDE config
+    try:
+        from dotenv import load_dotenv
+
+        load_dotenv(override=False)
+        return True
+    except Exception:
+        return False
+
+
+@dataclass(frozen=True)
+class Settings:
+    dotenv_loaded: bool
+
+    # Model access
+    openai_api_key: Optional[str]
+    openai_model: str
+    use_llm: bool
+    use_llm_stub: bool
+    model_routes: str
+    model_slo_ms: str
+    model_cost_ceiling: str
+    model_prices: str
+
+    # Local judge
+    judge_first_pass: bool
+    judge_pass_at: float
+    judge_fail_at: float
+    answer_cache: bool
+    answer_cache_threshold: float
+    answer_cache_audit: float
+    answer_cache_per_question: int
+    answer_cache_questions: int
+
+    # Game state
+    game_db: str
+    state_backend: str
+    snapshot_every: int
+    state_cache_size: int
+
+    # Accounts and leaderboards
+    accounts_db: str
+    accounts_batch: int
+    accounts_flush_ms: int
+
+    # Analytics export
+    analytics_dir: str
+    analytics_batch: int
+    analytics_flush_s: float
+    analytics_buffer: int
+    analytics_keep_days: int
+
+    # Question selection
+    dedup_threshold: float
+    dedup_seen_cap: int
+    skill_k: float
+    adaptive_difficulty: bool
+    content_pack: str
+    question_pool: str
+    question_pool_slots: int
+    question_pool_slot_bytes: int
+    question_pool_refill_ms: int
+    question_pool_workers: int
+
+    # Admission control for model-bound work
+    model_concurrency: int
+    model_queue: int
+    model_per_client: int
+
+    # Grading jobs
+    grade_workers: int
+    grade_queue: int
+    grade_timeout_s: int
+    grade_job_ttl_s: int
+
+    # Tracing
+    trace: bool
+    admin_token: str
+    trace_window_s: int
+    trace_windows: int
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    dotenv_loaded = _load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY") or None
+    game_db = os.getenv("GAME_DB", "interviewopoly.db")  # empty string disables the SQLite backend
+    return Settings(
+        dotenv_loaded=dotenv_loaded,
+        openai_api_key=api_key,
+        openai_model=os.getenv("OPENAI_MODEL", "gpt-4o-mini").strip(),
+        use_llm=_env_bool("USE_LLM", bool(api_key)),
+        use_llm_stub=_env_bool("USE_LLM_STUB", False),
+        # Per-route model choice, see model_router.py
+        model_routes=os.getenv("MODEL_ROUTES", ""),
+        model_slo_ms=os.getenv("MODEL_SLO_MS", ""),  # e.g. "generate=9000,score=6000"
+        model_cost_ceiling=os.getenv("MODEL_COST_CEILING", ""),  # USD per call, e.g. "score=0.002"
+        model_prices=os.getenv("MODEL_PRICES", ""),  # "model=in/out" USD per 1M tokens
+        # Let the local judge settle clear-cut answers and only send ambiguous ones to the model
+        judge_first_pass=_env_bool("JUDGE_FIRST_PASS", True),
+        # judge.calibrate() on bench/judge_corpus.jsonl at 95% precision per side (bench.judge_eval --calibrate)
+        judge_pass_at=_env_float("JUDGE_PASS_AT", 0.76),
+        judge_fail_at=_env_float("JUDGE_FAIL_AT", 0.34),
+        # Reuse model verdicts for paraphrases of answers already graded, see answer_cache.py
+        answer_cache=_env_bool("ANSWER_CACHE", True),
+        answer_cache_threshold=_env_float("ANSWER_CACHE_THRESHOLD", 0.9),  # cosine of hashed TF-IDF vectors
+        answer_cache_audit=_env_float("ANSWER_CACHE_AUDIT", 0.05),  # share of hits re-graded by the model
+        answer_cache_per_question=_env_int("ANSWER_CACHE_PER_QUESTION", 64),
+        answer_cache_questions=_env_int("ANSWER_CACHE_QUESTIONS", 4096),
+        game_db=game_db,
+        state_backend=os.getenv("STATE_BACKEND", "sqlite" if game_db else "memory").lower(),
+        snapshot_every=_env_int("SNAPSHOT_EVERY", 32),  # events between snapshots
+        state_cache_size=_env_int("STATE_CACHE_SIZE", 4096),  # per-worker decoded-state cache
+        accounts_db=os.getenv("ACCOUNTS_DB", "accounts.db"),  # empty string keeps accounts in memory
+        accounts_batch=_env_int("ACCOUNTS_BATCH", 256),  # most writes per commit
+        accounts_flush_ms=_env_int("ACCOUNTS_FLUSH_MS", 50),  # how long a write waits for company
+        analytics_dir=os.getenv("ANALYTICS_DIR", "analytics"),  # empty string disables the export
+        analytics_batch=_env_int("ANALYTICS_BATCH", 5000),  # rows that trigger an early flush
+        analytics_flush_s=_env_float("ANALYTICS_FLUSH_S", 10.0),
+        analytics_buffer=_env_int("ANALYTICS_BUFFER", 100_000),  # beyond this the oldest rows are dropped
+        analytics_keep_days=_env_int("ANALYTICS_KEEP_DAYS", 30),  # 0 keeps every partition
+        dedup_threshold=_env_float("DEDUP_THRESHOLD", 0.5),
+        dedup_seen_cap=_env_int("DEDUP_SEEN_CAP", 64),
+        skill_k=_env_float("SKILL_K", 32.0),
+        adaptive_difficulty=_env_bool("ADAPTIVE_DIFFICULTY", True),
+        content_pack=os.getenv("CONTENT_PACK", "packs/default.pack"),  # offline questions; empty disables
+        question_pool=os.getenv("QUESTION_POOL", "questions.pool"),  # shared by all workers; empty disables
+        question_pool_slots=_env_int("QUESTION_POOL_SLOTS", 16),  # ready questions per kind x difficulty
+        question_pool_slot_bytes=_env_int("QUESTION_POOL_SLOT_BYTES", 4096),  # compressed question, at most
+        question_pool_refill_ms=_env_int("QUESTION_POOL_REFILL_MS", 250),  # refiller idle poll
+        question_pool_workers=_env_int("QUESTION_POOL_WORKERS", 4),  # refiller generation threads
+        model_concurrency=_env_int("MODEL_CONCURRENCY", 16),
+        model_queue=_env_int("MODEL_QUEUE", 32),
+        model_per_client=_env_int("MODEL_PER_CLIENT", 2),  # a landing runs /prefetch and /resolve together
+        grade_workers=_env_int("GRADE_WORKERS", 4),
+        grade_queue=_env_int("GRADE_QUEUE", 64),  # beyond workers + queue, /submit_answer grades inline
+        grade_timeout_s=_env_int("GRADE_TIMEOUT_S", 120),
+        grade_job_ttl_s=_env_int("GRADE_JOB_TTL_S", 300),
+        trace=_env_bool("TRACE", False),
+        # /admin/* (router stats, traces, the profiler) needs this as X-Admin-Token; unset, only
+        # loopback clients are allowed, so set it when a proxy on this host forwards outside traffic
+        admin_token=os.getenv("ADMIN_TOKEN", ""),
+        trace_window_s=_env_int("TRACE_WINDOW_S", 60),  # width of one histogram window
+        trace_windows=_env_int("TRACE_WINDOWS", 10),  # rolling horizon = WINDOW_S * WINDOWS
+    )
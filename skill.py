@@ -0,0 +1,86 @@
+# skill.py
+"""
+Per-player skill model.
+
+Each player has an Elo rating per question kind (LC/SD/BH) against fixed question ratings
+per difficulty, plus pass/attempt counts per kind x difficulty bucket. Both update in O(1)
+per graded answer. The predicted pass rate for a bucket blends the Elo expectation with
+that bucket's own record; adapt() uses it to move the board difficulty one step toward
+where the player is actually being tested.
+
+DICE is the 2d6 total distribution; the server folds it over a player's next landings to
+tell the shared question pool (qpool.py) which buckets the next roll is likely to need.
+"""
+from typing import Dict, Any, Optional
+
+from settings import get_settings
+
+KINDS = ("LC", "SD", "BH")
+DIFFS = ("EASY", "MEDIUM", "HARD")
+QUESTION_RATING = {"EASY": 1000.0, "MEDIUM": 1200.0, "HARD": 1400.0}
+START_RATING = 1200.0
+K_FACTOR = get_settings().skill_k
+
+ADAPTIVE_DIFFICULTY = get_settings().adaptive_difficulty
+MIN_ANSWERS = 3  # answers of a kind before its difficulty starts to move
+STEP_UP_AT = 0.80
+STEP_DOWN_AT = 0.35
+PRIOR_WEIGHT = 4.0  # pseudo-answers the Elo expectation is worth against a bucket's own record
+
+# 2d6 totals and their probabilities
+DICE = [(t, (6 - abs(t - 7)) / 36.0) for t in range(2, 13)]
+
+
+def _debug(msg: str):
+    print(f"[skill] {msg}")
+
+
+def new_skill() -> Dict[str, Any]:
+    # JSON-friendly so it rides along in the game state: kind -> [rating, answers], "KIND:DIFF" -> [passes, attempts]
+    sk: Dict[str, Any] = {k: [START_RATING, 0] for k in KINDS}
+    sk.update({f"{k}:{d}": [0, 0] for k in KINDS for d in DIFFS})
+    return sk
+
+
+def kind_of(pending_type: str) -> Optional[str]:
+    """LC_EASY/LC_MEDIUM/LC_HARD -> LC, SYS_DESIGN -> SD, BEHAVIORAL -> BH."""
+    if pending_type.startswith("LC_"):
+        return "LC"
+    return {"SYS_DESIGN": "SD", "BEHAVIORAL": "BH"}.get(pending_type)
+
+
+def _expected(rating: float, diff: str) -> float:
+    return 1.0 / (1.0 + 10 ** ((QUESTION_RATING[diff] - rating) / 400.0))
+
+
+def p_pass(sk: Dict[str, Any], kind: str, diff: str) -> float:
+    """Predicted probability the player passes a kind/diff question."""
+    prior = _expected(sk[kind][0], diff)
+    passes, attempts = sk[f"{kind}:{diff}"]
+    return (passes + PRIOR_WEIGHT * prior) / (attempts + PRIOR_WEIGHT)
+
+
+def update(sk: Dict[str, Any], kind: str, diff: str, passed: bool):
+    rating, answers = sk[kind]
+    sk[kind] = [round(rating + K_FACTOR * ((1.0 if passed else 0.0) - _expected(rating, diff)), 1), answers + 1]
+    bucket = sk[f"{kind}:{diff}"]
+    sk[f"{kind}:{diff}"] = [bucket[0] + (1 if passed else 0), bucket[1] + 1]
+
+
+def adapt(sk: Optional[Dict[str, Any]], kind: str, diff: str) -> str:
+    """Board difficulty moved at most one step by the player's predicted pass rate."""
+    if not ADAPTIVE_DIFFICULTY or not sk or sk[kind][1] < MIN_ANSWERS:
+        return diff
+    i = DIFFS.index(diff)
+    p = p_pass(sk, kind, diff)
+    if p >= STEP_UP_AT and i < len(DIFFS) - 1:
+        return DIFFS[i + 1]
+    if p <= STEP_DOWN_AT and i > 0:
+        return DIFFS[i - 1]
+    return diff
+
+
+def summary(sk: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    sk = sk or new_skill()
+    return {k: {"rating": sk[k][0], "answers": sk[k][1],
+                "p_pass": {d: round(p_pass(sk, k, d), 2) for d in DIFFS}} for k in KINDS}
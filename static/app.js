@@ -18,6 +18,14 @@ let OUTCOME_DISMISSED_SIG = null;
 /* fast lookup for ownership and houses */
 let OWNED_SET = new Set();
 let HOUSES_MAP = Object.create(null);
+let MARKS_SIG = null;
+
+/* keyed render state: tile elements, each tile's "owned:houses" key, what is on screen */
+let TILE_INNER = [];
+let TILE_KEYS = [];
+let BOARD_SIG = null;
+let PAWN_IDX = null;
+let OUTCOME_SHOWN_SIG = null;
 
 /* ---------- Board helpers ---------- */
 function idx_to_rc(i){
@@ -190,6 +198,7 @@ function addOwnedAndDevIndicators(inner, tile){
 function buildBoard(){
   const board = el("#board");
   clearBoardKeep(board);
+  TILE_INNER = []; TILE_KEYS = [];
 
   BOARD.forEach((t,i) => {
     const [r,c] = idx_to_rc(i);
@@ -222,17 +231,50 @@ function buildBoard(){
 
     // NEW: ownership and dev markers
     addOwnedAndDevIndicators(inner, t);
+    TILE_INNER[i] = inner; TILE_KEYS[i] = tileKey(t);
 
     cell.appendChild(inner); board.appendChild(cell);
   });
 }
 
+/* ---------- Incremental board updates ---------- */
+function tileKey(t){ return (OWNED_SET.has(t.name) ? "1" : "0") + ":" + (HOUSES_MAP[t.name] || 0); }
+// The board layout never changes mid-game; rebuild only when a different board arrives
+function boardSig(board){ return board.length + ":" + board.map(t => t.name).join("|"); }
+function syncMarks(){
+  const owned = STATE.owned || [], houses = STATE.houses || {};
+  const sig = owned.map(o => o.name).join("|") + "#" + Object.entries(houses).map(([k,v]) => k+"="+v).join("|");
+  if (sig === MARKS_SIG) return false;
+  MARKS_SIG = sig;
+  OWNED_SET = new Set(owned.map(o => o.name));
+  HOUSES_MAP = Object.assign(Object.create(null), houses);
+  return true;
+}
+// Re-render the markers of tiles whose key changed; returns how many were touched
+function patchTiles(){
+  let n = 0;
+  BOARD.forEach((t,i) => {
+    const key = tileKey(t);
+    if (TILE_KEYS[i] === key) return;
+    const inner = TILE_INNER[i];
+    inner.querySelectorAll(".own-chip, .dev-marks").forEach(m => m.remove());
+    addOwnedAndDevIndicators(inner, t);
+    TILE_KEYS[i] = key; n++;
+  });
+  return n;
+}
+function setText(node, value){
+  const s = String(value);
+  if (node && node.textContent !== s) node.textContent = s;
+}
+
 /* ---------- Pawn placement ---------- */
 function centerOf(elm){ const r = elm.getBoundingClientRect(); return [r.left + r.width/2 + window.scrollX, r.top + r.height/2 + window.scrollY]; }
 function placePawnAtIndex(idx, instant=false){
   ensurePawnOverlay();
   const pawn = el("#pawn"), cell = el("#cell-"+idx), overlay = el("#pawn-overlay");
   if (!pawn || !cell || !overlay) return;
+  PAWN_IDX = idx;
   const [cx,cy] = centerOf(cell); const or = overlay.getBoundingClientRect(); const ox = or.left + window.scrollX; const oy = or.top + window.scrollY;
   if (instant) pawn.style.transition = "none";
   pawn.style.transform = `translate(${cx-ox}px, ${cy-oy}px)`;
@@ -285,6 +327,7 @@ function renderOutcome(outc){
   const backdrop = ensureOutcomeBackdrop();
 
   if (!outc){
+    OUTCOME_SHOWN_SIG = null;
     box.classList.add("hidden");
     backdrop.classList.add("hidden");
     setRollEnabled(true);
@@ -298,6 +341,9 @@ function renderOutcome(outc){
     setRollEnabled(true);
     return;
   }
+  // Already showing this outcome: leave the DOM alone
+  if (sig === OUTCOME_SHOWN_SIG && !box.classList.contains("hidden")) return;
+  OUTCOME_SHOWN_SIG = sig;
 
   box.className = "outcome";
   if (outc.kind) box.classList.add(outc.kind);
@@ -326,9 +372,9 @@ function renderOutcome(outc){
 
 /* ---------- HUD ---------- */
 function updateHud(){
-  el("#m-offers").textContent = STATE.offers;
-  el("#m-turns").textContent = STATE.turns;
-  el("#m-owned").textContent = STATE.owned.length;
+  setText(el("#m-offers"), STATE.offers);
+  setText(el("#m-turns"), STATE.turns);
+  setText(el("#m-owned"), STATE.owned.length);
 }
 
 /* ---------- Dice ---------- */
@@ -375,13 +421,18 @@ async function refresh(){
   const res = await fetch("/state"); const data = await res.json();
   STATE = data; BOARD = data.board;
 
-  // fast lookup caches
-  OWNED_SET = new Set((STATE.owned||[]).map(o=>o.name));
-  HOUSES_MAP = Object.assign({}, STATE.houses||{});
+  // fast lookup caches, rebuilt only when ownership or houses changed
+  const marksChanged = syncMarks();
 
-  ensurePawnOverlay(); ensureHudOverlay(); buildBoard(); updateHud();
-  if (!INIT_DONE){ const side=sideForIndex(STATE.pos); snapStageRotationForSide(side); INIT_DONE=true; }
-  placePawnAtIndex(STATE.pos, true);
+  // Full build on first load or a new board; otherwise patch only what changed
+  const sig = boardSig(BOARD);
+  const rebuilt = sig !== BOARD_SIG || !TILE_INNER.length;
+  if (rebuilt){ buildBoard(); BOARD_SIG = sig; }
+  else if (marksChanged) patchTiles();
+  updateHud();
+  let placePawn = rebuilt || STATE.pos !== PAWN_IDX;
+  if (!INIT_DONE){ const side=sideForIndex(STATE.pos); snapStageRotationForSide(side); INIT_DONE=true; placePawn=true; }
+  if (placePawn) placePawnAtIndex(STATE.pos, true);
 
   renderOutcome(STATE.last_outcome);
 }
@@ -531,13 +582,28 @@ function openPending(p){
     });
     const data = await res.json();
 
+    // Grading runs in the background; close the dialog now and wait for the verdict
     dlg.close();
+    const result = data.status === "done" || !data.job_id ? data : await waitForGrade(data.job_id);
     await refresh();
-    renderOutcome(data.last_outcome);
+    renderOutcome(result.last_outcome || (result.error && {kind:"error", title:"Grading failed", feedback:result.error}));
     hideOverlay();
   };
 }
 
+// Long-polls GET /grade/{job_id} until the job is done or failed
+async function waitForGrade(jobId){
+  for (;;){
+    try {
+      const res = await fetch(`/grade/${jobId}?wait=20`);
+      const data = await res.json();
+      if (!res.ok || data.status === "done" || data.status === "failed") return data;
+    } catch {
+      await new Promise(r => setTimeout(r, 1000));
+    }
+  }
+}
+
 /* ---------- Boot ---------- */
 document.addEventListener("DOMContentLoaded", async () => {
   // ensure outcome backdrop exists
@@ -0,0 +1,283 @@
+# store.py
+# Game state backends. Every route loads a game by id, mutates a plain dict and commits it
+# back with the version it loaded (optimistic concurrency), so any number of uvicorn workers
+# can serve the same game.
+#
+# - MemoryBackend: in-process dict, for a single worker or tests.
+# - SqliteBackend: shared SQLite file in WAL mode. Each game is an append-only event log plus
+#   periodic compact snapshots. Every event carries the state fields it changed ("set"), so
+#   recovery is "latest snapshot + apply the events after it" and never re-runs game logic.
+#   Each request commits its own small transaction, so a turn (roll, prefetch, resolve,
+#   claim, verdict) is about five appends. With WAL and synchronous=NORMAL a commit does not
+#   fsync (checkpoints do), so that costs ~0.1 ms each rather than five disk flushes, and
+#   no acknowledged move is ever held in memory waiting for the rest of its turn.
+#
+# States are gamestate.GameState objects. Snapshots and caches hold their binary encoding;
+# JSON snapshots written before that format are still read.
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from gamestate import GameState
+from settings import get_settings
+
+GAME_DB = get_settings().game_db  # empty string disables the SQLite backend
+STATE_BACKEND = get_settings().state_backend
+SNAPSHOT_EVERY = get_settings().snapshot_every  # events between snapshots
+STATE_CACHE_SIZE = get_settings().state_cache_size  # per-worker decoded-state cache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    gid        TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    seq        INTEGER NOT NULL,
+    snap_seq   INTEGER NOT NULL,
+    snapshot   BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    gid  TEXT NOT NULL,
+    seq  INTEGER NOT NULL,
+    at   REAL NOT NULL,
+    kind TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (gid, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class VersionConflict(Exception):
+    """Another request committed to this game after we loaded it."""
+
+
+def _debug(msg: str):
+    print(f"[store] {msg}")
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+class Journal:
+    """
+    The events of one request against one loaded game. The changed top-level fields are
+    found by diffing against the encoding taken at load time.
+    """
+
+    __slots__ = ("events", "_shadow")
+
+    def __init__(self, state):
+        self.events: List[Dict[str, Any]] = []
+        self._shadow = {k: _dumps(v) for k, v in _fields(state).items()}
+
+    def record(self, event: str, **data):
+        self.events.append({"kind": event, "data": data})
+
+    def changes(self, state) -> Dict[str, Any]:
+        return {k: v for k, v in _fields(state).items() if self._shadow.get(k) != _dumps(v)}
+
+
+def _fields(state) -> Dict[str, Any]:
+    return state.to_dict() if isinstance(state, GameState) else state
+
+
+def _decode(snapshot) -> GameState:
+    if isinstance(snapshot, bytes):
+        return GameState.from_bytes(snapshot)
+    return GameState.from_dict(json.loads(snapshot))
+
+
+class MemoryBackend:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._games: Dict[str, Tuple[int, bytes, float, float]] = {}  # gid -> (version, state, created, updated)
+        self._secret = secrets.token_bytes(32)
+
+    def create(self, gid: str, state: GameState):
+        now = time.time()
+        with self.lock:
+            self._games[gid] = (0, state.to_bytes(), now, now)
+
+    def exists(self, gid: str) -> bool:
+        return gid in self._games
+
+    def version(self, gid: str) -> Optional[int]:
+        row = self._games.get(gid)
+        return None if row is None else row[0]
+
+    def load(self, gid: str) -> Optional[Tuple[int, GameState]]:
+        row = self._games.get(gid)
+        if row is None:
+            return None
+        return row[0], GameState.from_bytes(row[1])
+
+    def commit(self, gid: str, version: int, journal: Journal, state: GameState) -> int:
+        changed = journal.changes(state)
+        if not changed and not journal.events:
+            return version
+        with self.lock:
+            cur = self._games.get(gid)
+            if cur is None or cur[0] != version:
+                raise VersionConflict(gid)
+            self._games[gid] = (version + 1, state.to_bytes(), cur[2], time.time())
+        return version + 1
+
+    def secret(self) -> bytes:
+        """Key for resume tokens; games and key both end with the process."""
+        return self._secret
+
+    def list_games(self, gids: List[str], limit: int = 20) -> List[Dict[str, Any]]:
+        """Those of gids that exist, most recently played first."""
+        with self.lock:
+            rows = [(g, self._games[g]) for g in set(gids) if g in self._games]
+        rows = sorted(rows, key=lambda kv: -kv[1][3])[:limit]
+        return [{"game_id": g, "created_at": c, "updated_at": u, "events": v} for g, (v, _, c, u) in rows]
+
+    def events(self, gid: str, after: int = 0) -> List[Dict[str, Any]]:
+        return []
+
+
+class SqliteBackend:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # gid -> (seq, encoded state); skips snapshot + tail decoding when nobody else wrote
+        self._cache: "OrderedDict[str, Tuple[int, bytes]]" = OrderedDict()
+        self._secret: Optional[bytes] = None
+
+    def _remember(self, gid: str, seq: int, encoded: bytes):
+        self._cache[gid] = (seq, encoded)
+        self._cache.move_to_end(gid)
+        while len(self._cache) > STATE_CACHE_SIZE:
+            self._cache.popitem(last=False)
+
+    def create(self, gid: str, state: GameState):
+        now = time.time()
+        enc = state.to_bytes()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO games (gid, created_at, updated_at, seq, snap_seq, snapshot) "
+                "VALUES (?, ?, ?, 0, 0, ?)", (gid, now, now, enc))
+            self._remember(gid, 0, enc)
+
+    def exists(self, gid: str) -> bool:
+        if gid in self._cache:
+            return True
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM games WHERE gid = ?", (gid,)).fetchone() is not None
+
+    def version(self, gid: str) -> Optional[int]:
+        """Latest event seq, without decoding the state."""
+        with self.lock:
+            row = self.conn.execute("SELECT seq FROM games WHERE gid = ?", (gid,)).fetchone()
+        return None if row is None else row[0]
+
+    def load(self, gid: str) -> Optional[Tuple[int, GameState]]:
+        """Latest snapshot plus the tail of the log after it."""
+        with self.lock:
+            row = self.conn.execute("SELECT seq, snap_seq FROM games WHERE gid = ?", (gid,)).fetchone()
+            if row is None:
+                return None
+            seq, snap_seq = row
+            hit = self._cache.get(gid)
+            if hit is not None and hit[0] == seq:
+                return seq, GameState.from_bytes(hit[1])
+            self.conn.execute("BEGIN")
+            try:
+                seq, snap_seq, snapshot = self.conn.execute(
+                    "SELECT seq, snap_seq, snapshot FROM games WHERE gid = ?", (gid,)).fetchone()
+                tail = self.conn.execute("SELECT data FROM events WHERE gid = ? AND seq > ? ORDER BY seq",
+                                         (gid, snap_seq)).fetchall()
+            finally:
+                self.conn.execute("COMMIT")
+        state = _decode(snapshot)
+        for (data,) in tail:
+            state.apply(json.loads(data).get("set") or {})
+        with self.lock:
+            self._remember(gid, seq, state.to_bytes())
+        return seq, state
+
+    def commit(self, gid: str, version: int, journal: Journal, state: GameState) -> int:
+        """Append the request's events as one transaction; fails if the game moved past `version`."""
+        changed = journal.changes(state)
+        events = journal.events or ([{"kind": "update", "data": {}}] if changed else [])
+        if not events:
+            return version
+        if changed:
+            events[-1]["set"] = changed
+        now = time.time()
+        seq = version + len(events)
+        rows = [(gid, version + i + 1, now, e["kind"], _dumps(e)) for i, e in enumerate(events)]
+        enc = state.to_bytes()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                cur = self.conn.execute("SELECT seq, snap_seq FROM games WHERE gid = ?", (gid,)).fetchone()
+                if cur is None or cur[0] != version:
+                    raise VersionConflict(gid)
+                self.conn.executemany("INSERT INTO events (gid, seq, at, kind, data) VALUES (?, ?, ?, ?, ?)", rows)
+                if seq - cur[1] >= SNAPSHOT_EVERY:
+                    self.conn.execute("UPDATE games SET seq = ?, snap_seq = ?, snapshot = ?, updated_at = ? "
+                                      "WHERE gid = ?", (seq, seq, enc, now, gid))
+                else:
+                    self.conn.execute("UPDATE games SET seq = ?, updated_at = ? WHERE gid = ?", (seq, now, gid))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                self._cache.pop(gid, None)
+                raise
+            self._remember(gid, seq, enc)
+        return seq
+
+    def events(self, gid: str, after: int = 0) -> List[Dict[str, Any]]:
+        with self.lock:
+            rows = self.conn.execute("SELECT seq, at, data FROM events WHERE gid = ? AND seq > ? ORDER BY seq",
+                                     (gid, after)).fetchall()
+        return [{"seq": s, "at": at, **json.loads(d)} for s, at, d in rows]
+
+    def secret(self) -> bytes:
+        """Key for resume tokens, created once per database so every worker and restart agrees."""
+        if self._secret is None:
+            with self.lock:
+                self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('resume_key', ?)",
+                                  (secrets.token_bytes(32),))
+                self._secret = self.conn.execute("SELECT value FROM meta WHERE key = 'resume_key'").fetchone()[0]
+        return self._secret
+
+    def list_games(self, gids: List[str], limit: int = 20) -> List[Dict[str, Any]]:
+        """Those of gids that exist, most recently played first."""
+        gids = list(dict.fromkeys(gids))
+        rows = []
+        with self.lock:
+            for i in range(0, len(gids), 500):
+                chunk = gids[i:i + 500]
+                rows += self.conn.execute(
+                    f"SELECT gid, created_at, updated_at, seq FROM games WHERE gid IN ({','.join('?' * len(chunk))})",
+                    chunk).fetchall()
+        rows = sorted(rows, key=lambda r: -r[2])[:limit]
+        return [{"game_id": g, "created_at": c, "updated_at": u, "events": s} for g, c, u, s in rows]
+
+
+def open_backend():
+    if STATE_BACKEND == "sqlite" and GAME_DB:
+        try:
+            backend = SqliteBackend(GAME_DB)
+            _debug(f"sqlite backend at {GAME_DB}")
+            return backend
+        except Exception as e:
+            _debug(f"cannot open {GAME_DB}, falling back to memory: {type(e).__name__}: {e}")
+    elif STATE_BACKEND not in ("memory", "sqlite"):
+        _debug(f"unknown STATE_BACKEND={STATE_BACKEND}, using memory")
+    return MemoryBackend()
@@ -0,0 +1,332 @@
+# tracing.py
+# Opt-in request tracing, rolling latency histograms and an on-demand sampling profiler.
+# Enable with TRACE=1. When disabled, span() is a shared no-op and nothing is registered on the app.
+import hmac
+import ipaddress
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Any, List, Optional, Callable
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRoute
+
+
+from settings import get_settings
+
+TRACING = get_settings().trace
+ADMIN_TOKEN = get_settings().admin_token
+WINDOW_S = get_settings().trace_window_s  # width of one histogram window
+WINDOWS = get_settings().trace_windows  # rolling horizon = WINDOW_S * WINDOWS
+RECENT_TRACES = 200
+
+# Upper bounds in ms; the last bucket is open-ended
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+
+def _debug(msg: str):
+    print(f"[trace] {msg}")
+
+
+# ---------- Rolling histograms ----------
+
+class RollingHistogram:
+    """Fixed-bucket latency histogram over the last WINDOWS * WINDOW_S seconds."""
+
+    __slots__ = ("windows",)
+
+    def __init__(self):
+        # each window: [window_id, counts, total_ms, max_ms]
+        self.windows: deque = deque(maxlen=WINDOWS)
+
+    def add(self, ms: float, now: float):
+        wid = int(now // WINDOW_S)
+        if not self.windows or self.windows[-1][0] != wid:
+            self.windows.append([wid, [0] * (len(BUCKETS_MS) + 1), 0.0, 0.0])
+        w = self.windows[-1]
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        w[1][i] += 1
+        w[2] += ms
+        if ms > w[3]:
+            w[3] = ms
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        oldest = int(now // WINDOW_S) - WINDOWS + 1
+        counts = [0] * (len(BUCKETS_MS) + 1)
+        total = 0.0
+        mx = 0.0
+        for wid, c, t, m in list(self.windows):
+            if wid < oldest:
+                continue
+            for i, v in enumerate(c):
+                counts[i] += v
+            total += t
+            mx = max(mx, m)
+        n = sum(counts)
+        return {
+            "count": n,
+            "mean_ms": round(total / n, 3) if n else 0.0,
+            "max_ms": round(mx, 3),
+            "p50_ms": _bucket_quantile(counts, n, 0.50, mx),
+            "p95_ms": _bucket_quantile(counts, n, 0.95, mx),
+            "p99_ms": _bucket_quantile(counts, n, 0.99, mx),
+            "buckets": [{"le": b, "count": c} for b, c in zip(BUCKETS_MS + ["+Inf"], counts)],
+        }
+
+
+def _bucket_quantile(counts: List[int], n: int, q: float, mx: float) -> float:
+    """Upper bound of the bucket holding quantile q (capped by the observed max)."""
+    if not n:
+        return 0.0
+    rank = q * n
+    seen = 0
+    for i, c in enumerate(counts):
+        seen += c
+        if seen >= rank:
+            return float(min(BUCKETS_MS[i], mx)) if i < len(BUCKETS_MS) else round(mx, 3)
+    return round(mx, 3)
+
+
+_LOCK = threading.Lock()
+_ROUTE_HIST: Dict[str, RollingHistogram] = {}
+_SPAN_HIST: Dict[str, RollingHistogram] = {}
+_RECENT: deque = deque(maxlen=RECENT_TRACES)
+
+
+def _observe(table: Dict[str, RollingHistogram], key: str, ms: float):
+    now = time.time()
+    with _LOCK:
+        h = table.get(key)
+        if h is None:
+            h = table[key] = RollingHistogram()
+        h.add(ms, now)
+
+
+# ---------- Per-request traces ----------
+
+class RequestTrace:
+    __slots__ = ("t0", "handler_start", "handler_end", "spans", "tags")
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.handler_start: Optional[float] = None
+        self.handler_end: Optional[float] = None
+        self.spans: List[Dict[str, Any]] = []
+        self.tags: Dict[str, Any] = {}
+
+
+_CURRENT: ContextVar[Optional[RequestTrace]] = ContextVar("interviewopoly_trace", default=None)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+@contextmanager
+def _span(name: str):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        ms = (end - t) * 1000.0
+        _observe(_SPAN_HIST, name, ms)
+        tr = _CURRENT.get()
+        if tr is not None:
+            tr.spans.append({"name": name, "start_ms": round((t - tr.t0) * 1000.0, 3), "ms": round(ms, 3)})
+
+
+def span(name: str):
+    """Time a block, e.g. `with span("llm.score.LC"):`. Free when TRACE is off."""
+    if not TRACING:
+        return _NOOP
+    return _span(name)
+
+
+def tag(**kw):
+    """Attach labels (e.g. kind=LC_EASY) to the current request; kind also splits its route histogram."""
+    if not TRACING:
+        return
+    tr = _CURRENT.get()
+    if tr is not None:
+        tr.tags.update(kw)
+
+
+# ---------- App wiring ----------
+
+class TracedRoute(APIRoute):
+    """Marks when the endpoint actually starts running, so threadpool queueing becomes visible."""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        import inspect
+
+        if inspect.iscoroutinefunction(endpoint):
+            @wraps(endpoint)
+            async def wrapped(*a, **kw):
+                tr = _CURRENT.get()
+                if tr is not None:
+                    tr.handler_start = time.perf_counter()
+                try:
+                    return await endpoint(*a, **kw)
+                finally:
+                    if tr is not None:
+                        tr.handler_end = time.perf_counter()
+        else:
+            @wraps(endpoint)
+            def wrapped(*a, **kw):
+                tr = _CURRENT.get()
+                if tr is not None:
+                    tr.handler_start = time.perf_counter()
+                try:
+                    return endpoint(*a, **kw)
+                finally:
+                    if tr is not None:
+                        tr.handler_end = time.perf_counter()
+        super().__init__(path, wrapped, **kwargs)
+
+
+async def trace_middleware(request: Request, call_next):
+    tr = RequestTrace()
+    token = _CURRENT.set(tr)
+    try:
+        response = await call_next(request)
+    finally:
+        _CURRENT.reset(token)
+    done = time.perf_counter()
+
+    route = request.scope.get("route")
+    path = getattr(route, "path", None) or ("/static" if request.url.path.startswith("/static") else "<unmatched>")
+    if path.startswith("/admin"):
+        return response
+
+    total_ms = (done - tr.t0) * 1000.0
+    _observe(_ROUTE_HIST, path, total_ms)
+    if tr.tags.get("kind"):
+        _observe(_ROUTE_HIST, f"{path}[{tr.tags['kind']}]", total_ms)
+    if tr.handler_start is not None:
+        queue_ms = (tr.handler_start - tr.t0) * 1000.0
+        _observe(_SPAN_HIST, "queue_wait", queue_ms)
+        tr.spans.insert(0, {"name": "queue_wait", "start_ms": 0.0, "ms": round(queue_ms, 3)})
+    if tr.handler_end is not None:
+        encode_ms = (done - tr.handler_end) * 1000.0
+        _observe(_SPAN_HIST, "encode", encode_ms)
+        tr.spans.append({"name": "encode", "start_ms": round((tr.handler_end - tr.t0) * 1000.0, 3),
+                         "ms": round(encode_ms, 3)})
+    with _LOCK:
+        _RECENT.append({
+            "route": path,
+            "method": request.method,
+            "status": response.status_code,
+            "at": time.time(),
+            "ms": round(total_ms, 3),
+            "tags": tr.tags,
+            "spans": tr.spans,
+        })
+    return response
+
+
+def install(app):
+    """Call right after FastAPI() and before any route is declared."""
+    if not TRACING:
+        return
+    app.router.route_class = TracedRoute
+    app.middleware("http")(trace_middleware)
+    app.include_router(router)
+    _debug(f"tracing enabled, window={WINDOW_S}s x {WINDOWS}")
+
+
+# ---------- Sampling profiler ----------
+
+_PROFILE_LOCK = threading.Lock()
+
+
+def sample_stacks(seconds: float, hz: float) -> Dict[str, int]:
+    """Sample every thread's Python stack; returns folded stacks ("a;b;c" -> count)."""
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    folded: Dict[str, int] = {}
+    interval = 1.0 / hz
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            parts = []
+            f = frame
+            while f is not None:
+                co = f.f_code
+                parts.append(f"{os.path.basename(co.co_filename)}:{co.co_name}")
+                f = f.f_back
+            parts.append(names.get(ident, f"thread-{ident}"))
+            key = ";".join(reversed(parts))
+            folded[key] = folded.get(key, 0) + 1
+        time.sleep(interval)
+    return folded
+
+
+# ---------- Admin endpoints ----------
+
+def _loopback(request: Request) -> bool:
+    try:
+        return request.client is not None and ipaddress.ip_address(request.client.host).is_loopback
+    except ValueError:
+        return False
+
+
+def require_admin(request: Request, x_admin_token: Optional[str] = Header(None)):
+    """
+    Dependency for /admin/* routes. With ADMIN_TOKEN set the X-Admin-Token header must match
+    it; without one only clients on this host get in, so a fresh deployment is closed.
+    """
+    if ADMIN_TOKEN:
+        if not hmac.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+            raise HTTPException(status_code=403, detail="bad admin token")
+    elif not _loopback(request):
+        raise HTTPException(status_code=403, detail="set ADMIN_TOKEN to use /admin from other hosts")
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+@router.get("/trace")
+def get_trace(recent: int = 20):
+    now = time.time()
+    with _LOCK:
+        routes = {k: h.snapshot(now) for k, h in sorted(_ROUTE_HIST.items())}
+        spans = {k: h.snapshot(now) for k, h in sorted(_SPAN_HIST.items())}
+        last = list(_RECENT)[-max(0, min(recent, RECENT_TRACES)):] if recent else []
+    return {"window_s": WINDOW_S * WINDOWS, "routes": routes, "spans": spans, "recent": last}
+
+
+@router.post("/profile")
+def post_profile(seconds: float = Body(5.0, embed=True), hz: float = Body(97.0, embed=True),
+                 fmt: str = Body("json", embed=True)):
+    """Block for `seconds` while sampling all threads. fmt="folded" returns flamegraph.pl/speedscope text."""
+    seconds = max(0.1, min(60.0, seconds))
+    hz = max(1.0, min(1000.0, hz))
+    if not _PROFILE_LOCK.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="a profile is already running")
+    try:
+        _debug(f"profiling {seconds}s at {hz}Hz")
+        folded = sample_stacks(seconds, hz)
+    finally:
+        _PROFILE_LOCK.release()
+    if fmt == "folded":
+        lines = [f"{k} {v}" for k, v in sorted(folded.items(), key=lambda kv: -kv[1])]
+        return PlainTextResponse("\n".join(lines) + "\n")
+    return {"seconds": seconds, "hz": hz, "samples": sum(folded.values()), "folded": folded}